@@ -0,0 +1,47 @@
+"""
+Per-invocation latency of get_requests with the shared AWS client registry
+and with a client built in every invocation, as before the registry.
+
+    python bench/client_registry.py [--runs 200] [--items 20]
+
+Against moto the difference is the cost of building the session, client
+and table resource. Against a local DynamoDB (AWS_ENDPOINT_URL) it also
+includes the connection setup that the registry's pool keeps warm.
+"""
+import argparse
+
+import harness
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=200)
+    parser.add_argument('--items', type=int, default=20, help='requests of the caller')
+    args = parser.parse_args()
+
+    signer = harness.configure()
+    with harness.stand_in() as (request_table, state_table):
+        import api
+        api.aws_registry.clear()
+        with request_table.batch_writer() as batch:
+            for n in range(args.items):
+                batch.put_item(Item=harness.request_item(n))
+        call = harness.event(signer, harness.REQUESTER)
+        context = harness.LambdaContext()
+        # Verifies the tokens and loads the signing keys once
+        assert api.get_requests(call, context)['statusCode'] == 200
+
+        def per_invocation():
+            api.aws_registry.clear()
+            api.get_requests(call, context)
+
+        results = [
+            ('client per invocation', harness.summary(harness.timed(per_invocation, args.runs))),
+            ('shared registry', harness.summary(harness.timed(lambda: api.get_requests(call, context), args.runs)))
+        ]
+    print('get_requests, %d runs, %d items per response (ms)' % (args.runs, args.items))
+    harness.print_table(['mode', 'median', 'p90', 'mean'], [[name, stats['median'], stats['p90'], stats['mean']] for name, stats in results])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+"""
+Cold start of every Lambda entry point of ui-api/api.py: the time to import
+the module and the latency of the first and second invocation, each run in
+a new Python process.
+
+    python bench/cold_start.py [--runs 3] [--handlers get_requests,route]
+                               [--max-import-ms 800]
+
+The child process imports api before anything else, so the import time
+includes boto3 and every module api loads eagerly, as in a new execution
+environment. The signing keys are served by a local JWKS endpoint rather
+than read from a file, so the first call of an authenticated entry point
+includes the fetch of the keys, as in AWS. With --max-import-ms the script exits with status 1 when the
+median import time of an entry point exceeds the budget, so it can guard
+against regressions in CI.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+
+# A request of another user that the stand-in does not hold
+MISSING = {'id': 'other@example.com#111122223333#admin#2026-10-01T08:00:00Z', 'request_time': '2026-10-01T08:00:00Z'}
+# Entry point: (groups of the caller, query string parameters, body). The
+# status column shows the path each call took, e.g. create_export answers
+# 500 because the export function does not exist in the stand-in.
+API_CALLS = {
+    'get_requests': ((), None, None),
+    'get_pending_requests': (('reviewers',), None, None),
+    'get_processed_requests': (('reviewers',), None, None),
+    'get_all_requests': (('auditors',), None, None),
+    'create_request': (('aws-temp#111122223333#admin',), None, {'request_account': '111122223333', 'request_role': 'admin', 'request_duration': '60', 'request_justification': 'benchmark'}),
+    'create_requests': (('aws-temp#111122223333#admin',), None, {'targets': [{'request_account': '111122223333', 'request_role': 'admin'}], 'request_duration': '60', 'request_justification': 'benchmark'}),
+    'delete_request': ((), None, MISSING),
+    'approve_request': (('reviewers',), None, dict(MISSING, request_duration='60')),
+    'reject_request': (('reviewers',), None, MISSING),
+    'review_requests': (('reviewers',), None, {'reviews': [dict(MISSING, decision='reject')]}),
+    'federate_console': (('aws-temp#111122223333#admin',), {'account': '111122223333', 'role': 'admin'}, None),
+    'federate_cli': (('aws-temp#111122223333#admin',), {'account': '111122223333', 'role': 'admin'}, None),
+    'get_changes': ((), {'view': 'requests'}, None),
+    'create_export': (('auditors',), None, {'export_format': 'csv'}),
+    'get_export': (('auditors',), {'export_id': 'missing'}, None),
+    'get_statistics': (('auditors',), None, None),
+    'route': (('reviewers',), None, None)
+}
+# Scheduled and asynchronous entry points
+JOB_EVENTS = {
+    'sweep_expired': {},
+    'compact_changes': {},
+    'archive_requests': {},
+    'run_export': {'export_id': 'missing'}
+}
+TABLES = (('requestTable', 'db_table'), ('stateTable', 'state_table'), ('aggregatesTable', 'aggregates_table'))
+
+
+def child(handler):
+    """
+    Runs in the new process: imports api, then invokes one entry point
+    twice against moto. Prints the measurements as JSON.
+    """
+    call = json.load(sys.stdin)
+    sys.path.insert(0, os.path.join(ROOT, 'ui-api'))
+    started = time.perf_counter()
+    import api
+    imported = time.perf_counter()
+    eager_requests = 'requests' in sys.modules
+    sys.path.insert(0, os.path.join(ROOT, 'tests'))
+    from moto import mock_aws
+    from support import LambdaContext, create_table, load_template
+    with mock_aws():
+        template = load_template()
+        for logical_id, variable in TABLES:
+            create_table(logical_id, os.environ[variable], template)
+        durations = []
+        for _ in range(2):
+            invoked = time.perf_counter()
+            response = getattr(api, handler)(call, LambdaContext())
+            durations.append((time.perf_counter() - invoked) * 1000)
+    json.dump({
+        'import_ms': (imported - started) * 1000,
+        'first_ms': durations[0],
+        'second_ms': durations[1],
+        'status': response.get('statusCode') if isinstance(response, dict) else None,
+        'eager_requests': eager_requests
+    }, sys.stdout)
+
+
+def api_event(signer, handler):
+    import harness
+    groups, query, body = API_CALLS[handler]
+    path = '/get_pending_requests' if handler == 'route' else '/' + handler
+    return harness.event(signer, harness.REQUESTER, groups, query, body and json.dumps(body), 'POST' if body else 'GET', path)
+
+
+def measure(handler, call, runs):
+    results = []
+    for _ in range(runs):
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', handler],
+            input=json.dumps(call), capture_output=True, text=True, env=os.environ, check=True
+        )
+        # Handlers print their logs to stdout, the measurements come last
+        results.append(json.loads(process.stdout[process.stdout.rindex('{"import_ms"'):]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=3, help='new processes per entry point')
+    parser.add_argument('--handlers', help='comma separated entry points, all by default')
+    parser.add_argument('--max-import-ms', type=float, help='fail when a median import time exceeds it')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+        return
+
+    sys.path.insert(0, BENCH)
+    import harness
+    signer = harness.configure()
+    jwks = harness.jwks_endpoint(signer)
+    os.environ.pop('jwks_file')
+    os.environ['jwks_uri'] = jwks.url + '/v1/keys'
+    os.environ.update({
+        'aggregates_table': os.environ['db_table'] + 'Aggregates',
+        'archive_path': os.path.join(os.path.dirname(signer.jwks_path), 'archives'),
+        'export_path': os.path.join(os.path.dirname(signer.jwks_path), 'exports'),
+        'export_function': 'run_export'
+    })
+    handlers = args.handlers.split(',') if args.handlers else list(API_CALLS) + list(JOB_EVENTS)
+    rows = []
+    over_budget = []
+    for handler in handlers:
+        call = JOB_EVENTS[handler] if handler in JOB_EVENTS else api_event(signer, handler)
+        results = measure(handler, call, args.runs)
+        import_ms = statistics.median(result['import_ms'] for result in results)
+        rows.append([
+            handler,
+            import_ms,
+            statistics.median(result['first_ms'] for result in results),
+            statistics.median(result['second_ms'] for result in results),
+            str(results[-1]['status']),
+            'yes' if any(result['eager_requests'] for result in results) else 'no'
+        ])
+        if args.max_import_ms and import_ms > args.max_import_ms:
+            over_budget.append(handler)
+    jwks.close()
+    print('Median of %d new processes per entry point (ms)' % args.runs)
+    harness.print_table(['entry point', 'import', 'first call', 'second call', 'status', 'requests at import'], rows)
+    if over_budget:
+        print('Import time over %.0f ms: %s' % (args.max_import_ms, ', '.join(over_budget)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Setup shared by the benchmarks: the environment of the tests, a signer for
+the Authorization header and the AWS stand-in the functions run against.
+
+The stand-in is moto, in process, unless AWS_ENDPOINT_URL points to a local
+DynamoDB (e.g. http://localhost:8000), which also exercises the HTTP
+connection handling.
+"""
+import contextlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+from support import TEST_ENVIRONMENT, LambdaContext, Signer, create_table, jwks_endpoint, load_template
+
+REQUESTER = 'requester@example.com'
+REVIEWER = 'reviewer@example.com'
+ACCOUNT = '111122223333'
+ROLE = 'admin'
+
+
+def configure():
+    """
+    Sets the environment of the functions and returns a Signer whose JWKS
+    file the functions verify tokens with.
+    """
+    environment = dict(TEST_ENVIRONMENT)
+    if os.environ.get('AWS_ENDPOINT_URL'):
+        # Keep the region and credentials the local endpoint was set up with
+        for name in ('AWS_DEFAULT_REGION', 'AWS_ACCESS_KEY_ID', 'AWS_SECRET_ACCESS_KEY'):
+            if os.environ.get(name):
+                environment.pop(name)
+    os.environ.update(environment)
+    os.environ['state_table'] = os.environ['db_table'] + 'State'
+    signer = Signer(os.path.join(tempfile.mkdtemp(), 'jwks.json'))
+    os.environ['jwks_file'] = signer.jwks_path
+    return signer
+
+
+@contextlib.contextmanager
+def stand_in():
+    """
+    Runs the block against the AWS stand-in, with the request and state
+    tables created from template.yaml.
+    """
+    if os.environ.get('AWS_ENDPOINT_URL'):
+        context = contextlib.nullcontext()
+    else:
+        from moto import mock_aws
+        context = mock_aws()
+    with context:
+        template = load_template()
+        tables = [
+            create_fresh_table(template, 'requestTable', os.environ['db_table']),
+            create_fresh_table(template, 'stateTable', os.environ['state_table'])
+        ]
+        try:
+            yield tables
+        finally:
+            for table in tables:
+                table.delete()
+
+
+def create_fresh_table(template, logical_id, table_name):
+    import boto3
+    client = boto3.client('dynamodb')
+    if table_name in client.list_tables()['TableNames']:
+        client.delete_table(TableName=table_name)
+        client.get_waiter('table_not_exists').wait(TableName=table_name)
+    table = create_table(logical_id, table_name, template)
+    table.wait_until_exists()
+    return table
+
+
+def request_item(n, requester=REQUESTER, status='Requested', request_time=None):
+    request_time = request_time or '2026-10-01T%02d:%02d:%02dZ' % (n // 3600 % 24, n // 60 % 60, n % 60)
+    return {
+        'id': requester + '#' + ACCOUNT + '#' + ROLE + '#' + request_time,
+        'request_time': request_time,
+        'requester': requester,
+        'request_account': ACCOUNT,
+        'request_role': ROLE,
+        'request_duration': '60',
+        'request_justification': 'benchmark',
+        'request_status': status,
+        'request_ttl': int(time.time()) + 24 * 3600
+    }
+
+
+def event(signer, subject, groups=(), query=None, body=None, method='GET', path='/'):
+    """
+    Returns the API Gateway proxy event of a call by the given user.
+    """
+    return {
+        'httpMethod': method,
+        'resource': path,
+        'headers': signer.headers(subject, subject, groups),
+        'queryStringParameters': query,
+        'body': body
+    }
+
+
+def timed(function, runs):
+    """
+    Calls function runs times and returns the duration of each call in ms.
+    """
+    durations = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - started) * 1000)
+    return durations
+
+
+def summary(durations):
+    ordered = sorted(durations)
+    return {
+        'median': statistics.median(ordered),
+        'p90': ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))],
+        'mean': statistics.fmean(ordered)
+    }
+
+
+def print_table(headers, rows):
+    """
+    Prints rows of values as an aligned text table.
+    """
+    cells = [headers] + [[value if isinstance(value, str) else '%.3f' % value for value in row] for row in rows]
+    widths = [max(len(row[column]) for row in cells) for column in range(len(headers))]
+    for number, row in enumerate(cells):
+        print('  '.join(cell.ljust(width) if column == 0 else cell.rjust(width) for column, (cell, width) in enumerate(zip(row, widths))))
+        if number == 0:
+            print('  '.join('-' * width for width in widths))
+
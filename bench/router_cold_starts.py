@@ -0,0 +1,115 @@
+"""
+Cold start rate of the API under a simulated mixed workload, deployed as one
+function per endpoint and as the single routed function
+(ConsolidatedRouter=true).
+
+    python bench/router_cold_starts.py [--rates 0.01,0.05,0.2,1,5]
+                                       [--hours 8] [--idle-minutes 10]
+                                       [--warm-ms 60] [--cold-ms 900]
+
+Calls arrive as a Poisson process and pick an endpoint with the weights of
+WORKLOAD. Each function keeps the execution environments it started; a
+call reuses one that is idle, or starts a new one (a cold start) when all
+are busy or were reclaimed after idle-minutes without a call. Set warm-ms
+and cold-ms from the results of bench/cold_start.py.
+"""
+import argparse
+import random
+
+import harness
+
+# Share of the calls of each endpoint: the dashboards poll the lists and
+# the change feed, reviews and federation come in bursts
+WORKLOAD = {
+    'get_changes': 30,
+    'get_pending_requests': 15,
+    'get_requests': 15,
+    'get_processed_requests': 8,
+    'get_all_requests': 4,
+    'federate_console': 8,
+    'federate_cli': 6,
+    'create_request': 4,
+    'create_requests': 1,
+    'approve_request': 3,
+    'reject_request': 1,
+    'review_requests': 1,
+    'delete_request': 1,
+    'get_statistics': 1,
+    'create_export': 0.5,
+    'get_export': 1.5
+}
+
+
+class Function:
+    """
+    It holds the execution environments of one simulated Lambda function,
+    as the time each one finished or will finish its last call.
+    """
+    def __init__(self, idle_seconds):
+        self.idle_seconds = idle_seconds
+        self.environments = []
+        self.started = 0
+
+    def invoke(self, now, duration, cold_duration):
+        """
+        Runs a call arriving at now and returns True if it was a cold start.
+        """
+        self.environments = [environment for environment in self.environments if now - environment['free_at'] <= self.idle_seconds]
+        idle = [environment for environment in self.environments if environment['free_at'] <= now]
+        if idle:
+            # The most recently used environment takes the call
+            environment = max(idle, key=lambda environment: environment['free_at'])
+            environment['free_at'] = now + duration
+            return False
+        self.environments.append({'free_at': now + cold_duration + duration})
+        self.started += 1
+        return True
+
+
+def simulate(rate, seconds, idle_seconds, warm_seconds, cold_seconds, routed, seed):
+    """
+    Returns (calls, cold starts, execution environments started) of one
+    layout at a rate of calls per second.
+    """
+    generator = random.Random(seed)
+    endpoints = list(WORKLOAD)
+    weights = [WORKLOAD[endpoint] for endpoint in endpoints]
+    functions = {}
+    now = 0.0
+    calls = 0
+    cold_starts = 0
+    while True:
+        now += generator.expovariate(rate)
+        if now > seconds:
+            break
+        endpoint = generator.choices(endpoints, weights)[0]
+        function = functions.setdefault('route' if routed else endpoint, Function(idle_seconds))
+        calls += 1
+        if function.invoke(now, generator.expovariate(1 / warm_seconds), cold_seconds):
+            cold_starts += 1
+    return calls, cold_starts, sum(function.started for function in functions.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rates', default='0.01,0.05,0.2,1,5', help='calls per second, comma separated')
+    parser.add_argument('--hours', type=float, default=8)
+    parser.add_argument('--idle-minutes', type=float, default=10, help='idle time after which an environment is reclaimed')
+    parser.add_argument('--warm-ms', type=float, default=60, help='mean duration of a warm call')
+    parser.add_argument('--cold-ms', type=float, default=900, help='added duration of a cold start')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rows = []
+    for rate in [float(rate) for rate in args.rates.split(',')]:
+        row = ['%g' % rate]
+        for routed in (False, True):
+            calls, cold_starts, started = simulate(rate, args.hours * 3600, args.idle_minutes * 60, args.warm_ms / 1000, args.cold_ms / 1000, routed, args.seed)
+            row += [100.0 * cold_starts / max(calls, 1), str(started)]
+        rows.append(row)
+    print('%g hours per rate, environments reclaimed after %g idle minutes' % (args.hours, args.idle_minutes))
+    harness.print_table(['calls/s', 'per function cold %', 'started', 'router cold %', 'started'], rows)
+
+
+if __name__ == '__main__':
+    main()
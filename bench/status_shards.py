@@ -0,0 +1,112 @@
+"""
+Pending queue throughput with the unsharded request-status-index and with
+request-status-shard-index (StatusShards > 0).
+
+    python bench/status_shards.py [--pending 2000] [--shards 8]
+                                  [--limit 50] [--runs 30]
+
+The first table is measured against the stand-in: the latency of creating
+a request, of reading a page of the pending queue and of reading the whole
+queue. moto evaluates every query over the whole table under one
+interpreter lock, so there the parallel shard queries of a page add up;
+use AWS_ENDPOINT_URL for representative page latencies.
+
+Neither moto nor a local DynamoDB throttles a partition, so the second
+table computes the rate each layout sustains before the busiest index
+partition reaches DynamoDB's per-partition limits of 3000 read and 1000
+write units per second.
+"""
+import argparse
+import json
+import math
+import os
+
+import harness
+
+PARTITION_READ_UNITS = 3000
+PARTITION_WRITE_UNITS = 1000
+
+
+def seed(api, table, pending):
+    with table.batch_writer() as batch:
+        for n in range(pending):
+            request_time = '2026-10-01T%02d:%02d:%02dZ' % (n // 3600 % 24, n // 60 % 60, n % 60)
+            batch.put_item(Item=api.new_request_item('requester%d@example.com' % n, harness.ACCOUNT, harness.ROLE, '60', 'benchmark', request_time))
+
+
+def measure(signer, shards, args):
+    """
+    Returns the latency summaries of one layout and the size of a request
+    item in bytes.
+    """
+    os.environ['status_shards'] = str(shards)
+    with harness.stand_in() as (request_table, state_table):
+        import api
+        api.aws_registry.clear()
+        seed(api, request_table, args.pending)
+        # The pending snapshot would hide the index reads
+        state_table_name = os.environ.pop('state_table')
+        try:
+            create = harness.event(signer, harness.REQUESTER, ['aws-temp#' + harness.ACCOUNT + '#' + harness.ROLE], body=json.dumps({
+                'request_account': harness.ACCOUNT, 'request_role': harness.ROLE, 'request_duration': '60', 'request_justification': 'benchmark'}), method='POST')
+            page = harness.event(signer, harness.REVIEWER, ['reviewers'], query={'limit': str(args.limit)})
+            context = harness.LambdaContext()
+            assert api.get_pending_requests(page, context)['statusCode'] == 200
+            results = {
+                'create a request': harness.timed(lambda: api.create_request(create, context), args.runs),
+                'read a page of %d' % args.limit: harness.timed(lambda: api.get_pending_requests(page, context), args.runs),
+                'read the whole queue': harness.timed(lambda: api.load_pending(request_table), max(1, args.runs // 5))
+            }
+            item = request_table.scan(Limit=1)['Items'][0]
+        finally:
+            os.environ['state_table'] = state_table_name
+    return {name: harness.summary(durations) for name, durations in results.items()}, len(json.dumps(item, default=str))
+
+
+def read_units(items, item_bytes):
+    # Eventually consistent reads cost half a unit per 4 KB read
+    return max(0.5, math.ceil(items * item_bytes / 4096) / 2)
+
+
+def ceilings(shards, pending, limit, item_bytes):
+    """
+    Returns the calls per second the busiest partition of the layout allows
+    for each operation.
+    """
+    partitions = max(shards, 1)
+    # Every shard answers the query of every page, with at least limit items
+    return [
+        PARTITION_WRITE_UNITS * partitions / math.ceil(item_bytes / 1024),
+        PARTITION_READ_UNITS / read_units(limit, item_bytes),
+        PARTITION_READ_UNITS / read_units(math.ceil(pending / partitions), item_bytes)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pending', type=int, default=2000, help='pending requests in the table')
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--limit', type=int, default=50, help='page size')
+    parser.add_argument('--runs', type=int, default=30)
+    args = parser.parse_args()
+
+    signer = harness.configure()
+    layouts = [('unsharded', 0), ('%d shards' % args.shards, args.shards)]
+    measured = []
+    rows = []
+    for name, shards in layouts:
+        results, item_bytes = measure(signer, shards, args)
+        measured.append(results)
+        rows.append([name] + ceilings(shards, args.pending, args.limit, item_bytes))
+    print('Measured against the stand-in, %d pending requests (ms, median / p90)' % args.pending)
+    harness.print_table(['operation'] + [name for name, shards in layouts], [
+        [operation] + ['%.2f / %.2f' % (results[operation]['median'], results[operation]['p90']) for results in measured]
+        for operation in measured[0]
+    ])
+    print()
+    print('Partition ceiling (calls per second), %d byte items' % item_bytes)
+    harness.print_table(['layout', 'create a request', 'read a page of %d' % args.limit, 'read the whole queue'], rows)
+
+
+if __name__ == '__main__':
+    main()
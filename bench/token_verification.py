@@ -0,0 +1,63 @@
+"""
+Cost per request of authenticating the Authorization header, which holds
+an access token and an id token.
+
+    python bench/token_verification.py [--runs 2000]
+
+The rows compare decoding without a signature check, as before the
+verifier, with RS256 verification against a cold and a warm key cache and
+with the claims cache that serves repeated calls of a warm container.
+"""
+import argparse
+
+import harness
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=2000)
+    args = parser.parse_args()
+
+    signer = harness.configure()
+    import api
+    jwt = api.lazy_import('jwt')
+    call = harness.event(signer, harness.REQUESTER, ['aws-temp#' + harness.ACCOUNT + '#' + harness.ROLE])
+    tokens = call['headers']['Authorization'][len('Bearer '):].split(' ')
+
+    def unverified():
+        for token in tokens:
+            jwt.decode(token, options={'verify_signature': False})
+
+    def cold_keys():
+        # A new execution environment: the JWKS file is read and parsed
+        verifier = api.TokenVerifier(api.JwksCache())
+        for token in tokens:
+            verifier.verify(token)
+
+    warm_verifier = api.TokenVerifier(api.JwksCache())
+    warm_verifier.verify(tokens[0])
+
+    def warm_keys():
+        for token in tokens:
+            warm_verifier.verify(token)
+
+    def claims_cache():
+        api.get_principal(call)
+
+    claims_cache()
+    results = [
+        ('decode without verification', unverified),
+        ('verify, cold key cache', cold_keys),
+        ('verify, warm key cache', warm_keys),
+        ('claims cache hit', claims_cache)
+    ]
+    rows = []
+    for name, function in results:
+        stats = harness.summary([duration * 1000 for duration in harness.timed(function, args.runs)])
+        rows.append([name, stats['median'], stats['p90'], stats['mean']])
+    print('Two tokens per request, %d runs (microseconds per request)' % args.runs)
+    harness.print_table(['mode', 'median', 'p90', 'mean'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,230 +1,457 @@
 import os
 import json
 import time
-import dateutil.parser
-import datetime
-import calendar
 import traceback
+import random
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
 
 import boto3
 
-def get_base_value_epoch_seconds(base_value):
-    epoch_seconds = None
-    base_value_float = None
-    try:
-        parsed = dateutil.parser.parse(base_value)
-        epoch_seconds = int(parsed.strftime('%s'))
-    except Exception as error:
-        print(base_value + " is not an ISO8601 string: " + str(error))
-    return epoch_seconds
-
-def get_expiry(base_value, ttl_duration):
-    expiry_ttl = None
-    future = datetime.datetime.fromtimestamp(float(base_value)) + datetime.timedelta(days=int(ttl_duration))
-    expiry_ttl = calendar.timegm(future.timetuple())
-    return expiry_ttl
-
-def update_item(table_name, key, ttl_attrib_name, ttl_attrib_value, client):
-    status = False
-    key_str = json.dumps(key)
-    print("updating item " + key_str + " in table " + table_name)
-    response = client.update_item(
-        TableName=table_name,
-        Key=key,
-        ExpressionAttributeNames={
-            '#ED': ttl_attrib_name
-        },
-        ExpressionAttributeValues={
-            ':ed': {
-                'N': str(ttl_attrib_value),
+# Clients are created once per execution environment and reused by every
+# invocation
+ses_client = boto3.client("ses")
+sns_client = boto3.client("sns")
+dynamodb_client = boto3.client("dynamodb")
+publish_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('publish_workers', 8)))
+
+# SendBulkTemplatedEmail accepts at most 50 destinations per call
+SES_BULK_LIMIT = 50
+
+PENDING_SUBJECT = "Privileged Access request for {requester}"
+PENDING_MESSAGE = (
+    "The following privileged access request is awaiting approval:\n\n"
+    "Submitted (UTC): {request_time}\nRequester: {requester}\nAccount: {request_account}\n"
+    "Role: {request_role}\nDuration: {request_duration}\nJustification: {request_justification}\n\n"
+    "If no action is taken, the request will automatically expire after 24 hours. "
+    "Approve or reject the request: {cloudfront_url}"
+)
+GROUP_SUBJECT = "Privileged Access requests for {requester}"
+GROUP_MESSAGE = (
+    "The following privileged access requests are awaiting approval:\n\n"
+    "Submitted (UTC): {request_time}\nRequester: {requester}\n{targets}\n"
+    "Duration: {request_duration}\nJustification: {request_justification}\n\n"
+    "If no action is taken, the requests will automatically expire after 24 hours. "
+    "Approve or reject the requests: {cloudfront_url}"
+)
+GROUP_TARGET = "Account: {request_account}, Role: {request_role}"
+# Outlives the requests of the group, which expire after 24 hours
+GROUP_CLAIM_TTL_SECONDS = 2 * 24 * 3600
+
+def image_values(image, names):
+    return {name: image[name]["S"] for name in names}
+
+def collect_record(record, notifications):
+    """
+    Adds the notifications for one stream record to the batch's
+    notifications, keyed by kind. Errors are raised, so the caller can
+    report the record as failed.
+    """
+    image = record["dynamodb"].get("NewImage", {})
+    # Only a review changes the status to Approved or Rejected; later writes
+    # to a reviewed request (status shards, grant cleanup) must not notify again
+    old_status = record["dynamodb"].get("OldImage", {}).get("request_status", {}).get("S")
+    reviewed = record["eventName"] == 'MODIFY' and image["request_status"]["S"] != old_status
+
+    if reviewed and image["request_status"]["S"] == 'Approved':
+        values = image_values(image, ["reviewer", "expiration_time", "requester", "request_account", "request_time", "request_role", "request_duration"])
+        notifications['approved'].append(values)
+    if reviewed and image["request_status"]["S"] == 'Rejected':
+        values = image_values(image, ["reviewer", "requester", "request_account", "request_time", "request_role", "request_duration"])
+        notifications['rejected'].append(values)
+    if record['eventName'] == 'INSERT' and 'migrated_from' in image:
+        print("Skipping INSERT written by the timestamp migration")
+    elif record['eventName'] == 'INSERT' and 'group_id' in image:
+        # Requests created together by create_requests share one notification
+        values = image_values(image, ["group_id", "requester", "request_time", "request_duration", "request_justification"])
+        values['targets'] = [image_values(target["M"], ["request_account", "request_role"]) for target in image["group_targets"]["L"]]
+        notifications['grouped'].append(values)
+    elif record['eventName'] == 'INSERT':
+        # request_ttl is written by create_request together with the item
+        values = image_values(image, ["requester", "request_account", "request_time", "request_role", "request_duration", "request_justification"])
+        notifications['pending'].append(values)
+
+
+def changes_pending(record):
+    """
+    Returns True if the record adds a request to, removes it from or changes
+    it in the pending queue.
+    """
+    for name in ("OldImage", "NewImage"):
+        if record["dynamodb"].get(name, {}).get("request_status", {}).get("S") == 'Requested':
+            return True
+    return False
+
+def bump_pending_version():
+    dynamodb_client.update_item(
+        TableName=os.environ['state_table'],
+        Key={'pk': {'S': 'pending'}, 'sk': {'S': 'version'}},
+        UpdateExpression='ADD #V :one SET #B = :now',
+        ExpressionAttributeNames={'#V': 'version', '#B': 'bumped_at'},
+        ExpressionAttributeValues={':one': {'N': '1'}, ':now': {'N': str(int(time.time()))}}
+    )
+
+
+# Every record is also written to the change log in the state table, which
+# get_changes reads to return the requests modified since a client's cursor.
+# Entries are partitioned by the hour they are written in and expire at the
+# end of the retention window.
+CHANGES_BUCKET_FORMAT = '%Y-%m-%dT%H'
+CHANGE_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+# BatchWriteItem accepts at most 25 items per call
+BATCH_WRITE_LIMIT = 25
+BATCH_WRITE_ATTEMPTS = 5
+
+def change_entry(record, written_at):
+    """
+    Returns the change log item of a stream record: the key of the changed
+    request, its requester and the kind of change.
+    """
+    keys = record["dynamodb"]["Keys"]
+    image = record["dynamodb"].get("NewImage") or record["dynamodb"].get("OldImage", {})
+    retention = timedelta(hours=int(os.environ.get('changes_retention_hours', 24)))
+    item = {
+        'pk': {'S': 'changes#' + written_at.strftime(CHANGES_BUCKET_FORMAT)},
+        'sk': {'S': written_at.strftime(CHANGE_TIME_FORMAT) + '#' + record["dynamodb"]["SequenceNumber"]},
+        'id': keys["id"],
+        'request_time': keys["request_time"],
+        'event': {'S': record["eventName"]},
+        'ttl': {'N': str(int((written_at + retention - datetime(1970, 1, 1)).total_seconds()))}
+    }
+    if "requester" in image:
+        item['requester'] = image["requester"]
+    return item
+
+def write_changes(entries):
+    """
+    Writes change log items with BatchWriteItem, retrying unprocessed items
+    with backoff.
+
+    :param entries: (position, item) pairs.
+    :return: The positions whose item could not be written.
+    """
+    table_name = os.environ['state_table']
+    failed = []
+    for start in range(0, len(entries), BATCH_WRITE_LIMIT):
+        chunk = entries[start:start + BATCH_WRITE_LIMIT]
+        positions = {item['sk']['S']: position for position, item in chunk}
+        requests = [{'PutRequest': {'Item': item}} for position, item in chunk]
+        try:
+            for attempt in range(BATCH_WRITE_ATTEMPTS):
+                if attempt:
+                    time.sleep(random.uniform(0, min(1.0, 0.05 * 2 ** attempt)))
+                response = dynamodb_client.batch_write_item(RequestItems={table_name: requests})
+                requests = response.get('UnprocessedItems', {}).get(table_name, [])
+                if not requests:
+                    break
+        except ClientError as error:
+            print("Error writing change log entries: " + str(error))
+        failed.extend(positions[request['PutRequest']['Item']['sk']['S']] for request in requests)
+    return failed
+
+
+# When the aggregates table is configured, every request that is created or
+# changes status increments per-day counters, one item per dimension and day
+# (pk 'status', 'account', 'role' or 'reviewer', sk '<YYYY-MM-DD>'). The
+# attribute of a counter is the status, or '<value>#<status>' for the other
+# dimensions. The counters of a chunk of records are written in a single
+# transaction together with a marker item per record, so a record the
+# stream delivers again leaves the counters unchanged.
+COUNTER_DIMENSIONS = (('account', 'request_account'), ('role', 'request_role'))
+# TransactWriteItems accepts at most 100 items per call
+TRANSACT_LIMIT = 100
+TRANSACT_ATTEMPTS = 5
+# Outlives the 24 hour retention of the stream
+COUNTER_MARKER_TTL_SECONDS = 2 * 24 * 3600
+
+def counter_updates(record):
+    """
+    Returns the counters a stream record increments, as (pk, sk, attribute)
+    tuples, or an empty list if the record does not create a request or
+    change its status.
+    """
+    if record['eventName'] == 'REMOVE':
+        return []
+    new_image = record["dynamodb"].get("NewImage", {})
+    old_image = record["dynamodb"].get("OldImage", {})
+    # The timestamp migration re-inserts a request under its new key; only
+    # that copy is skipped, later changes of its status are counted
+    if record['eventName'] == 'INSERT' and 'migrated_from' in new_image:
+        return []
+    status = new_image.get("request_status", {}).get("S")
+    if not status or status == old_image.get("request_status", {}).get("S"):
+        return []
+    created = record["dynamodb"].get("ApproximateCreationDateTime")
+    day = (datetime.utcfromtimestamp(created) if created else datetime.utcnow()).strftime('%Y-%m-%d')
+    counters = [('status', day, status)]
+    for dimension, name in COUNTER_DIMENSIONS:
+        if new_image.get(name, {}).get("S"):
+            counters.append((dimension, day, new_image[name]["S"] + '#' + status))
+    if status in ('Approved', 'Rejected') and new_image.get("reviewer", {}).get("S"):
+        counters.append(('reviewer', day, new_image["reviewer"]["S"] + '#' + status))
+    return counters
+
+def counter_chunks(updates):
+    """
+    Splits (position, event id, counters) entries into chunks that fit in a
+    transaction: one marker per record and one update per counter item.
+    """
+    chunks = []
+    chunk = []
+    keys = set()
+    for entry in updates:
+        entry_keys = set((dimension, day) for dimension, day, attribute in entry[2])
+        if chunk and len(chunk) + 1 + len(keys | entry_keys) > TRANSACT_LIMIT:
+            chunks.append(chunk)
+            chunk = []
+            keys = set()
+        chunk.append(entry)
+        keys |= entry_keys
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+def write_counters(chunk):
+    """
+    Applies the counters of a chunk of records in one transaction. Records
+    whose marker already exists were applied by an earlier delivery and are
+    left out.
+    """
+    table_name = os.environ['aggregates_table']
+    expires = str(int(time.time()) + COUNTER_MARKER_TTL_SECONDS)
+    attempt = 0
+    while chunk:
+        totals = {}
+        for position, event_id, counters in chunk:
+            for dimension, day, attribute in counters:
+                attributes = totals.setdefault((dimension, day), {})
+                attributes[attribute] = attributes.get(attribute, 0) + 1
+        items = [{
+            'Put': {
+                'TableName': table_name,
+                'Item': {'pk': {'S': 'event#' + event_id}, 'sk': {'S': 'applied'}, 'ttl': {'N': expires}},
+                'ConditionExpression': 'attribute_not_exists(pk)'
             }
-        },
-        ReturnValues='ALL_NEW',
-        UpdateExpression='SET #ED = :ed'
+        } for position, event_id, counters in chunk]
+        for (dimension, day), attributes in totals.items():
+            counts = list(attributes.items())
+            items.append({
+                'Update': {
+                    'TableName': table_name,
+                    'Key': {'pk': {'S': dimension}, 'sk': {'S': day}},
+                    'UpdateExpression': 'ADD ' + ', '.join('#c' + str(index) + ' :c' + str(index) for index in range(len(counts))),
+                    'ExpressionAttributeNames': {'#c' + str(index): attribute for index, (attribute, count) in enumerate(counts)},
+                    'ExpressionAttributeValues': {':c' + str(index): {'N': str(count)} for index, (attribute, count) in enumerate(counts)}
+                }
+            })
+        try:
+            dynamodb_client.transact_write_items(TransactItems=items)
+            return
+        except ClientError as error:
+            if error.response['Error']['Code'] != 'TransactionCanceledException':
+                raise
+            reasons = error.response.get('CancellationReasons', [])
+            applied = set(index for index, reason in enumerate(reasons[:len(chunk)]) if reason.get('Code') == 'ConditionalCheckFailed')
+            if applied:
+                print("Skipping the counters of " + str(len(applied)) + " records that were already applied")
+                chunk = [entry for index, entry in enumerate(chunk) if index not in applied]
+                continue
+            # Concurrent transactions on the same counter items conflict
+            attempt += 1
+            if attempt >= TRANSACT_ATTEMPTS:
+                raise
+            time.sleep(random.uniform(0, min(1.0, 0.05 * 2 ** attempt)))
+
+
+def send_review_emails(template_name, values_list, cloudfront_url):
+    """
+    Sends one templated email per reviewed request, in bulk calls.
+
+    :return: The indexes of values_list whose email was not accepted.
+    """
+    failed = []
+    for start in range(0, len(values_list), SES_BULK_LIMIT):
+        chunk = values_list[start:start + SES_BULK_LIMIT]
+        try:
+            response = ses_client.send_bulk_templated_email(
+                Source=os.environ['ses_email'],
+                Template=template_name,
+                DefaultTemplateData=json.dumps({'cloudfront_url': cloudfront_url}),
+                Destinations=[
+                    {
+                        'Destination': {'ToAddresses': [values['requester']]},
+                        'ReplacementTemplateData': json.dumps(dict(values, cloudfront_url=cloudfront_url))
+                    }
+                    for values in chunk
+                ]
+            )
+            for offset, status in enumerate(response['Status']):
+                if status.get('Status', 'Success') != 'Success':
+                    print("Error sending " + template_name + " email to " + chunk[offset]['requester'] + ": " + status['Status'] + " " + status.get('Error', ''))
+                    failed.append(start + offset)
+        except ClientError as error:
+            print("Error sending " + template_name + " emails: " + str(error))
+            failed.extend(range(start, start + len(chunk)))
+    return failed
+
+def publish_pending(values, cloudfront_url):
+    sns_client.publish(
+        TopicArn=os.environ["topic_arn"],
+        Message=PENDING_MESSAGE.format(cloudfront_url=cloudfront_url, **values),
+        Subject=PENDING_SUBJECT.format(**values),
     )
 
-    if 'ResponseMetadata' in response:
-        if 'HTTPStatusCode' in response['ResponseMetadata']:
-            if response['ResponseMetadata']['HTTPStatusCode'] != 200:
-                print("ERROR: error updating key " + key_str)
-                status = False
-            else:
-                print("+ Successfully updated " + key_str)
-                status = True
-        else:
-            print("ERROR: No http status code in response when trying to update " + key_str)
-            status = False
-    else:
-        print("ERROR: No response metadata when trying to update " + key_str)
-        status = False
+def claim_group_notification(group_id):
+    """
+    Records in the state table that the notification of a request group is
+    being sent. The requests of a group have different keys, so they can be
+    processed by concurrent invocations on different stream shards.
+
+    :return: False if another invocation already sent it.
+    """
+    try:
+        dynamodb_client.put_item(
+            TableName=os.environ['state_table'],
+            Item={
+                'pk': {'S': 'group#' + group_id},
+                'sk': {'S': 'notified'},
+                'ttl': {'N': str(int(time.time()) + GROUP_CLAIM_TTL_SECONDS)}
+            },
+            ConditionExpression='attribute_not_exists(pk)'
+        )
+    except ClientError as error:
+        if error.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+    return True
 
-    return status
+def release_group_notification(group_id):
+    dynamodb_client.delete_item(
+        TableName=os.environ['state_table'],
+        Key={'pk': {'S': 'group#' + group_id}, 'sk': {'S': 'notified'}}
+    )
+
+def publish_group(values, cloudfront_url):
+    """
+    Publishes the single notification of a request group. Without a state
+    table, groups are only merged within a stream batch.
+    """
+    state_table = os.environ.get('state_table')
+    if state_table and not claim_group_notification(values['group_id']):
+        print("The notification for group " + values['group_id'] + " was already sent")
+        return
+    targets = "\n".join(GROUP_TARGET.format(**target) for target in values['targets'])
+    try:
+        sns_client.publish(
+            TopicArn=os.environ["topic_arn"],
+            Message=GROUP_MESSAGE.format(cloudfront_url=cloudfront_url, **dict(values, targets=targets)),
+            Subject=GROUP_SUBJECT.format(**values),
+        )
+    except Exception:
+        # Lets the retry of the record send it
+        if state_table:
+            release_group_notification(values['group_id'])
+        raise
 
 
 def lambda_handler(event, context):
-    status = True
-    do_update = False
-    table_name = None
-    master_attribute_value = None
-    master_attribute = "request_time"
-    ttl_attribute_name = "request_ttl"
-    time_to_live_days = "1"
-
-    session = boto3.session.Session()
-    region = session.region_name
-    ses_client = boto3.client("ses", region_name=region)
-    CHARSET = "UTF-8"
-    sns_client = boto3.client('sns')
-    cloudfrontURL = os.environ['cloudfront_url']
-    ses_email = os.environ['ses_email']
-
-    for record in event['Records']:
-        if record["eventName"] == 'MODIFY' and record["dynamodb"]["NewImage"]["request_status"]["S"] == 'Approved':
-            try:
-                reviewer = record["dynamodb"]["NewImage"]["reviewer"]["S"]
-                expiration_time = record["dynamodb"]["NewImage"]["expiration_time"]["S"]
-                requester = record["dynamodb"]["NewImage"]["requester"]["S"]
-                request_account = record["dynamodb"]["NewImage"]["request_account"]["S"]
-                request_time = record["dynamodb"]["NewImage"]["request_time"]["S"]
-                request_role = record["dynamodb"]["NewImage"]["request_role"]["S"]
-                request_duration = record["dynamodb"]["NewImage"]["request_duration"]["S"]
-                ses_client.send_email(
-                    Destination={
-                        "ToAddresses": [
-                            requester,
-                        ],
-                    },
-                    Message={
-                        "Body": {
-                            "Text": {
-                                "Charset": CHARSET,
-                                "Data": "The following privileged access request has been APPROVED by {}:\n\nSubmitted (UTC): {}\nAccount: {}\nRole: {}\nDuration: {}\n\nYour elevated access will expire on {} UTC. You can obtain temporary security credentials for your approved elevation by accessing your request dashboard: {}".format(
-                                    reviewer,
-                                    request_time,
-                                    request_account,
-                                    request_role,
-                                    request_duration,
-                                    expiration_time,
-                                    cloudfrontURL,
-                                ),
-                            }
-                        },
-                        "Subject": {
-                            "Charset": CHARSET,
-                            "Data": "Your privileged access request has been APPROVED",
-                        },  
-                    },
-                    Source=ses_email,
-                )
-            except Exception as error:
-                print("Unexpected error while processing DynamoDB record:", error)
-                pass
-        if record["eventName"] == 'MODIFY' and record["dynamodb"]["NewImage"]["request_status"]["S"] == 'Rejected':
-            try:
-                reviewer = record["dynamodb"]["NewImage"]["reviewer"]["S"]
-                requester = record["dynamodb"]["NewImage"]["requester"]["S"]
-                request_account = record["dynamodb"]["NewImage"]["request_account"]["S"]
-                request_time = record["dynamodb"]["NewImage"]["request_time"]["S"]
-                request_role = record["dynamodb"]["NewImage"]["request_role"]["S"]
-                request_duration = record["dynamodb"]["NewImage"]["request_duration"]["S"]
-                ses_client.send_email(
-                    Destination={
-                        "ToAddresses": [
-                            requester,
-                        ],
-                    },
-                    Message={
-                        "Body": {
-                            "Text": {
-                                "Charset": CHARSET,
-                                "Data": "The following privileged access request has been REJECTED by {}:\n\nSubmitted (UTC): {}\nAccount: {}\nRole: {}\nDuration: {}\n\nPlease visit your request dashboard to submit a new request: {}".format(
-                                    reviewer,
-                                    request_time,
-                                    request_account,
-                                    request_role,
-                                    request_duration,
-                                    cloudfrontURL,
-                                ),
-                            }
-                        },
-                        "Subject": {
-                            "Charset": CHARSET,
-                            "Data": "Your privileged access request has been REJECTED",
-                        },
-                    },
-                    Source=ses_email,
-                )
-            except Exception as error:
-                print("Unexpected error while processing DynamoDB record:", error)
-                pass          
-        if record['eventName'] == 'INSERT':
+    """
+    Processes every record of the stream batch, writes the batch to the
+    change log and the aggregate counters, then sends the batch's
+    notifications: review emails as bulk templated SES sends and pending
+    request messages as concurrent SNS publishes, one per request group for
+    requests created together.
+
+    The event source mapping uses ReportBatchItemFailures. A stream shard is
+    processed in order and resumes from the reported sequence number, so
+    the handler reports the earliest record that failed, either while being
+    processed, written to the change log or the counters or while its
+    notification was sent. The records before it are checkpointed, and that
+    record and the ones after it are retried.
+    """
+    cloudfront_url = os.environ['cloudfront_url']
+    records = event['Records']
+    notifications = {'approved': [], 'rejected': [], 'pending': [], 'grouped': []}
+    positions = {'approved': [], 'rejected': [], 'pending': [], 'grouped': []}
+    first_failure = len(records)
+    first_pending_change = None
+    change_log = os.environ.get('state_table')
+    aggregates = os.environ.get('aggregates_table')
+    written_at = datetime.utcnow()
+    entries = []
+    updates = []
+
+    for position, record in enumerate(records):
+        counts = {kind: len(values) for kind, values in notifications.items()}
+        try:
+            collect_record(record, notifications)
+            if change_log:
+                entries.append((position, change_entry(record, written_at)))
+            if aggregates:
+                counters = counter_updates(record)
+                if counters:
+                    updates.append((position, record["eventID"], counters))
+        except Exception as error:
+            print("Unexpected error while processing DynamoDB record " + str(record.get('eventID')) + ": " + str(error))
+            traceback.print_exc()
+            first_failure = position
+            # Notifications of the failed record are sent when it is retried
+            for kind in notifications:
+                del notifications[kind][counts[kind]:]
+            break
+        for kind in notifications:
+            positions[kind].extend([position] * (len(notifications[kind]) - counts[kind]))
+        if first_pending_change is None and changes_pending(record):
+            first_pending_change = position
+
+    if change_log:
+        for position in write_changes(entries):
+            first_failure = min(first_failure, position)
+    if aggregates:
+        for chunk in counter_chunks([entry for entry in updates if entry[0] < first_failure]):
             try:
-                table_name = record["eventSourceARN"].split("/")[1]
-                requester = record["dynamodb"]["NewImage"]["requester"]["S"]
-                request_account = record["dynamodb"]["NewImage"]["request_account"]["S"]
-                request_time = record["dynamodb"]["NewImage"]["request_time"]["S"]
-                request_role = record["dynamodb"]["NewImage"]["request_role"]["S"]
-                request_duration = record["dynamodb"]["NewImage"]["request_duration"]["S"]
-                request_justification = record["dynamodb"]["NewImage"]["request_justification"]["S"]
+                write_counters(chunk)
             except Exception as error:
-                print("Unexpected error while processing DynamoDB record:", error)
-                pass
-            print("New INSERT into table " + table_name + " detected - adding TTL if not already present")
-            if ttl_attribute_name not in record["dynamodb"]["NewImage"]:
-                print("no TTL attribute name " + ttl_attribute_name + " found - computing and adding")
-                if master_attribute not in record["dynamodb"]["NewImage"]:
-                    print("ERROR: The master attribute " + master_attribute + " to base the TTL on does not exist")
-                else:
-                    print("Computing a new TTL based on the value in " + master_attribute + " that is " + str(time_to_live_days) + " days in the future")
-                    if 'S' in record["dynamodb"]["NewImage"][master_attribute]:
-                        master_attribute_value = record["dynamodb"]["NewImage"][master_attribute]['S']
-                    elif 'N' in record["dynamodb"]["NewImage"][master_attribute]:
-                        master_attribute_value = record["dynamodb"]["NewImage"][master_attribute]['N']
-                    else:
-                        print("ERROR: Unknown attribute type for the master attribute. Unable to continue")
-                        status = False
-
-                    if master_attribute_value:
-                        print("Found a " + master_attribute + " value of " + master_attribute_value)
-                        master_epoch_seconds = get_base_value_epoch_seconds(master_attribute_value)
-
-                        if master_epoch_seconds:
-                            ttl_value = get_expiry(master_epoch_seconds, time_to_live_days)
-                            print("The TTL value is " + str(ttl_value))
-
-                            table_key = record['dynamodb']['Keys']
-                            do_update = True
-                        else:
-                            print("ERROR: Unable to obtain the original timestamp attribute value to compute a TTL")
-                            status = False
-                try:
-                    sns_client.publish(
-                        TopicArn=os.environ["topic_arn"],
-                        Message="The following privileged access request is awaiting approval:\n\nSubmitted (UTC): {}\nRequester: {}\nAccount: {}\nRole: {}\nDuration: {}\nJustification: {}\n\nIf no action is taken, the request will automatically expire after 24 hours. Approve or reject the request: {}".format(
-                            request_time,
-                            requester,
-                            request_account,
-                            request_role,
-                            request_duration,
-                            request_justification,
-                            cloudfrontURL,
-                        ),
-                        Subject="Privileged Access request for " + requester,
-                    )
-                except Exception as error:
-                    print("Unexpected SNS error:", error)
-                    pass
-            else:
-                print("TTL already present - no update required")
-
-        if do_update:
-            session = boto3.session.Session(region_name=record['awsRegion'])
-            dynamodb_client = session.client('dynamodb')
-
-            if update_item(table_name, table_key, ttl_attribute_name, ttl_value, dynamodb_client):
-                status = True
-            else:
-                status = False
-
-        return status
+                print("Error updating the aggregate counters: " + str(error))
+                first_failure = min(first_failure, chunk[0][0])
+                break
+    # Records that are not in the change log or the counters yet are
+    # retried, and their notifications are sent then
+    for kind in notifications:
+        kept = len([position for position in positions[kind] if position < first_failure])
+        del notifications[kind][kept:]
+        del positions[kind][kept:]
+
+    if first_pending_change is not None and change_log:
+        try:
+            bump_pending_version()
+        except Exception as error:
+            print("Error updating the pending queue version: " + str(error))
+            first_failure = min(first_failure, first_pending_change)
+
+    pending_futures = [publish_executor.submit(publish_pending, values, cloudfront_url) for values in notifications['pending']]
+    groups = {}
+    for index, values in enumerate(notifications['grouped']):
+        groups.setdefault(values['group_id'], index)
+    group_futures = [(index, publish_executor.submit(publish_group, notifications['grouped'][index], cloudfront_url)) for index in groups.values()]
+    for kind, template_name in (('approved', os.environ['approved_template']), ('rejected', os.environ['rejected_template'])):
+        if notifications[kind]:
+            for index in send_review_emails(template_name, notifications[kind], cloudfront_url):
+                first_failure = min(first_failure, positions[kind][index])
+    for index, future in enumerate(pending_futures):
+        try:
+            future.result()
+        except Exception as error:
+            print("Unexpected SNS error: " + str(error))
+            first_failure = min(first_failure, positions['pending'][index])
+    for index, future in group_futures:
+        try:
+            future.result()
+        except Exception as error:
+            print("Unexpected SNS error: " + str(error))
+            first_failure = min(first_failure, positions['grouped'][index])
+
+    if first_failure < len(records):
+        return {"batchItemFailures": [{"itemIdentifier": records[first_failure]["dynamodb"]["SequenceNumber"]}]}
+    return {"batchItemFailures": []}
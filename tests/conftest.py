@@ -0,0 +1,72 @@
+import json
+import os
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from support import TEST_ENVIRONMENT, Signer, create_table
+
+os.environ.update(TEST_ENVIRONMENT)
+
+
+@pytest.fixture(scope='session')
+def signer(tmp_path_factory):
+    signer = Signer(str(tmp_path_factory.mktemp('jwks') / 'jwks.json'))
+    os.environ['jwks_file'] = signer.jwks_path
+    return signer
+
+@pytest.fixture
+def aws():
+    with mock_aws():
+        yield
+
+@pytest.fixture
+def api(aws, signer):
+    import api
+    # Clients and tables cached by an earlier test belong to its mock
+    api.aws_registry.clear()
+    return api
+
+@pytest.fixture
+def request_table(aws):
+    return create_table('requestTable', os.environ['db_table'])
+
+@pytest.fixture
+def state_table(aws, monkeypatch):
+    monkeypatch.setenv('state_table', 'requestsState')
+    return create_table('stateTable', 'requestsState')
+
+@pytest.fixture
+def dbstream(aws, monkeypatch):
+    """
+    The stream handler, with its SNS topic and SES templates, and the
+    notifications it sends recorded in dbstream.sent.
+    """
+    import dbstream
+    topic_arn = boto3.client('sns').create_topic(Name='approvals')['TopicArn']
+    ses = boto3.client('ses')
+    ses.verify_email_identity(EmailAddress='broker@example.com')
+    for name in ('approved', 'rejected'):
+        ses.create_template(Template={'TemplateName': name, 'SubjectPart': name, 'TextPart': '{{requester}}'})
+    for name, value in (('cloudfront_url', 'https://broker.example.com'), ('ses_email', 'broker@example.com'),
+                        ('approved_template', 'approved'), ('rejected_template', 'rejected'), ('topic_arn', topic_arn)):
+        monkeypatch.setenv(name, value)
+    monkeypatch.delenv('state_table', raising=False)
+    monkeypatch.delenv('aggregates_table', raising=False)
+    sent = {'sns': [], 'ses': []}
+    publish = dbstream.sns_client.publish
+    send_bulk = dbstream.ses_client.send_bulk_templated_email
+    def record_publish(**kwargs):
+        response = publish(**kwargs)
+        sent['sns'].append(kwargs)
+        return response
+    def record_send_bulk(**kwargs):
+        response = send_bulk(**kwargs)
+        sent['ses'].extend((kwargs['Template'], json.loads(destination['ReplacementTemplateData'])['requester'])
+                           for destination in kwargs['Destinations'])
+        return response
+    monkeypatch.setattr(dbstream.sns_client, 'publish', record_publish)
+    monkeypatch.setattr(dbstream.ses_client, 'send_bulk_templated_email', record_send_bulk)
+    monkeypatch.setattr(dbstream, 'sent', sent, raising=False)
+    return dbstream
@@ -0,0 +1,52 @@
+"""
+Builds DynamoDB stream records of request items for the stream handler tests.
+"""
+from boto3.dynamodb.types import TypeSerializer
+
+serializer = TypeSerializer()
+
+
+def request_item(n, status='Requested', **attributes):
+    request_time = '2026-10-01T08:00:%02dZ' % (n % 60)
+    item = {
+        'id': 'requester%d@example.com#111122223333#admin#%s' % (n, request_time),
+        'request_time': request_time,
+        'requester': 'requester%d@example.com' % n,
+        'request_account': '111122223333',
+        'request_role': 'admin',
+        'request_duration': '60',
+        'request_justification': 'incident',
+        'request_status': status
+    }
+    if status in ('Approved', 'Rejected'):
+        item.update(reviewer='reviewer@example.com', review_time='2026-10-01T09:00:00Z')
+    if status == 'Approved':
+        item['expiration_time'] = '2026-10-01T10:00:00Z'
+    item.update(attributes)
+    return item
+
+
+def image(item):
+    return {name: serializer.serialize(value) for name, value in item.items()}
+
+
+def record(sequence, event_name, new=None, old=None):
+    item = new or old
+    dynamodb = {
+        'SequenceNumber': '%021d' % sequence,
+        'ApproximateCreationDateTime': 1790000000 + sequence,
+        'Keys': image({'id': item['id'], 'request_time': item['request_time']})
+    }
+    if new is not None:
+        dynamodb['NewImage'] = image(new)
+    if old is not None:
+        dynamodb['OldImage'] = image(old)
+    return {'eventID': 'event%d' % sequence, 'eventName': event_name, 'dynamodb': dynamodb}
+
+
+def inserted(sequence, n, **attributes):
+    return record(sequence, 'INSERT', new=request_item(n, **attributes))
+
+
+def reviewed(sequence, n, status, **attributes):
+    return record(sequence, 'MODIFY', new=request_item(n, status, **attributes), old=request_item(n))
@@ -0,0 +1,163 @@
+"""
+Helpers shared by the tests and the benchmarks: DynamoDB tables built from
+the definitions in template.yaml, tokens signed with a local key whose
+JWKS is written to a file, and local HTTP endpoints standing in for the
+identity provider and AWS federation.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for source in ('ui-api', 'dynamodb-stream'):
+    if os.path.join(ROOT, source) not in sys.path:
+        sys.path.insert(0, os.path.join(ROOT, source))
+
+ISSUER = 'https://idp.example.com/oauth2/default'
+KEY_ID = 'test-key'
+
+TEST_ENVIRONMENT = {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+    'AWS_XRAY_SDK_ENABLED': 'false',
+    'AWS_XRAY_CONTEXT_MISSING': 'IGNORE_ERROR',
+    'db_table': 'requests',
+    'reviewer_group': 'reviewers',
+    'auditor_group': 'auditors',
+    'jwt_issuer': ISSUER,
+    'pagination_secret': 'secret',
+    'search_prefix': 'aws-temp'
+}
+
+
+class TemplateLoader(yaml.SafeLoader):
+    pass
+
+def construct_tag(loader, suffix, node):
+    # Intrinsic functions (!Ref, !Sub, ...) are kept as plain values, and
+    # conditions take the branch of the default parameters
+    if isinstance(node, yaml.ScalarNode):
+        return loader.construct_scalar(node)
+    if isinstance(node, yaml.SequenceNode):
+        values = loader.construct_sequence(node, deep=True)
+        return values[1] if suffix == 'If' else values
+    return loader.construct_mapping(node, deep=True)
+
+TemplateLoader.add_multi_constructor('!', construct_tag)
+
+def load_template():
+    with open(os.path.join(ROOT, 'template.yaml')) as template:
+        return yaml.load(template, Loader=TemplateLoader)
+
+def create_table(logical_id, table_name, template=None):
+    """
+    Creates the table of a template resource under the given name.
+    """
+    properties = (template or load_template())['Resources'][logical_id]['Properties']
+    kwargs = {
+        'TableName': table_name,
+        'KeySchema': properties['KeySchema'],
+        'AttributeDefinitions': properties['AttributeDefinitions'],
+        'BillingMode': properties.get('BillingMode', 'PROVISIONED')
+    }
+    if 'ProvisionedThroughput' in properties:
+        kwargs['ProvisionedThroughput'] = properties['ProvisionedThroughput']
+    if 'GlobalSecondaryIndexes' in properties:
+        kwargs['GlobalSecondaryIndexes'] = properties['GlobalSecondaryIndexes']
+    if 'StreamSpecification' in properties:
+        kwargs['StreamSpecification'] = dict(properties['StreamSpecification'], StreamEnabled=True)
+    return boto3.resource('dynamodb').create_table(**kwargs)
+
+
+class Signer:
+    """
+    It signs RS256 tokens with a generated key and writes the matching JWKS
+    to a file for the jwks_file setting.
+    """
+    def __init__(self, jwks_path):
+        import jwt
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        self.jwt = jwt
+        self.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(self.key.public_key()))
+        jwk.update(kid=KEY_ID, use='sig', alg='RS256')
+        self.jwks_path = jwks_path
+        with open(jwks_path, 'w') as jwks_file:
+            json.dump({'keys': [jwk]}, jwks_file)
+
+    def token(self, **claims):
+        claims = dict({'iss': ISSUER, 'exp': int(time.time()) + 3600}, **claims)
+        return self.jwt.encode(claims, self.key, algorithm='RS256', headers={'kid': KEY_ID})
+
+    def headers(self, subject, email, groups=()):
+        """
+        Returns the Authorization header of a caller.
+        """
+        access_token = self.token(sub=subject)
+        id_token = self.token(sub=subject, email=email, groups=list(groups))
+        return {'Authorization': 'Bearer ' + access_token + ' ' + id_token}
+
+
+class StandInEndpoint:
+    """
+    It answers HTTP GET requests on a local port from a thread. respond is
+    called with the path and query of each request and returns the status
+    code and the body; the paths are recorded in calls.
+    """
+    def __init__(self, respond):
+        self.respond = respond
+        self.calls = []
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                endpoint.calls.append(self.path)
+                status, body = endpoint.respond(self.path)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def jwks_endpoint(signer):
+    """
+    Returns a StandInEndpoint serving the JWKS of a Signer at /v1/keys.
+    """
+    def respond(path):
+        with open(signer.jwks_path, 'rb') as jwks_file:
+            return 200, jwks_file.read()
+    return StandInEndpoint(respond)
+
+
+class LambdaContext:
+    def __init__(self, timeout_seconds=30):
+        self.deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.monotonic()) * 1000)
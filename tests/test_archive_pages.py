@@ -0,0 +1,60 @@
+import pytest
+
+from support import LambdaContext
+
+DAY = '2026-01-15'
+ROWS = 250
+BLOCK_ROWS = 20
+
+
+@pytest.fixture
+def archive(api, request_table, state_table, tmp_path, monkeypatch):
+    monkeypatch.setenv('archive_path', str(tmp_path))
+    monkeypatch.setattr(api, 'ARCHIVE_BLOCK_ROWS', BLOCK_ROWS)
+    items = [{
+        'id': 'requester%d@example.com#111122223333#admin#%s' % (n, request_time),
+        'request_time': request_time,
+        'requester': 'requester%d@example.com' % n,
+        'request_status': 'Ended'
+    } for n, request_time in ((n, '%sT%02d:%02d:%02dZ' % (DAY, n // 3600, n // 60 % 60, n % 60)) for n in range(ROWS))]
+    api.archive_day(state_table, api.get_object_store('archive'), DAY, iter(items))
+    return [item['request_time'] for item in items]
+
+
+@pytest.fixture
+def decoded(api, monkeypatch):
+    """
+    Counts the archive rows decoded by each read.
+    """
+    counts = []
+    read_archive_rows = api.read_archive_rows
+    def counted(store, object_key, start=0):
+        counts.append(0)
+        for row in read_archive_rows(store, object_key, start):
+            counts[-1] += 1
+            yield row
+    monkeypatch.setattr(api, 'read_archive_rows', counted)
+    return counts
+
+
+def test_pages_continue_from_the_block_of_their_token(api, request_table, archive, decoded):
+    limit = 7
+    request_times = []
+    position = {'a': None}
+    while position:
+        items, position = api.audit_items(request_table, LambdaContext(), None, None, limit, position)
+        request_times += [item['request_time'] for item in items]
+    assert request_times == archive
+    # The rows of the page, the rest of one block and the row after the page
+    assert max(decoded) <= limit + BLOCK_ROWS + 1
+    assert sum(decoded) < ROWS * 3
+
+
+def test_an_unpaged_read_stops_at_the_row_budget(api, request_table, archive, monkeypatch):
+    monkeypatch.setenv('unpaged_archive_rows', '100')
+    items, position = api.audit_items(request_table, LambdaContext(), None, None, None, None)
+    assert [item['request_time'] for item in items] == archive[:100]
+    assert position is not None
+    monkeypatch.setenv('unpaged_archive_rows', str(ROWS))
+    items, position = api.audit_items(request_table, LambdaContext(), None, None, None, None)
+    assert len(items) == ROWS and position is None
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+from stream_records import inserted
+from support import create_table
+
+TARGETS = [{'request_account': '111122223333', 'request_role': role} for role in ('admin', 'readonly', 'billing')]
+
+
+def create_requests(api, signer, targets=TARGETS):
+    headers = signer.headers('requester', 'requester@example.com')
+    body = {'targets': targets, 'request_duration': '60', 'request_justification': 'incident'}
+    return api.create_requests({'headers': headers, 'body': json.dumps(body)}, None)
+
+
+def test_the_requests_of_a_group_are_created_together(api, request_table, signer):
+    response = create_requests(api, signer)
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    items = [request_table.get_item(Key={'id': id, 'request_time': id.rsplit('#', 1)[1]})['Item'] for id in body['ids']]
+    assert [item['request_role'] for item in items] == ['admin', 'readonly', 'billing']
+    assert set(item['group_id'] for item in items) == {body['group_id']}
+    assert items[0]['group_targets'] == TARGETS
+
+
+def test_a_failed_batch_reports_the_requests_that_were_written(api, request_table, signer, monkeypatch):
+    monkeypatch.setattr(api, 'BATCH_WRITE_LIMIT', 2)
+    dynamodb = api.get_resource('dynamodb')
+    batch_write_item = dynamodb.batch_write_item
+    calls = []
+    def failing_second_call(**kwargs):
+        calls.append(kwargs)
+        if len(calls) == 2:
+            raise ClientError({'Error': {'Code': 'InternalServerError', 'Message': 'Internal error'}}, 'BatchWriteItem')
+        return batch_write_item(**kwargs)
+    monkeypatch.setattr(dynamodb, 'batch_write_item', failing_second_call)
+    response = create_requests(api, signer)
+    assert response['statusCode'] == 500
+    body = json.loads(response['body'])
+    assert [id.split('#')[2] for id in body['ids']] == ['admin', 'readonly']
+    assert [id.split('#')[2] for id in body['failed_ids']] == ['billing']
+    stored = [item['id'] for item in request_table.scan()['Items']]
+    assert sorted(stored) == sorted(body['ids'])
+
+
+@pytest.fixture
+def group_claims(dbstream, monkeypatch):
+    monkeypatch.setenv('state_table', 'requestsState')
+    return create_table('stateTable', 'requestsState')
+
+
+def grouped(sequence, n, group_id):
+    return inserted(sequence, n, group_id=group_id, group_targets=TARGETS[:2])
+
+
+def test_a_group_is_published_once_across_batches(dbstream, group_claims):
+    first = [grouped(1, 1, 'group-a'), grouped(2, 2, 'group-a'), grouped(3, 3, 'group-b')]
+    # The last request of group-a arrives in the next batch of another shard
+    second = [grouped(4, 4, 'group-a')]
+    for records in (first, second):
+        assert dbstream.lambda_handler({'Records': records}, None) == {'batchItemFailures': []}
+    assert sorted(message['Subject'] for message in dbstream.sent['sns']) == [
+        'Privileged Access requests for requester1@example.com', 'Privileged Access requests for requester3@example.com']
+    assert all('Account: 111122223333, Role: readonly' in message['Message'] for message in dbstream.sent['sns'])
+    claims = group_claims.scan()['Items']
+    assert sorted(claim['pk'] for claim in claims if claim['sk'] == 'notified') == ['group#group-a', 'group#group-b']
+
+
+def test_a_failed_publish_releases_the_claim_for_the_retry(dbstream, group_claims, monkeypatch):
+    publish = dbstream.sns_client.publish
+    def throttled(**kwargs):
+        raise ClientError({'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}}, 'Publish')
+    monkeypatch.setattr(dbstream.sns_client, 'publish', throttled)
+    records = [grouped(1, 1, 'group-a'), grouped(2, 2, 'group-a')]
+    response = dbstream.lambda_handler({'Records': records}, None)
+    assert response['batchItemFailures'] == [{'itemIdentifier': records[0]['dynamodb']['SequenceNumber']}]
+    assert 'Item' not in group_claims.get_item(Key={'pk': 'group#group-a', 'sk': 'notified'})
+    monkeypatch.setattr(dbstream.sns_client, 'publish', publish)
+    assert dbstream.lambda_handler({'Records': records}, None) == {'batchItemFailures': []}
+    assert len(dbstream.sent['sns']) == 1
+    assert 'Item' in group_claims.get_item(Key={'pk': 'group#group-a', 'sk': 'notified'})
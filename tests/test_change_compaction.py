@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from support import LambdaContext
+
+
+@pytest.fixture
+def compactor(api, state_table):
+    return api
+
+
+def hour_bucket(hours_ago):
+    return datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours_ago)
+
+
+def put_changes(api, table, bucket, count):
+    with table.batch_writer() as batch:
+        for n in range(count):
+            written_at = bucket + timedelta(seconds=n % 3600, microseconds=n)
+            request_time = '2026-10-01T08:%02d:%02dZ' % (n // 60 % 60, n % 60)
+            batch.put_item(Item={
+                'pk': api.changes_bucket_key(bucket),
+                'sk': written_at.strftime(api.CHANGE_TIME_FORMAT) + '#%021d' % n,
+                'id': 'requester%d@example.com#111122223333#AdministratorAccess#%s' % (n, request_time),
+                'request_time': request_time,
+                'requester': 'requester%d@example.com' % n,
+                'event': 'MODIFY'
+            })
+
+
+def bucket_keys(api, table, bucket):
+    items = table.query(KeyConditionExpression=api.Key('pk').eq(api.changes_bucket_key(bucket)))['Items']
+    return [item['sk'] for item in items]
+
+
+def test_a_bucket_too_large_for_one_item_is_left_raw(compactor, state_table):
+    small, large = hour_bucket(3), hour_bucket(4)
+    put_changes(compactor, state_table, small, 10)
+    put_changes(compactor, state_table, large, 2000)
+    assert compactor.compact_changes({}, LambdaContext()) == {'compacted': 10}
+    assert bucket_keys(compactor, state_table, small) == [compactor.COMPACTED_CHANGES_SK]
+    assert len(bucket_keys(compactor, state_table, large)) == 2000
+
+
+def test_a_failed_bucket_does_not_stop_the_others(compactor, state_table, monkeypatch):
+    failing, other = hour_bucket(3), hour_bucket(5)
+    put_changes(compactor, state_table, failing, 5)
+    put_changes(compactor, state_table, other, 5)
+    compact_changes_bucket = compactor.compact_changes_bucket
+    def flaky(table, bucket):
+        if bucket == failing:
+            raise RuntimeError('throttled')
+        return compact_changes_bucket(table, bucket)
+    monkeypatch.setattr(compactor, 'compact_changes_bucket', flaky)
+    assert compactor.compact_changes({}, LambdaContext()) == {'compacted': 5}
+    assert bucket_keys(compactor, state_table, other) == [compactor.COMPACTED_CHANGES_SK]
+    assert len(bucket_keys(compactor, state_table, failing)) == 5
@@ -0,0 +1,62 @@
+import json
+import time
+
+import pytest
+
+REQUESTER = 'requester@example.com'
+ACCOUNT = '111122223333'
+ROLE = 'admin'
+
+
+@pytest.fixture
+def grant(api, request_table):
+    request_time = api.timestamp_now()
+    request_id = api.make_grant_key(REQUESTER, ACCOUNT, ROLE) + '#' + request_time
+    request_table.put_item(Item={
+        'id': request_id,
+        'request_time': request_time,
+        'requester': REQUESTER,
+        'request_account': ACCOUNT,
+        'request_role': ROLE,
+        'request_status': 'Requested',
+        'request_ttl': int(time.time()) + 3600
+    })
+    assert api.apply_review(request_table, request_id, request_time, 'approve', 'reviewer@example.com', 60)
+    api.credential_cache.entries.clear()
+    return request_id, request_time
+
+
+def federate_cli(api, signer):
+    headers = signer.headers(REQUESTER, REQUESTER, ['aws-temp#' + ACCOUNT + '#' + ROLE])
+    return api.federate_cli({'headers': headers, 'queryStringParameters': {'account': ACCOUNT, 'role': ROLE}}, None)
+
+
+def test_credentials_are_cached_per_grant(api, signer, grant, monkeypatch, capsys):
+    monkeypatch.setattr(api, 'credential_cache', api.CredentialCache())
+    first = federate_cli(api, signer)
+    second = federate_cli(api, signer)
+    assert first['statusCode'] == 200
+    assert json.loads(first['body']) == json.loads(second['body'])
+    assert list(api.credential_cache.entries) == [grant[0]]
+    logged = [line for line in capsys.readouterr().out.splitlines() if line.startswith('Credential cache ')]
+    assert [json.loads(line[len('Credential cache '):]) for line in logged] == [
+        {'hits': 0, 'misses': 1, 'size': 1}, {'hits': 1, 'misses': 1, 'size': 1}]
+
+
+def test_a_grant_ended_elsewhere_is_not_served_from_the_cache(api, signer, request_table, grant):
+    request_id, request_time = grant
+    assert federate_cli(api, signer)['statusCode'] == 200
+    index_item = request_table.query(
+        IndexName='active-grant-index',
+        KeyConditionExpression=api.Key('grant_key').eq(api.make_grant_key(REQUESTER, ACCOUNT, ROLE))
+    )['Items'][0]
+    # Ended by the sweeper, whose cache is not this one
+    request_table.update_item(
+        Key={'id': request_id, 'request_time': request_time},
+        UpdateExpression='set request_status=:v1 REMOVE grant_key, grant_expiration',
+        ExpressionAttributeValues={':v1': 'Ended'}
+    )
+    # A stale read of the eventually consistent index still returns the grant
+    assert api.get_role_credentials(request_table, REQUESTER, ACCOUNT, ROLE, index_item) is None
+    assert request_id not in api.credential_cache.entries
+    assert federate_cli(api, signer)['statusCode'] == 400
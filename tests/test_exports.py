@@ -0,0 +1,111 @@
+import csv
+import io
+import json
+import os
+
+import pytest
+
+from support import LambdaContext
+
+
+def test_the_object_store_interface_cannot_be_instantiated(api):
+    with pytest.raises(TypeError):
+        api.ObjectStore()
+
+
+def test_multipart_writer_uploads_full_parts_and_the_rest(api, tmp_path):
+    store = api.LocalObjectStore(str(tmp_path))
+    uploaded = []
+    upload_part = store.upload_part
+    def recording_upload_part(key, upload_id, number, data):
+        uploaded.append((number, len(data)))
+        return upload_part(key, upload_id, number, data)
+    store.upload_part = recording_upload_part
+    writer = api.MultipartWriter(store, 'exports/file.bin', 'application/octet-stream', part_bytes=10)
+    for size in (3, 12, 7, 4):
+        writer.write(b'x' * size)
+    # One part is held back until it is full
+    assert uploaded == [(1, 10), (2, 10)]
+    writer.close()
+    assert uploaded == [(1, 10), (2, 10), (3, 6)]
+    assert writer.size == 26
+    assert (tmp_path / 'exports' / 'file.bin').read_bytes() == b'x' * 26
+    assert os.listdir(tmp_path / '.uploads') == []
+
+
+def test_an_empty_or_aborted_file(api, tmp_path):
+    store = api.LocalObjectStore(str(tmp_path))
+    writer = api.MultipartWriter(store, 'empty.csv', 'text/csv', part_bytes=10)
+    writer.close()
+    assert (tmp_path / 'empty.csv').read_bytes() == b''
+    def failing_chunks():
+        yield b'a'
+        raise RuntimeError('scan failed')
+    with pytest.raises(RuntimeError):
+        api.write_file(store, 'failed.csv', 'text/csv', failing_chunks())
+    assert not (tmp_path / 'failed.csv').exists()
+    assert os.listdir(tmp_path / '.uploads') == []
+
+
+def test_csv_cells_that_start_a_formula_are_escaped(api):
+    values = ['=HYPERLINK("http://example.com")', '+1', '-1', '@SUM(A1)', '\tx', '\rx', 'plain', 'a=b']
+    rows = [dict(api.request_row({}), request_justification=value) for value in values]
+    lines = list(csv.reader(io.StringIO(b''.join(api.encode_csv(rows)).decode(), newline='')))
+    names = [name for name, default in api.REQUEST_ATTRIBUTES]
+    assert lines[0] == names
+    column = names.index('request_justification')
+    assert [line[column] for line in lines[1:]] == ["'" + value for value in values[:6]] + ['plain', 'a=b']
+
+
+@pytest.fixture
+def exports(api, request_table, state_table, tmp_path, monkeypatch):
+    """
+    The export functions writing to a local directory, with the run_export
+    invocations that create_export starts recorded in api.invocations.
+    """
+    monkeypatch.setenv('export_path', str(tmp_path))
+    monkeypatch.delenv('export_bucket', raising=False)
+    monkeypatch.setenv('export_function', 'run_export')
+    invocations = []
+    monkeypatch.setattr(api.get_client('lambda'), 'invoke', lambda **kwargs: invocations.append(json.loads(kwargs['Payload'])))
+    monkeypatch.setattr(api, 'invocations', invocations, raising=False)
+    with request_table.batch_writer() as batch:
+        for n in range(30):
+            batch.put_item(Item={
+                'id': 'r%04d' % n,
+                'request_time': '2026-10-01T08:00:%02dZ' % n,
+                'requester': 'requester%d@example.com' % n,
+                'request_account': '111122223333',
+                'request_role': 'admin',
+                'request_status': 'Ended'
+            })
+    return api
+
+
+def export_call(api, signer, handler, **kwargs):
+    headers = signer.headers('auditor', 'auditor@example.com', ['auditors'])
+    response = getattr(api, handler)(dict({'headers': headers}, **kwargs), None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+def test_an_export_runs_to_complete(exports, signer, tmp_path):
+    status_code, job = export_call(exports, signer, 'create_export', body=json.dumps({'export_format': 'csv'}))
+    assert (status_code, job['export_status']) == (200, 'Running')
+    assert exports.invocations == [{'export_id': job['export_id']}]
+    exports.run_export(exports.invocations[0], LambdaContext())
+    status_code, job = export_call(exports, signer, 'get_export', queryStringParameters={'export_id': job['export_id']})
+    assert job['export_status'] == 'Complete'
+    lines = (tmp_path / 'exports' / (job['export_id'] + '.csv')).read_text().splitlines()
+    assert len(lines) == 31
+    # A second delivery of the invocation leaves the finished job alone
+    exports.run_export(exports.invocations[0], LambdaContext())
+    assert export_call(exports, signer, 'get_export', queryStringParameters={'export_id': job['export_id']})[1]['export_status'] == 'Complete'
+
+
+def test_an_export_out_of_time_fails(exports, signer, tmp_path, monkeypatch):
+    status_code, job = export_call(exports, signer, 'create_export', body=json.dumps({'export_format': 'jsonl'}))
+    monkeypatch.setenv('scan_reserve_ms', '0')
+    exports.run_export(exports.invocations[0], LambdaContext(timeout_seconds=0))
+    status_code, job = export_call(exports, signer, 'get_export', queryStringParameters={'export_id': job['export_id']})
+    assert job['export_status'] == 'Failed'
+    assert not (tmp_path / 'exports').exists()
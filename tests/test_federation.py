@@ -0,0 +1,58 @@
+import json
+import time
+import urllib.parse
+
+import pytest
+
+from support import StandInEndpoint
+
+CREDENTIALS = {'AccessKeyId': 'ASIAEXAMPLE', 'SecretAccessKey': 'secret', 'SessionToken': 'session'}
+
+
+def signin_token(path):
+    return 200, json.dumps({'SigninToken': 'token-for-' + path.split('?')[0].strip('/')}).encode()
+
+
+def test_a_failed_call_is_retried(api, capsys):
+    responses = [(503, b'')]
+    def respond(path):
+        return responses.pop() if responses else signin_token(path)
+    with StandInEndpoint(respond) as endpoint:
+        client = api.FederationClient(endpoint=endpoint.url + '/federation', backoff_base=0.01)
+        assert client.get_signin_token(CREDENTIALS) == 'token-for-federation'
+    assert len(endpoint.calls) == 2
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(endpoint.calls[-1]).query)
+    assert query['Action'] == ['getSigninToken']
+    assert json.loads(query['Session'][0]) == {'sessionId': 'ASIAEXAMPLE', 'sessionKey': 'secret', 'sessionToken': 'session'}
+    assert sum(client.histogram().values()) == 2
+    assert 'Federation latency histogram (ms) ' + json.dumps(client.histogram()) in capsys.readouterr().out
+
+
+def test_a_call_that_times_out_fails_after_the_last_attempt(api):
+    def respond(path):
+        time.sleep(1)
+        return signin_token(path)
+    with StandInEndpoint(respond) as endpoint:
+        client = api.FederationClient(endpoint=endpoint.url + '/federation', read_timeout=0.2, max_attempts=2, backoff_base=0.01)
+        started = time.monotonic()
+        with pytest.raises(api.FederationError):
+            client.get_signin_token(CREDENTIALS)
+        assert time.monotonic() - started < 1
+    assert len(endpoint.calls) == 2
+    assert client.histogram()['<=250'] == 2
+
+
+def test_no_retry_is_started_past_the_deadline(api):
+    with StandInEndpoint(lambda path: (503, b'')) as endpoint:
+        client = api.FederationClient(endpoint=endpoint.url + '/federation', connect_timeout=0.5, max_attempts=3)
+        with pytest.raises(api.FederationError):
+            client.get_signin_token(CREDENTIALS, deadline=time.monotonic() + 0.2)
+    assert len(endpoint.calls) == 1
+
+
+def test_backoff_is_full_jitter_under_a_growing_ceiling(api):
+    client = api.FederationClient(backoff_base=0.1, backoff_cap=1.0)
+    for attempt, ceiling in ((0, 0.1), (1, 0.2), (2, 0.4), (5, 1.0)):
+        delays = [client.backoff(attempt) for _ in range(200)]
+        assert max(delays) <= ceiling
+        assert min(delays) < ceiling / 4
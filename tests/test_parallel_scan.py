@@ -0,0 +1,109 @@
+import json
+import time
+
+from boto3.dynamodb.conditions import Attr
+
+
+def put_requests(table, count, status=lambda n: 'Approved'):
+    with table.batch_writer() as batch:
+        for n in range(count):
+            batch.put_item(Item={
+                'id': 'r%04d' % n,
+                'request_time': '2026-10-01T00:%02d:%02dZ' % (n // 60 % 60, n % 60),
+                'requester': 'requester%d' % (n % 3),
+                'request_status': status(n),
+                'request_account': '111122223333',
+                'request_role': 'admin'
+            })
+
+
+def test_scan_reads_every_page_of_every_segment(api, request_table):
+    put_requests(request_table, 120)
+    # A small page size so that every segment returns several pages
+    scanner = api.ParallelScan(request_table, {'Limit': 7}, total_segments=4)
+    pages = list(scanner.pages())
+    ids = [item['id'] for page in pages for item in page]
+    assert len(pages) > 4
+    assert sorted(ids) == ['r%04d' % n for n in range(120)]
+    assert scanner.complete
+
+
+def test_max_items_bounds_the_merged_output_and_resumes(api, request_table):
+    put_requests(request_table, 150, status=lambda n: 'Requested' if n % 3 == 0 else 'Approved')
+    scan_kwargs = {'Limit': 20, 'FilterExpression': Attr('request_status').ne('Requested')}
+    seen = []
+    state = None
+    while True:
+        scanner = api.ParallelScan(request_table, scan_kwargs, total_segments=3)
+        if state is not None:
+            scanner.resume(state)
+        page = scanner.scan(max_items=9)
+        assert len(page) <= 9
+        seen.extend(item['id'] for item in page)
+        if scanner.complete:
+            break
+        # The position must survive the page token's JSON round trip
+        state = api.decode_scan_state(json.loads(json.dumps(scanner.segment_state)))
+    assert sorted(seen) == ['r%04d' % n for n in range(150) if n % 3]
+
+
+def test_scan_stops_at_the_deadline_and_resumes(api, request_table):
+    put_requests(request_table, 40)
+    scanner = api.ParallelScan(request_table, {'Limit': 5}, total_segments=2)
+    assert scanner.scan(deadline=time.monotonic() - 1) == []
+    assert not scanner.complete
+    assert len(scanner.scan()) == 40
+    assert scanner.complete
+
+
+def test_processed_requests_are_paged(api, request_table, signer):
+    put_requests(request_table, 90, status=lambda n: 'Requested' if n % 2 else 'Approved')
+    headers = signer.headers('reviewer', 'reviewer@example.com', ['reviewers'])
+    seen = []
+    query = {'limit': '10'}
+    while True:
+        response = api.get_processed_requests({'headers': headers, 'queryStringParameters': query}, None)
+        assert response['statusCode'] == 200
+        page = json.loads(response['body'])
+        assert len(page['items']) <= 10
+        seen.extend(item['id'] for item in page['items'])
+        if not page['next_token']:
+            break
+        query = {'limit': '10', 'next_token': page['next_token']}
+    assert sorted(seen) == ['r%04d' % n for n in range(90) if n % 2 == 0]
+
+
+class CountingTable:
+    """
+    It forwards to a table and records the Limit of every Scan call.
+    """
+    def __init__(self, table):
+        self.table = table
+        self.limits = []
+
+    def scan(self, **kwargs):
+        self.limits.append(kwargs.get('Limit'))
+        return self.table.scan(**kwargs)
+
+
+def test_a_page_reads_one_bounded_page_per_segment(api, request_table):
+    put_requests(request_table, 200)
+    table = CountingTable(request_table)
+    state = None
+    pages = 0
+    seen = []
+    while True:
+        scanner = api.ParallelScan(table, total_segments=4)
+        if state is not None:
+            scanner.resume(state)
+        calls = len(table.limits)
+        seen.extend(item['id'] for item in scanner.scan(max_items=10))
+        pages += 1
+        assert len(table.limits) - calls <= 4
+        if scanner.complete:
+            break
+        state = scanner.segment_state
+    assert set(table.limits) == {10}
+    assert sorted(seen) == ['r%04d' % n for n in range(200)]
+    # Each call returns up to 10 of the 40 items it reads
+    assert pages <= 200 // 10 * 4 + 4
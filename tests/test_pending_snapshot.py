@@ -0,0 +1,72 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import dbstream
+
+
+@pytest.fixture
+def snapshot(api, request_table, state_table, monkeypatch):
+    """
+    A new snapshot, with the number of times it read the pending queue in
+    api.loads.
+    """
+    monkeypatch.setattr(api, 'pending_snapshot', api.PendingSnapshot())
+    loads = []
+    load_pending = api.load_pending
+    def counting_load_pending(table):
+        loads.append(table)
+        return load_pending(table)
+    monkeypatch.setattr(api, 'load_pending', counting_load_pending)
+    monkeypatch.setattr(api, 'loads', loads, raising=False)
+    return api
+
+
+def add_pending(api, table, n):
+    """
+    Creates a pending request the way create_request does, with the version
+    bump of the stream handler.
+    """
+    request_time = api.format_timestamp(datetime.utcnow() - timedelta(minutes=n))
+    table.put_item(Item=api.new_request_item('requester%d@example.com' % n, '111122223333', 'admin', '60', 'incident', request_time))
+    dbstream.bump_pending_version()
+
+
+def pending(api, signer, if_none_match=None):
+    headers = signer.headers('reviewer', 'reviewer@example.com', ['reviewers'])
+    if if_none_match:
+        headers['If-None-Match'] = if_none_match
+    return api.get_pending_requests({'headers': headers, 'queryStringParameters': None}, None)
+
+
+def test_the_snapshot_is_reused_until_the_version_moves(snapshot, request_table, signer, monkeypatch):
+    # Every read of the queue is taken after the index settled
+    monkeypatch.setattr(snapshot, 'PENDING_SETTLE_SECONDS', 0)
+    for n in range(3):
+        add_pending(snapshot, request_table, n)
+    first = pending(snapshot, signer)
+    assert len(json.loads(first['body'])) == 3
+    second = pending(snapshot, signer)
+    assert second['body'] == first['body']
+    assert len(snapshot.loads) == 1
+    assert pending(snapshot, signer, first['headers']['ETag'])['statusCode'] == 304
+    assert len(snapshot.loads) == 1
+    add_pending(snapshot, request_table, 3)
+    third = pending(snapshot, signer, first['headers']['ETag'])
+    assert third['statusCode'] == 200
+    assert len(json.loads(third['body'])) == 4
+    assert len(snapshot.loads) == 2
+
+
+def test_a_snapshot_read_right_after_a_bump_is_read_again(snapshot, request_table, state_table, signer):
+    add_pending(snapshot, request_table, 0)
+    pending(snapshot, signer)
+    pending(snapshot, signer)
+    assert len(snapshot.loads) == 2
+    # With the bump a minute old, the last read is past the settle window
+    state_table.update_item(Key=snapshot.PENDING_VERSION_KEY, UpdateExpression='ADD bumped_at :back',
+                            ExpressionAttributeValues={':back': -60})
+    pending(snapshot, signer)
+    pending(snapshot, signer)
+    assert len(snapshot.loads) == 2
@@ -0,0 +1,18 @@
+import json
+
+import pytest
+
+
+@pytest.mark.parametrize('handler', ['get_requests', 'get_pending_requests', 'get_all_requests'])
+@pytest.mark.parametrize('query', [{'from': 'yesterday'}, {'to': '2026-13-45T00:00:00Z'}, {'limit': 'ten'}])
+def test_malformed_query_parameters_are_rejected(api, request_table, signer, handler, query):
+    headers = signer.headers('someone', 'someone@example.com', ['reviewers', 'auditors'])
+    response = getattr(api, handler)({'headers': headers, 'queryStringParameters': query}, None)
+    assert response['statusCode'] == 400
+    assert json.loads(response['body']).startswith('Invalid ')
+
+
+def test_time_range_accepts_both_timestamp_formats(api):
+    event = {'queryStringParameters': {'from': '10/01/26 08:00:00', 'to': '2026-10-02T08:00:00Z'}}
+    assert api.request_time_range(event) == ('2026-10-01T08:00:00Z', '2026-10-02T08:00:00Z')
+    assert api.request_time_range({}) == (None, None)
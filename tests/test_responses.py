@@ -0,0 +1,47 @@
+import base64
+import gzip
+import json
+
+ROWS = [{'id': 'r%04d' % n, 'request_status': 'Requested'} for n in range(200)]
+
+
+def test_a_large_body_is_gzipped_for_callers_that_accept_it(api):
+    event = {'headers': {'Accept-Encoding': 'gzip, deflate, br'}}
+    response = api.encode_response(event, 200, ROWS)
+    assert response['isBase64Encoded'] is True
+    assert response['headers']['Content-Encoding'] == 'gzip'
+    assert response['headers']['Vary'] == 'Accept-Encoding'
+    assert json.loads(gzip.decompress(base64.b64decode(response['body']))) == ROWS
+    # Small bodies and callers without gzip get plain JSON
+    for event, result in (({'headers': {'accept-encoding': 'gzip'}}, ROWS[:2]), ({'headers': {}}, ROWS)):
+        response = api.encode_response(event, 200, result)
+        assert 'Content-Encoding' not in response['headers']
+        assert json.loads(response['body']) == result
+
+
+def test_a_matching_if_none_match_answers_304(api):
+    plain = api.encode_response({'headers': {}}, 200, ROWS, etag=True)
+    zipped = api.encode_response({'headers': {'Accept-Encoding': 'gzip'}}, 200, ROWS, etag=True)
+    # The two representations carry different tags
+    assert plain['headers']['ETag'] != zipped['headers']['ETag']
+    for if_none_match in (plain['headers']['ETag'], 'W/' + plain['headers']['ETag'], '"other", ' + plain['headers']['ETag']):
+        response = api.encode_response({'headers': {'If-None-Match': if_none_match}}, 200, ROWS, etag=True)
+        assert response['statusCode'] == 304
+        assert response['body'] == ''
+        assert response['headers']['ETag'] == plain['headers']['ETag']
+    assert api.encode_response({'headers': {'If-None-Match': zipped['headers']['ETag']}}, 200, ROWS, etag=True)['statusCode'] == 200
+    # Only 200 responses are tagged
+    assert 'ETag' not in api.encode_response({'headers': {}}, 400, 'Error', etag=True)['headers']
+
+
+def test_a_base64_encoded_post_body_is_decoded(api, request_table, signer):
+    body = {'request_account': '111122223333', 'request_role': 'admin', 'request_duration': '60', 'request_justification': 'incident'}
+    event = {
+        'headers': signer.headers('requester', 'requester@example.com', ['aws-temp#111122223333#admin']),
+        'body': base64.b64encode(json.dumps(body).encode()).decode(),
+        'isBase64Encoded': True
+    }
+    response = api.create_request(event, None)
+    assert response['statusCode'] == 200
+    items = request_table.scan()['Items']
+    assert [(item['request_role'], item['request_justification']) for item in items] == [('admin', 'incident')]
@@ -0,0 +1,51 @@
+import json
+from datetime import datetime, timedelta
+
+REVIEWER = 'reviewer@example.com'
+
+
+def put_pending(api, table, requester, minutes):
+    request_time = api.format_timestamp(datetime.utcnow() - timedelta(minutes=minutes))
+    item = api.new_request_item(requester, '111122223333', 'admin', '60', 'incident', request_time)
+    table.put_item(Item=item)
+    return {'id': item['id'], 'request_time': request_time}
+
+
+def review_requests(api, signer, reviews, groups=('reviewers',)):
+    headers = signer.headers('reviewer', REVIEWER, groups)
+    return api.review_requests({'headers': headers, 'body': json.dumps({'reviews': reviews})}, None)
+
+
+def test_every_entry_of_a_mixed_batch_gets_its_own_result(api, request_table, signer):
+    approved = put_pending(api, request_table, 'requester1@example.com', 1)
+    rejected = put_pending(api, request_table, 'requester2@example.com', 2)
+    own = put_pending(api, request_table, REVIEWER, 3)
+    already = put_pending(api, request_table, 'requester4@example.com', 4)
+    no_duration = put_pending(api, request_table, 'requester5@example.com', 5)
+    assert api.apply_review(request_table, already['id'], already['request_time'], 'reject', 'other@example.com')
+    reviews = [
+        dict(approved, decision='approve', request_duration='30'),
+        dict(rejected, decision='reject'),
+        dict(own, decision='approve', request_duration='30'),
+        dict(already, decision='approve', request_duration='30'),
+        dict(no_duration, decision='approve')
+    ]
+    response = review_requests(api, signer, reviews)
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert (body['succeeded'], body['failed']) == (2, 3)
+    results = body['results']
+    assert [(entry['id'], entry['decision'], entry['success']) for entry in results] == [
+        (review['id'], review['decision'], n < 2) for n, review in enumerate(reviews)]
+    assert [entry.get('error') for entry in results] == [
+        None, None, api.REVIEW_CONDITION_FAILED, api.REVIEW_CONDITION_FAILED, "Error, request_duration is required to approve"]
+    statuses = [request_table.get_item(Key=key)['Item']['request_status'] for key in (approved, rejected, own, already, no_duration)]
+    assert statuses == ['Approved', 'Rejected', 'Requested', 'Rejected', 'Requested']
+
+
+def test_a_batch_needs_the_reviewer_group_and_a_bounded_list(api, request_table, signer):
+    pending = put_pending(api, request_table, 'requester1@example.com', 1)
+    assert review_requests(api, signer, [dict(pending, decision='reject')], groups=())['statusCode'] == 400
+    assert review_requests(api, signer, [])['statusCode'] == 400
+    assert review_requests(api, signer, [dict(pending, decision='reject')] * (api.MAX_BATCH_REVIEWS + 1))['statusCode'] == 400
+    assert request_table.get_item(Key=pending)['Item']['request_status'] == 'Requested'
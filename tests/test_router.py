@@ -0,0 +1,28 @@
+import json
+
+import pytest
+
+
+def test_every_route_reaches_its_loader_method(api):
+    for (method, path), name in api.ROUTES.items():
+        assert api.route_table[(method, path)] == getattr(api.loader, name)
+        # Without tokens the method itself answers, with a 401
+        for resource in (path, path + '/'):
+            response = api.route({'httpMethod': method, 'resource': resource, 'headers': {}}, None)
+            assert response['statusCode'] == 401, (method, resource)
+
+
+def test_a_routed_call_answers_like_its_function(api, request_table, signer):
+    headers = signer.headers('requester', 'requester@example.com')
+    routed = api.route({'httpMethod': 'GET', 'resource': '/get_requests', 'headers': headers, 'queryStringParameters': None}, None)
+    direct = api.get_requests({'headers': headers, 'queryStringParameters': None}, None)
+    assert routed['statusCode'] == 200
+    assert routed['body'] == direct['body']
+
+
+@pytest.mark.parametrize('method, path', [('DELETE', '/get_requests'), ('POST', '/get_requests'), ('GET', '/create_request'), ('GET', '/unknown'), (None, '')])
+def test_an_unknown_route_answers_404(api, method, path):
+    response = api.route({'httpMethod': method, 'resource': path, 'headers': {}}, None)
+    assert response['statusCode'] == 404
+    assert response['headers']['Content-Type'] == 'application/json'
+    assert json.loads(response['body']) == 'Not found'
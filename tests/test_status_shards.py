@@ -0,0 +1,48 @@
+import time
+
+import pytest
+
+LIMIT = 3
+
+
+@pytest.fixture
+def sharded(api, request_table, monkeypatch):
+    monkeypatch.setenv('status_shards', '2')
+    return api
+
+
+def put_request(table, shard, second, expired=False):
+    request_time = '2026-10-01T08:00:%02dZ' % second
+    table.put_item(Item={
+        'id': 'requester%d@example.com#111122223333#admin#%s' % (second, request_time),
+        'request_time': request_time,
+        'request_status': 'Requested',
+        'status_shard': 'Requested#%d' % shard,
+        'request_ttl': int(time.time()) + (-60 if expired else 3600)
+    })
+    return request_time
+
+
+def read_pages(api, table):
+    pages = []
+    positions = None
+    while True:
+        items, positions = api.query_status_shards(
+            table, 'Requested', filter_expression=api.Attr('request_ttl').gt(int(time.time())),
+            limit=LIMIT, positions=positions)
+        pages.append([item['request_time'] for item in items])
+        if positions is None:
+            return pages
+
+
+def test_pages_stay_in_order_when_a_shard_filters_out_a_whole_page(sharded, request_table):
+    # The newest page of shard 0 has expired, its next live request is
+    # newer than every request of shard 1
+    for second in (50, 49, 48):
+        put_request(request_table, 0, second, expired=True)
+    live = [put_request(request_table, 0, 47)]
+    live += [put_request(request_table, 1, second) for second in (40, 39, 38, 37)]
+    live += [put_request(request_table, 0, second) for second in (30, 20)]
+    pages = read_pages(sharded, request_table)
+    assert all(len(page) <= LIMIT for page in pages)
+    assert [request_time for page in pages for request_time in page] == sorted(live, reverse=True)
@@ -0,0 +1,68 @@
+from botocore.exceptions import ClientError
+
+from stream_records import inserted, record, request_item, reviewed
+
+
+def failed_sequence(response):
+    return [failure['itemIdentifier'] for failure in response['batchItemFailures']]
+
+
+def test_every_record_of_a_batch_is_processed(dbstream):
+    records = [inserted(1, 1), inserted(2, 2), reviewed(3, 3, 'Approved'), reviewed(4, 4, 'Rejected'), inserted(5, 5)]
+    assert dbstream.lambda_handler({'Records': records}, None) == {'batchItemFailures': []}
+    assert sorted(message['Subject'] for message in dbstream.sent['sns']) == [
+        'Privileged Access request for requester%d@example.com' % n for n in (1, 2, 5)]
+    assert sorted(dbstream.sent['ses']) == [('approved', 'requester3@example.com'), ('rejected', 'requester4@example.com')]
+
+
+def test_a_malformed_record_fails_itself_and_the_records_after_it(dbstream):
+    broken = record(3, 'INSERT', new={k: v for k, v in request_item(3).items() if k != 'request_role'})
+    records = [inserted(1, 1), inserted(2, 2), broken, inserted(4, 4), reviewed(5, 5, 'Approved')]
+    response = dbstream.lambda_handler({'Records': records}, None)
+    assert failed_sequence(response) == [broken['dynamodb']['SequenceNumber']]
+    # The shard resumes from the failed record, so only the ones before it notify
+    assert sorted(message['Subject'] for message in dbstream.sent['sns']) == [
+        'Privileged Access request for requester1@example.com', 'Privileged Access request for requester2@example.com']
+    assert dbstream.sent['ses'] == []
+
+
+def test_the_earliest_failed_notification_is_reported(dbstream, monkeypatch):
+    publish = dbstream.sns_client.publish
+    def publish_failing_for_requester3(**kwargs):
+        if 'requester3@' in kwargs['Subject']:
+            raise ClientError({'Error': {'Code': 'Throttling', 'Message': 'Rate exceeded'}}, 'Publish')
+        return publish(**kwargs)
+    monkeypatch.setattr(dbstream.sns_client, 'publish', publish_failing_for_requester3)
+    records = [inserted(n, n) for n in range(1, 7)]
+    response = dbstream.lambda_handler({'Records': records}, None)
+    assert failed_sequence(response) == [records[2]['dynamodb']['SequenceNumber']]
+
+
+def test_a_rejected_email_fails_its_record(dbstream, monkeypatch):
+    def send_bulk(**kwargs):
+        return {'Status': [
+            {'Status': 'MessageRejected', 'Error': 'Address blacklisted'} if 'requester2@' in destination['Destination']['ToAddresses'][0] else {'Status': 'Success'}
+            for destination in kwargs['Destinations']]}
+    monkeypatch.setattr(dbstream.ses_client, 'send_bulk_templated_email', send_bulk)
+    records = [reviewed(1, 1, 'Approved'), reviewed(2, 2, 'Approved'), reviewed(3, 3, 'Approved')]
+    response = dbstream.lambda_handler({'Records': records}, None)
+    assert failed_sequence(response) == [records[1]['dynamodb']['SequenceNumber']]
+
+
+def test_replaying_from_the_failed_record_completes_the_batch(dbstream):
+    broken = record(2, 'INSERT', new={k: v for k, v in request_item(2).items() if k != 'requester'})
+    records = [inserted(1, 1), broken, inserted(3, 3)]
+    assert failed_sequence(dbstream.lambda_handler({'Records': records}, None)) == [broken['dynamodb']['SequenceNumber']]
+    # The record is fixed upstream and the shard is retried from it
+    retried = [inserted(2, 2), inserted(3, 3)]
+    assert dbstream.lambda_handler({'Records': retried}, None) == {'batchItemFailures': []}
+    assert len(dbstream.sent['sns']) == 3
+
+
+def test_a_write_that_keeps_the_status_does_not_notify(dbstream):
+    # A status shard rewrite of requests reviewed before the upgrade
+    approved = record(1, 'MODIFY', new=request_item(1, 'Approved', status_shard='Approved#3'), old=request_item(1, 'Approved'))
+    rejected = record(2, 'MODIFY', new=request_item(2, 'Rejected', status_shard='Rejected#0'), old=request_item(2, 'Rejected'))
+    assert dbstream.lambda_handler({'Records': [approved, rejected]}, None) == {'batchItemFailures': []}
+    assert dbstream.sent['ses'] == []
+    assert dbstream.sent['sns'] == []
@@ -0,0 +1,59 @@
+import pytest
+from boto3.dynamodb.conditions import Attr
+
+from stream_records import inserted, record, request_item, reviewed
+from support import create_table
+
+DAY = '2026-09-21'
+
+
+@pytest.fixture
+def aggregates_table(dbstream, monkeypatch):
+    monkeypatch.setenv('aggregates_table', 'requestsAggregates')
+    return create_table('aggregatesTable', 'requestsAggregates')
+
+
+def counts(table, dimension):
+    item = table.get_item(Key={'pk': dimension, 'sk': DAY}).get('Item', {})
+    return {name: int(value) for name, value in item.items() if name not in ('pk', 'sk')}
+
+
+def test_counter_updates_of_each_kind_of_record(dbstream):
+    assert dbstream.counter_updates(inserted(1, 1)) == [
+        ('status', DAY, 'Requested'), ('account', DAY, '111122223333#Requested'), ('role', DAY, 'admin#Requested')]
+    assert ('reviewer', DAY, 'reviewer@example.com#Approved') in dbstream.counter_updates(reviewed(2, 2, 'Approved'))
+    # A write that keeps the status and a deletion count nothing
+    assert dbstream.counter_updates(record(3, 'MODIFY', new=request_item(3, status_shard='Requested#1'), old=request_item(3))) == []
+    assert dbstream.counter_updates(record(4, 'REMOVE', old=request_item(4))) == []
+
+
+def test_only_the_migrated_copy_of_a_request_is_not_counted(dbstream):
+    migrated = {'migrated_from': '2026-10-01 08:00:05'}
+    assert dbstream.counter_updates(inserted(5, 5, **migrated)) == []
+    approved = record(6, 'MODIFY', new=request_item(5, 'Approved', **migrated), old=request_item(5, **migrated))
+    assert ('status', DAY, 'Approved') in dbstream.counter_updates(approved)
+
+
+def test_counter_chunks_fit_in_a_transaction(dbstream):
+    # One day per record, so every record adds its own counter items
+    updates = [(position, 'event%d' % position, [('status', 'day%d' % position, 'Requested'), ('account', 'day%d' % position, 'a#Requested')])
+               for position in range(80)]
+    chunks = dbstream.counter_chunks(updates)
+    assert [entry for chunk in chunks for entry in chunk] == updates
+    for chunk in chunks:
+        keys = set((dimension, day) for entry in chunk for dimension, day, attribute in entry[2])
+        assert len(chunk) + len(keys) <= dbstream.TRANSACT_LIMIT
+    assert len(chunks) == 3
+
+
+def test_a_redelivered_batch_leaves_the_counters_unchanged(dbstream, aggregates_table):
+    records = [inserted(1, 1), inserted(2, 2), reviewed(3, 3, 'Approved')]
+    assert dbstream.lambda_handler({'Records': records}, None) == {'batchItemFailures': []}
+    assert counts(aggregates_table, 'status') == {'Requested': 2, 'Approved': 1}
+    # The shard is retried with the same records and one new record
+    redelivered = records + [reviewed(4, 1, 'Rejected')]
+    assert dbstream.lambda_handler({'Records': redelivered}, None) == {'batchItemFailures': []}
+    assert counts(aggregates_table, 'status') == {'Requested': 2, 'Approved': 1, 'Rejected': 1}
+    assert counts(aggregates_table, 'reviewer') == {'reviewer@example.com#Approved': 1, 'reviewer@example.com#Rejected': 1}
+    markers = aggregates_table.scan(FilterExpression=Attr('sk').eq('applied'))['Items']
+    assert sorted(marker['pk'] for marker in markers) == ['event#event%d' % n for n in range(1, 5)]
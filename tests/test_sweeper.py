@@ -0,0 +1,96 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from support import LambdaContext
+
+REVIEWER = 'reviewer@example.com'
+
+
+@pytest.fixture
+def sweeper(api, request_table, state_table):
+    return api
+
+
+def put_grant(table, api, n, ended_at):
+    """
+    Puts an approved request whose grant ended at the given UTC datetime.
+    """
+    request_time = api.format_timestamp(ended_at - timedelta(hours=1))
+    request_id = 'requester' + str(n) + '@example.com#111122223333#admin#' + request_time
+    table.put_item(Item={
+        'id': request_id,
+        'request_time': request_time,
+        'requester': 'requester' + str(n) + '@example.com',
+        'request_account': '111122223333',
+        'request_role': 'admin',
+        'request_status': 'Approved',
+        'reviewer': REVIEWER,
+        'expiration_time': api.format_timestamp(ended_at),
+        'expiry_bucket': api.expiry_bucket_for(ended_at)
+    })
+    return {'id': request_id, 'request_time': request_time}
+
+
+def status_of(table, key):
+    return table.get_item(Key=key)['Item']['request_status']
+
+
+def set_watermark(api, state_table, value):
+    state_table.put_item(Item=dict(api.SWEEP_WATERMARK_KEY, bucket=api.expiry_bucket_for(value)))
+
+
+def test_a_run_catches_up_every_bucket_since_the_watermark(sweeper, request_table, state_table):
+    now = datetime.utcnow()
+    # The sweeper was down for three hours
+    set_watermark(sweeper, state_table, now - timedelta(hours=3))
+    keys = [put_grant(request_table, sweeper, n, now - timedelta(minutes=minutes)) for n, minutes in enumerate((170, 90, 20))]
+    assert sweeper.sweep_expired({}, LambdaContext()) == {'swept': 3}
+    assert [status_of(request_table, key) for key in keys] == ['Ended'] * 3
+    watermark = sweeper.read_sweep_watermark(state_table)
+    assert watermark >= sweeper.expiry_bucket_for(now - timedelta(minutes=1))
+    assert watermark < sweeper.expiry_bucket_for(datetime.utcnow())
+
+
+def test_a_failed_transition_holds_the_watermark(sweeper, request_table, state_table, monkeypatch):
+    now = datetime.utcnow()
+    set_watermark(sweeper, state_table, now - timedelta(hours=3))
+    failing = put_grant(request_table, sweeper, 1, now - timedelta(minutes=120))
+    later = put_grant(request_table, sweeper, 2, now - timedelta(minutes=60))
+    transition_status = sweeper.transition_status
+    def flaky(table, key, old_status, new_status):
+        if key == failing:
+            raise RuntimeError('throttled')
+        return transition_status(table, key, old_status, new_status)
+    monkeypatch.setattr(sweeper, 'transition_status', flaky)
+    assert sweeper.sweep_expired({}, LambdaContext()) == {'swept': 1}
+    assert status_of(request_table, later) == 'Ended'
+    assert sweeper.read_sweep_watermark(state_table) == sweeper.expiry_bucket_for(now - timedelta(minutes=121))
+    monkeypatch.setattr(sweeper, 'transition_status', transition_status)
+    assert sweeper.sweep_expired({}, LambdaContext()) == {'swept': 1}
+    assert status_of(request_table, failing) == 'Ended'
+    assert sweeper.read_sweep_watermark(state_table) >= sweeper.expiry_bucket_for(now - timedelta(minutes=1))
+
+
+def test_a_run_stopped_by_its_deadline_is_continued(sweeper, request_table, state_table, monkeypatch):
+    now = datetime.utcnow()
+    set_watermark(sweeper, state_table, now - timedelta(hours=3))
+    first = put_grant(request_table, sweeper, 1, now - timedelta(minutes=150))
+    second = put_grant(request_table, sweeper, 2, now - timedelta(minutes=30))
+    context = LambdaContext(timeout_seconds=2)
+    sweep_bucket = sweeper.sweep_bucket
+    def slow(table, bucket, epoch_time_now, now):
+        result = sweep_bucket(table, bucket, epoch_time_now, now)
+        if result[0]:
+            # The invocation runs out of time after the first grant
+            time.sleep(max(0, context.deadline - time.monotonic()) + 0.05)
+        return result
+    monkeypatch.setattr(sweeper, 'sweep_bucket', slow)
+    monkeypatch.setenv('scan_reserve_ms', '0')
+    assert sweeper.sweep_expired({}, context) == {'swept': 1}
+    assert status_of(request_table, second) == 'Approved'
+    assert sweeper.read_sweep_watermark(state_table) == sweeper.expiry_bucket_for(now - timedelta(minutes=150))
+    assert sweeper.sweep_expired({}, LambdaContext()) == {'swept': 1}
+    assert status_of(request_table, first) == 'Ended'
+    assert status_of(request_table, second) == 'Ended'
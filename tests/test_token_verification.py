@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+from support import ISSUER, StandInEndpoint, jwks_endpoint
+
+
+@pytest.fixture
+def jwks_down(api):
+    """
+    A JWKS endpoint that answers every request with a 503.
+    """
+    with StandInEndpoint(lambda path: (503, b'')) as endpoint:
+        yield endpoint
+
+
+def test_an_unreachable_jwks_endpoint_answers_503(api, signer, jwks_down, monkeypatch):
+    cache = api.JwksCache(uri=jwks_down.url + '/v1/keys')
+    cache.path = None
+    monkeypatch.setattr(api, 'token_verifier', api.TokenVerifier(jwks=cache))
+    api.claims_cache.entries.clear()
+    headers = signer.headers('someone', 'someone@example.com')
+    for _ in range(5):
+        response = api.get_requests({'headers': headers}, None)
+        assert response['statusCode'] == 503
+    # The failed fetch is not retried on every call
+    assert len(jwks_down.calls) == 1
+
+
+def test_fetch_is_retried_after_the_refresh_interval(api, jwks_down):
+    cache = api.JwksCache(uri=jwks_down.url + '/v1/keys', min_refresh_seconds=30)
+    cache.path = None
+    with pytest.raises(api.SigningKeysUnavailable):
+        cache.get_key('test-key')
+    cache.attempted_at -= 31
+    with pytest.raises(api.SigningKeysUnavailable):
+        cache.get_key('test-key')
+    assert len(jwks_down.calls) == 2
+
+
+def test_unknown_kid_is_unauthorized(api, request_table, signer, monkeypatch):
+    monkeypatch.setattr(api, 'token_verifier', api.TokenVerifier(jwks=api.JwksCache(path=signer.jwks_path)))
+    api.claims_cache.entries.clear()
+    headers = signer.headers('someone', 'someone@example.com')
+    assert api.get_requests({'headers': headers}, None)['statusCode'] == 200
+    token = signer.jwt.encode({'iss': ISSUER, 'sub': 'someone', 'exp': 2 ** 31}, signer.key, algorithm='RS256', headers={'kid': 'other'})
+    response = api.get_requests({'headers': {'Authorization': 'Bearer ' + token + ' ' + token}}, None)
+    assert response['statusCode'] == 401
+    assert json.loads(response['body']) == 'Unauthorized'
+
+
+def test_keys_are_fetched_from_the_jwks_endpoint(api, request_table, signer, monkeypatch):
+    with jwks_endpoint(signer) as endpoint:
+        cache = api.JwksCache(uri=endpoint.url + '/v1/keys')
+        cache.path = None
+        monkeypatch.setattr(api, 'token_verifier', api.TokenVerifier(jwks=cache))
+        api.claims_cache.entries.clear()
+        headers = signer.headers('someone', 'someone@example.com')
+        assert api.get_requests({'headers': headers}, None)['statusCode'] == 200
+        assert endpoint.calls == ['/v1/keys']
@@ -1,19 +1,37 @@
-import json, urllib, sys
-import requests
-import jwt
+import json, urllib, urllib.parse, sys
+import importlib
 from boto3.dynamodb.conditions import Key, Attr
 from botocore.exceptions import ClientError
+from botocore.config import Config
 import boto3
 import logging
 import traceback
 from datetime import datetime, timedelta
 import time
 import os
+import threading
+import heapq
+import itertools
+import zlib
+import functools
+import random
+import calendar
+from collections import OrderedDict
+from abc import ABC, abstractmethod
+import base64
+import hmac
+import hashlib
+import gzip
+import uuid
+import queue
+import csv
+import io
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from aws_xray_sdk.core import xray_recorder
-from aws_xray_sdk.core import patch_all
-import argparse
+from aws_xray_sdk.core import patch
 
-patch_all()
+patch(['botocore'])
 
 def enable_logging():
     root = logging.getLogger()
@@ -33,285 +51,2824 @@ def deep_get(d, keys, default=None):
     return deep_get(d.get(keys[0]), keys[1:], default)
 
 
+# ********** LAZY IMPORTS ************#
+
+# Modules only some entry points need are imported on first use, so they are
+# kept out of the cold start of the other functions. Those in XRAY_PATCHED
+# are patched for X-Ray tracing when they are imported.
+XRAY_PATCHED = ['requests']
+lazy_modules = {}
+lazy_modules_lock = threading.Lock()
+
+def lazy_import(name):
+    module = lazy_modules.get(name)
+    if module is None:
+        with lazy_modules_lock:
+            module = lazy_modules.get(name)
+            if module is None:
+                module = importlib.import_module(name)
+                if name in XRAY_PATCHED:
+                    patch([name])
+                lazy_modules[name] = module
+    return module
+
+
+# ********** TIMESTAMPS ************#
+
+# Timestamps are stored as ISO-8601 UTC strings so that they sort lexically in
+# time order and can be used in key conditions on the request_time indexes.
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# Format written by earlier releases, strftime('%x %X') in the C locale
+LEGACY_TIMESTAMP_FORMAT = '%m/%d/%y %H:%M:%S'
+
+def format_timestamp(value):
+    return value.strftime(TIMESTAMP_FORMAT)
+
+def timestamp_now():
+    return format_timestamp(datetime.utcnow())
+
+def parse_timestamp(value):
+    try:
+        return datetime.strptime(value, TIMESTAMP_FORMAT)
+    except ValueError:
+        return datetime.strptime(value, LEGACY_TIMESTAMP_FORMAT)
+
+def is_legacy_timestamp(value):
+    return bool(value) and '/' in value
+
+# Requests that are not reviewed within this time expire
+PENDING_REQUEST_TTL = timedelta(days=1)
+
+def request_ttl_for(request_time):
+    """
+    Returns the request_ttl epoch seconds of a request made at request_time.
+    """
+    return calendar.timegm((parse_timestamp(request_time) + PENDING_REQUEST_TTL).timetuple())
+
+class QueryParameterError(ValueError):
+    pass
+
+def request_time_range(event):
+    """
+    Returns the optional 'from' and 'to' query string parameters as stored
+    timestamps, None for each one that is absent, or raises
+    QueryParameterError if one is not a timestamp.
+    """
+    time_range = []
+    for name in ('from', 'to'):
+        value = deep_get(event, ["queryStringParameters", name])
+        if value:
+            try:
+                value = format_timestamp(parse_timestamp(value))
+            except ValueError:
+                raise QueryParameterError("Invalid " + name + " parameter " + value + ", expected " + TIMESTAMP_FORMAT)
+        time_range.append(value)
+    return tuple(time_range)
+
+def request_time_condition(event):
+    """
+    Builds a request_time range key condition from the optional 'from' and
+    'to' query string parameters, or returns None if neither is present.
+    """
+    time_from, time_to = request_time_range(event)
+    if time_from and time_to:
+        return Key('request_time').between(time_from, time_to)
+    if time_from:
+        return Key('request_time').gte(time_from)
+    if time_to:
+        return Key('request_time').lte(time_to)
+    return None
+
+
+# ********** AWS CLIENTS ************#
+
+# Clients and resources are created once per execution environment and shared
+# by every invocation that lands on a warm container, so only the first call
+# pays for client construction, endpoint resolution and the TLS handshake.
+client_config = Config(
+    max_pool_connections=int(os.environ.get('max_pool_connections', 25)),
+    tcp_keepalive=True,
+    connect_timeout=2,
+    read_timeout=10,
+    retries={'max_attempts': 3, 'mode': 'standard'}
+)
+aws_registry = {}
+aws_registry_lock = threading.Lock()
+
+def get_aws(kind, service_name, region_name=None):
+    key = (kind, service_name, region_name)
+    aws = aws_registry.get(key)
+    if aws is None:
+        with aws_registry_lock:
+            aws = aws_registry.get(key)
+            if aws is None:
+                # boto3's default session is not thread safe, use a dedicated one
+                session = boto3.session.Session()
+                factory = session.client if kind == 'client' else session.resource
+                aws = factory(service_name, region_name=region_name, config=client_config)
+                aws_registry[key] = aws
+    return aws
+
+def get_client(service_name, region_name=None):
+    return get_aws('client', service_name, region_name)
+
+def get_resource(service_name, region_name=None):
+    return get_aws('resource', service_name, region_name)
+
+def get_table(table_name=None, region_name=None):
+    table_name = table_name or os.environ['db_table']
+    key = ('table', table_name, region_name)
+    table = aws_registry.get(key)
+    if table is None:
+        table = get_resource('dynamodb', region_name).Table(table_name)
+        aws_registry[key] = table
+    return table
+
+
+# ********** ACTIVE GRANTS ************#
+
+# Approved requests carry a grant_key (requester#account#role) and a copy of
+# their expiration_time in grant_expiration, the hash and range keys of the
+# sparse active-grant-index. Both are removed when the request ends, so the
+# federation endpoints find an active grant with a single keyed read, and
+# confirm it with a consistent read of the request before using it.
+
+def make_grant_key(requester, account, role):
+    return requester + '#' + account + '#' + role
+
+def grant_key_for_id(id, request_time):
+    # ids are built as requester#account#role#request_time
+    suffix = '#' + request_time
+    if not id.endswith(suffix):
+        raise ValueError("Unexpected request id " + id)
+    return id[:-len(suffix)]
+
+
+# ********** CREDENTIAL CACHE ************#
+
+class CredentialCache:
+    """
+    It caches assumed role credentials per grant (the id of the approved
+    request), so that refreshing the console link or the CLI credentials
+    within an approved window does not call STS again.
+
+    Entries are sealed with AES-GCM under a key that is generated when the
+    execution environment starts and never leaves it, and they expire at the
+    earlier of the STS expiration and the request's expiration_time. A grant
+    can end in another function, which cannot reach this cache, so
+    get_role_credentials checks that the grant is still active before it
+    serves an entry.
+    """
+    def __init__(self, max_entries=None, margin_seconds=None):
+        """
+        Initializes an empty cache.
+
+        :param max_entries:     The number of grants kept, least recently used first out.
+        :param margin_seconds:  Entries this close to expiring are treated as expired.
+        """
+        self.max_entries = max_entries or int(os.environ.get('credential_cache_size', 256))
+        self.margin_seconds = margin_seconds if margin_seconds is not None else int(os.environ.get('credential_cache_margin', 60))
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.cipher = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, grant_id):
+        with self.lock:
+            entry = self.entries.get(grant_id)
+            if entry is not None and entry[0] - self.margin_seconds <= time.time():
+                del self.entries[grant_id]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(grant_id)
+            self.hits += 1
+        expires_at, nonce, sealed = entry
+        return json.loads(self.cipher.decrypt(nonce, sealed, grant_id.encode()))
+
+    def put(self, grant_id, credentials, expires_at):
+        with self.lock:
+            if self.cipher is None:
+                aead = lazy_import('cryptography.hazmat.primitives.ciphers.aead')
+                self.cipher = aead.AESGCM(aead.AESGCM.generate_key(bit_length=256))
+        nonce = os.urandom(12)
+        sealed = self.cipher.encrypt(nonce, json.dumps(credentials).encode(), grant_id.encode())
+        with self.lock:
+            self.entries[grant_id] = (expires_at, nonce, sealed)
+            self.entries.move_to_end(grant_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, grant_id):
+        with self.lock:
+            self.entries.pop(grant_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries)}
+
+credential_cache = CredentialCache()
+
+def emit_metrics(metrics):
+    """
+    Prints metrics in the CloudWatch embedded metric format, so they are
+    picked up from the function log.
+
+    :param metrics:  A dict of metric name to a (value, unit) tuple.
+    """
+    document = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': 'TemporaryElevatedAccessBroker',
+                'Dimensions': [[]],
+                'Metrics': [{'Name': name, 'Unit': unit} for name, (value, unit) in metrics.items()]
+            }]
+        }
+    }
+    for name, (value, unit) in metrics.items():
+        document[name] = value
+    print(json.dumps(document))
+
+def emit_cache_metrics(hit):
+    emit_metrics({
+        'CredentialCacheHit': (1 if hit else 0, 'Count'),
+        'CredentialCacheMiss': (0 if hit else 1, 'Count')
+    })
+
+def grant_is_active(table, grant):
+    """
+    Reads the request of a grant with a consistent read, as the
+    active-grant-index is only eventually consistent, and tells whether it
+    is still approved and active.
+    """
+    item = table.get_item(
+        Key={'id': grant['id'], 'request_time': grant['request_time']},
+        ConsistentRead=True,
+        ProjectionExpression='request_status, grant_key'
+    ).get('Item')
+    return bool(item) and item.get('request_status') == 'Approved' and item.get('grant_key') == grant['grant_key']
+
+def get_role_credentials(table, requester, account, role, grant):
+    """
+    Returns credentials for the target role, from the cache when the same
+    grant has already assumed it, or None if the grant is no longer active.
+
+    :param grant:  The active-grant-index item of the approved request.
+    """
+    if not grant_is_active(table, grant):
+        credential_cache.invalidate(grant['id'])
+        return None
+    credentials = credential_cache.get(grant['id'])
+    emit_cache_metrics(credentials is not None)
+    if credentials is None:
+        assumed_role_object = get_client('sts').assume_role(
+            RoleArn="arn:aws:iam::" + account + ":role/" + role,
+            RoleSessionName= requester + "-" + role,
+            )
+        sts_credentials = assumed_role_object['Credentials']
+        credentials = {
+            'AccessKeyId': sts_credentials['AccessKeyId'],
+            'SecretAccessKey': sts_credentials['SecretAccessKey'],
+            'SessionToken': sts_credentials['SessionToken']
+        }
+        expires_at = min(sts_credentials['Expiration'].timestamp(), calendar.timegm(parse_timestamp(grant['grant_expiration']).timetuple()))
+        credential_cache.put(grant['id'], credentials, expires_at)
+    return credentials
+
+
+
+# ********** SIGN-IN FEDERATION ************#
+
+class FederationError(Exception):
+    pass
+
+class FederationClient:
+    """
+    It exchanges role credentials for a console sign-in token.
+
+    The client keeps one requests.Session per execution environment, so the
+    TLS connection to the federation endpoint is reused across invocations.
+    Calls have connect/read timeouts and are retried on connection errors,
+    throttling and 5xx responses with a full-jitter exponential backoff.
+    The endpoint can be pointed at a stand-in server with the
+    federation_endpoint env var.
+    """
+    LATENCY_BUCKETS_MS = [25, 50, 100, 250, 500, 1000, 2500, 5000]
+    RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+    def __init__(self, endpoint=None, connect_timeout=None, read_timeout=None, max_attempts=None, backoff_base=None, backoff_cap=None):
+        """
+        Initializes the client.
+
+        :param endpoint:         The federation endpoint URL.
+        :param connect_timeout:  Seconds to wait for a connection.
+        :param read_timeout:     Seconds to wait for the response.
+        :param max_attempts:     The number of attempts, including the first one.
+        :param backoff_base:     The first backoff ceiling in seconds.
+        :param backoff_cap:      The largest backoff ceiling in seconds.
+        """
+        self.endpoint = endpoint or os.environ.get('federation_endpoint', 'https://signin.aws.amazon.com/federation')
+        self.timeout = (
+            connect_timeout or float(os.environ.get('federation_connect_timeout', 2)),
+            read_timeout or float(os.environ.get('federation_read_timeout', 5))
+        )
+        self.max_attempts = max_attempts or int(os.environ.get('federation_max_attempts', 3))
+        self.backoff_base = backoff_base or 0.1
+        self.backoff_cap = backoff_cap or 1.0
+        self.session = None
+        self.lock = threading.Lock()
+        self.latency_histogram = [0] * (len(self.LATENCY_BUCKETS_MS) + 1)
+
+    def get_session(self):
+        with self.lock:
+            if self.session is None:
+                requests = lazy_import('requests')
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=int(os.environ.get('federation_pool_size', 10)), max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self.session = session
+            return self.session
+
+    def record_latency(self, elapsed_ms):
+        bucket = len(self.LATENCY_BUCKETS_MS)
+        for i, bound in enumerate(self.LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                bucket = i
+                break
+        with self.lock:
+            self.latency_histogram[bucket] += 1
+
+    def histogram(self):
+        """
+        Returns the number of calls per latency bucket, keyed by the bucket's
+        upper bound in milliseconds.
+        """
+        with self.lock:
+            counts = list(self.latency_histogram)
+        labels = ['<=' + str(bound) for bound in self.LATENCY_BUCKETS_MS] + ['>' + str(self.LATENCY_BUCKETS_MS[-1])]
+        return dict(zip(labels, counts))
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    def get(self, params, deadline=None):
+        """
+        Calls the federation endpoint and returns the decoded JSON body.
+
+        :param params:    The query parameters.
+        :param deadline:  A time.monotonic() value after which no retry is started.
+        """
+        requests = lazy_import('requests')
+        session = self.get_session()
+        last_error = None
+        try:
+            for attempt in range(self.max_attempts):
+                start = time.monotonic()
+                try:
+                    response = session.get(self.endpoint, params=params, timeout=self.timeout)
+                    if response.status_code not in self.RETRY_STATUS_CODES:
+                        response.raise_for_status()
+                        return response.json()
+                    last_error = FederationError("Federation endpoint returned " + str(response.status_code))
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as error:
+                    last_error = error
+                finally:
+                    elapsed_ms = (time.monotonic() - start) * 1000
+                    self.record_latency(elapsed_ms)
+                    emit_metrics({'FederationLatency': (elapsed_ms, 'Milliseconds')})
+                if attempt + 1 < self.max_attempts:
+                    delay = self.backoff(attempt)
+                    if deadline is not None and time.monotonic() + delay + self.timeout[0] >= deadline:
+                        break
+                    print("Retrying federation call after " + str(last_error))
+                    time.sleep(delay)
+            raise FederationError("Federation endpoint unavailable: " + str(last_error))
+        finally:
+            # Calls of this execution environment so far, by latency bucket
+            print("Federation latency histogram (ms) " + json.dumps(self.histogram()))
+
+    def get_signin_token(self, credentials, deadline=None):
+        session_json = json.dumps({
+            'sessionId': credentials['AccessKeyId'],
+            'sessionKey': credentials['SecretAccessKey'],
+            'sessionToken': credentials['SessionToken']
+        })
+        return self.get({'Action': 'getSigninToken', 'Session': session_json}, deadline)['SigninToken']
+
+    def login_url(self, sign_in_token, destination="https://console.aws.amazon.com/"):
+        return self.endpoint + "?" + urllib.parse.urlencode({
+            'Action': 'login',
+            'Issuer': '',
+            'Destination': destination,
+            'SigninToken': sign_in_token
+        })
+
+federation_client = FederationClient()
+
+
+
+# ********** TOKEN VERIFICATION ************#
+
+class TokenError(Exception):
+    pass
+
+class SigningKeysUnavailable(TokenError):
+    pass
+
+class JwksCache:
+    """
+    It holds the identity provider's signing keys, indexed by kid.
+
+    Keys are loaded from a local JWKS file (jwks_file env var) or from the
+    JWKS endpoint (jwks_uri env var, by default the issuer's /v1/keys). Once
+    the keys are older than the TTL they are refreshed in a background thread
+    while the current keys keep being used. An unknown kid triggers an
+    immediate refresh, at most once per min_refresh_seconds. The same interval
+    applies after a failed fetch, so an unreachable endpoint is not fetched
+    again on every call.
+    """
+    def __init__(self, uri=None, path=None, ttl_seconds=None, min_refresh_seconds=None):
+        """
+        Initializes an empty key cache.
+
+        :param uri:                  The JWKS endpoint.
+        :param path:                 A local JWKS file, used instead of the endpoint.
+        :param ttl_seconds:          Age after which the keys are refreshed in the background.
+        :param min_refresh_seconds:  Minimum interval between two refreshes.
+        """
+        self.path = path or os.environ.get('jwks_file')
+        self.uri = uri or os.environ.get('jwks_uri') or os.environ.get('jwt_issuer', '').rstrip('/') + '/v1/keys'
+        self.ttl_seconds = ttl_seconds or int(os.environ.get('jwks_ttl', 3600))
+        self.min_refresh_seconds = min_refresh_seconds or 30
+        self.keys = {}
+        self.fetched_at = None
+        self.attempted_at = None
+        self.lock = threading.Lock()
+        self.refreshing = False
+
+    def fetch(self):
+        """
+        Returns the signing keys by kid, or raises SigningKeysUnavailable.
+        """
+        try:
+            if self.path:
+                with open(self.path) as jwks_file:
+                    jwks = json.load(jwks_file)
+            else:
+                # The standard library client keeps requests out of the cold
+                # start of every authenticated call; its errors derive from
+                # OSError
+                with lazy_import('urllib.request').urlopen(self.uri, timeout=5) as response:
+                    jwks = json.load(response)
+            algorithms = lazy_import('jwt.algorithms')
+            keys = {}
+            for jwk in jwks.get('keys', []):
+                if jwk.get('kty') == 'RSA' and jwk.get('use', 'sig') == 'sig':
+                    keys[jwk['kid']] = algorithms.RSAAlgorithm.from_jwk(json.dumps(jwk))
+            return keys
+        except (OSError, ValueError, KeyError, AttributeError, lazy_import('jwt').PyJWTError) as error:
+            raise SigningKeysUnavailable("Could not load the signing keys: " + str(error))
+
+    def refresh(self):
+        try:
+            with self.lock:
+                self.attempted_at = time.monotonic()
+            keys = self.fetch()
+            with self.lock:
+                self.keys = keys
+                self.fetched_at = time.monotonic()
+        finally:
+            with self.lock:
+                self.refreshing = False
+
+    def refresh_in_background(self):
+        with self.lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        def run():
+            try:
+                self.refresh()
+            except Exception as error:
+                print("Error refreshing signing keys " + str(error))
+        threading.Thread(target=run, daemon=True).start()
+
+    def get_key(self, kid):
+        now = time.monotonic()
+        with self.lock:
+            key = self.keys.get(kid)
+            fetched_at = self.fetched_at
+            attempted_at = self.attempted_at
+        if key is not None:
+            if now - fetched_at > self.ttl_seconds:
+                self.refresh_in_background()
+            return key
+        if attempted_at is None or now - attempted_at > self.min_refresh_seconds:
+            with self.lock:
+                self.refreshing = True
+            self.refresh()
+            with self.lock:
+                key = self.keys.get(kid)
+        if key is None:
+            with self.lock:
+                loaded = self.fetched_at is not None
+            if not loaded:
+                raise SigningKeysUnavailable("The signing keys have not been loaded")
+            raise TokenError("Unknown signing key " + str(kid))
+        return key
+
+class TokenVerifier:
+    """
+    It verifies the RS256 signature, expiry and issuer of the access and id
+    tokens passed in the Authorization header.
+    """
+    def __init__(self, jwks=None, issuer=None, leeway_seconds=None):
+        """
+        Initializes the verifier.
+
+        :param jwks:            The JwksCache the signing keys are read from.
+        :param issuer:          The expected iss claim, jwt_issuer env var by default.
+        :param leeway_seconds:  Clock skew allowed when checking exp.
+        """
+        self.jwks = jwks or JwksCache()
+        self.issuer = issuer or os.environ.get('jwt_issuer') or None
+        self.leeway_seconds = leeway_seconds if leeway_seconds is not None else 30
+
+    def verify(self, token):
+        """
+        Returns the claims of the token, or raises TokenError.
+        """
+        jwt = lazy_import('jwt')
+        try:
+            header = jwt.get_unverified_header(token)
+            if header.get('alg') != 'RS256':
+                raise TokenError("Unsupported token algorithm " + str(header.get('alg')))
+            return jwt.decode(
+                token,
+                self.jwks.get_key(header.get('kid')),
+                algorithms=["RS256"],
+                issuer=self.issuer,
+                leeway=self.leeway_seconds,
+                options={"require": ["exp"], "verify_aud": False}
+            )
+        except jwt.PyJWTError as error:
+            raise TokenError("Invalid token: " + str(error))
+
+token_verifier = TokenVerifier()
+
+
+
+# ********** AUTHENTICATION ************#
+
+class Principal:
+    """
+    It describes the caller of an API method, from its verified tokens.
+    """
+    def __init__(self, subject, email, groups, expires_at):
+        """
+        Initializes the principal.
+
+        :param subject:     The sub claim of the access token.
+        :param email:       The email claim of the id token.
+        :param groups:      The groups claim of the id token.
+        :param expires_at:  The earlier of the two tokens' exp claims.
+        """
+        self.subject = subject
+        self.email = email
+        self.groups = groups
+        self.expires_at = expires_at
+
+    def in_group(self, group):
+        return group in self.groups
+
+class ClaimsCache:
+    """
+    It keeps the claims of verified tokens, so a warm container polled by the
+    dashboards verifies each token once. Entries are keyed by the SHA-256 of
+    the token and dropped when the token expires.
+    """
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or int(os.environ.get('claims_cache_size', 1024))
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, token_hash):
+        with self.lock:
+            entry = self.entries.get(token_hash)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self.entries[token_hash]
+                return None
+            self.entries.move_to_end(token_hash)
+            return entry[1]
+
+    def put(self, token_hash, claims):
+        with self.lock:
+            self.entries[token_hash] = (claims['exp'], claims)
+            self.entries.move_to_end(token_hash)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+claims_cache = ClaimsCache()
+
+def get_claims(token):
+    token_hash = hashlib.sha256(token.encode()).hexdigest()
+    claims = claims_cache.get(token_hash)
+    if claims is None:
+        claims = token_verifier.verify(token)
+        claims_cache.put(token_hash, claims)
+    return claims
+
+def get_principal(event):
+    """
+    Returns the Principal for the 'Bearer <access-token> <id-token>'
+    Authorization header of the event, or raises TokenError.
+    """
+    auth_header = deep_get(event, ["headers", "Authorization"]) or ''
+    if not auth_header.startswith('Bearer '):
+        raise TokenError("Missing bearer token")
+    tokens = auth_header[len('Bearer '):].split(' ', 1)
+    access_claims = get_claims(tokens[0])
+    id_claims = get_claims(tokens[-1])
+    return Principal(
+        access_claims.get('sub'),
+        id_claims.get('email'),
+        id_claims.get('groups', []),
+        min(access_claims['exp'], id_claims['exp'])
+    )
+
+def authenticated(handler):
+    """
+    Resolves the caller of a DatabaseLoader method and passes it as the
+    principal argument, or answers 401 when the tokens do not verify.
+    """
+    @functools.wraps(handler)
+    def wrapper(self, event, context):
+        if event.get('isBase64Encoded') and event.get('body'):
+            # Every media type is binary for the API so that gzipped
+            # responses pass through, which encodes request bodies as well
+            event = dict(event, body=base64.b64decode(event['body']).decode(), isBase64Encoded=False)
+        try:
+            principal = get_principal(event)
+        except SigningKeysUnavailable as error:
+            print("Could not authenticate the call " + str(error))
+            return {
+                "statusCode": 503,
+                "body": json.dumps("Service Unavailable")
+            }
+        except TokenError as error:
+            print("Rejected unauthenticated call " + str(error))
+            return {
+                "statusCode": 401,
+                "body": json.dumps("Unauthorized")
+            }
+        return handler(self, event, context, principal)
+    return wrapper
+
+
+
+# ********** STATUS SHARDS ************#
+
+# request-status-index has a handful of hash key values, so the busy
+# statuses concentrate on single partitions. With status_shards set to N,
+# writers also store status_shard = '<status>#<0..N-1>', the hash key of
+# request-status-shard-index, and readers query the N shards in parallel
+# and merge them by request_time.
+
+def get_status_shards():
+    return int(os.environ.get('status_shards', 0))
+
+def status_shard_for(id, status, shards=None):
+    shards = shards or get_status_shards()
+    return status + '#' + str(zlib.crc32(id.encode()) % shards)
+
+def status_shard_values(id, status):
+    """
+    Returns the status_shard attribute to write with a request status, as a
+    dict that is empty when sharding is disabled.
+    """
+    if not get_status_shards():
+        return {}
+    return {'status_shard': status_shard_for(id, status)}
+
+def query_shard(table, query_kwargs, start_key, limit):
+    """
+    Returns (items, last_evaluated_key) of one shard: every page, or if limit
+    is given the pages up to the first limit items. A filtered page can hold
+    fewer items than its Limit, so a shard that is not exhausted always
+    returns at least limit items.
+    """
+    query_kwargs = dict(query_kwargs)
+    if limit:
+        query_kwargs['Limit'] = limit
+    items = []
+    while True:
+        if start_key:
+            query_kwargs['ExclusiveStartKey'] = start_key
+        response = table.query(**query_kwargs)
+        items.extend(response['Items'])
+        start_key = response.get('LastEvaluatedKey', None)
+        if start_key is None or (limit and len(items) >= limit):
+            return items, start_key
+
+def query_status_shards(table, status, time_condition=None, filter_expression=None, limit=None, positions=None, attributes=None):
+    """
+    Queries every shard of a status in parallel and merges the results by
+    request_time, newest first. Each shard that is not exhausted returns at
+    least limit items, all newer than the ones it has left, so the first
+    limit items of the merge are the newest across the shards.
+
+    :param limit:      The page size, or None for every item.
+    :param positions:  The shard positions returned with the previous page,
+                       or None to start from the newest items.
+    :param attributes: The attributes read besides those of a row, or None
+                       for whole items.
+    :return: (items, positions), where positions is None once every shard
+             has been read.
+    """
+    shards = get_status_shards()
+    if positions is None:
+        positions = {str(shard): None for shard in range(shards)}
+    def query(shard):
+        key_condition = Key('status_shard').eq(status + '#' + shard)
+        if time_condition:
+            key_condition = key_condition & time_condition
+        query_kwargs = {
+            'IndexName': 'request-status-shard-index',
+            'KeyConditionExpression': key_condition,
+            'ScanIndexForward': False
+        }
+        if filter_expression:
+            query_kwargs['FilterExpression'] = filter_expression
+        if attributes is not None:
+            query_kwargs.update(projection('status_shard', *attributes))
+        return shard, query_shard(table, query_kwargs, positions[shard], limit)
+    with ThreadPoolExecutor(max_workers=max(1, len(positions))) as executor:
+        results = dict(executor.map(query, list(positions)))
+    tagged = [[(item['request_time'], shard, item) for item in results[shard][0]] for shard in results]
+    merged = heapq.merge(*tagged, key=lambda entry: entry[0], reverse=True)
+    if limit:
+        merged = itertools.islice(merged, limit)
+    items = []
+    consumed = {}
+    for request_time, shard, item in merged:
+        items.append(item)
+        consumed[shard] = consumed.get(shard, 0) + 1
+    next_positions = {}
+    for shard, (shard_items, last_key) in results.items():
+        count = consumed.get(shard, 0)
+        if count == len(shard_items):
+            if last_key is not None:
+                next_positions[shard] = last_key
+        elif count:
+            last_item = shard_items[count - 1]
+            next_positions[shard] = {name: last_item[name] for name in ('id', 'request_time', 'status_shard')}
+        else:
+            next_positions[shard] = positions[shard]
+    return items, next_positions or None
+
+
+
+# ********** PENDING SNAPSHOT ************#
+
+# The stream handler increments the version item of the state table whenever
+# a request enters or leaves Requested. Each execution environment keeps the
+# pending queue it last read together with that version, and reads the queue
+# again only when the version has moved. The status indexes are eventually
+# consistent, so a queue read shortly after a bump may not hold the change
+# yet; such a read is not reused and the next call reads the queue again.
+PENDING_VERSION_KEY = {'pk': 'pending', 'sk': 'version'}
+PENDING_SETTLE_SECONDS = 5
+
+def get_state_table():
+    return get_table(os.environ['state_table'])
+
+def read_pending_version():
+    """
+    Returns (version, time of the last bump in epoch seconds), or (None, 0)
+    before the first bump.
+    """
+    item = get_state_table().get_item(Key=PENDING_VERSION_KEY, ConsistentRead=True).get('Item')
+    if not item:
+        return None, 0
+    return item['version'], int(item.get('bumped_at', 0))
+
+def load_pending(table):
+    """
+    Reads every Requested request, newest first, from the sharded or the
+    unsharded status index.
+    """
+    if get_status_shards():
+        items, positions = query_status_shards(table, 'Requested', attributes=['request_ttl'])
+        return items
+    query_kwargs = {
+        'IndexName': 'request-status-index',
+        'KeyConditionExpression': Key('request_status').eq('Requested'),
+        'ScanIndexForward': False,
+        **projection('request_ttl')
+    }
+    items, start_key = query_shard(table, query_kwargs, None, None)
+    return items
+
+class PendingSnapshot:
+    """
+    It holds the pending queue of one execution environment and the version
+    it was read at.
+    """
+    def __init__(self):
+        self.version = None
+        self.items = None
+        self.loaded_at = 0
+        self.lock = threading.Lock()
+
+    def get(self, table):
+        """
+        Returns the Requested requests, sorted newest first, reading them
+        again if the version item has moved or the snapshot was read within
+        PENDING_SETTLE_SECONDS of the last bump.
+        """
+        version, bumped_at = read_pending_version()
+        with self.lock:
+            if version is not None and version == self.version and self.loaded_at >= bumped_at + PENDING_SETTLE_SECONDS:
+                return self.items
+        loaded_at = time.time()
+        items = load_pending(table)
+        items.sort(key=lambda item: (item['request_time'], item['id']), reverse=True)
+        with self.lock:
+            self.version = version
+            self.items = items
+            self.loaded_at = loaded_at
+        return items
+
+pending_snapshot = PendingSnapshot()
+
+def snapshot_page(items, epoch_time_now, time_from, time_to, limit, position):
+    """
+    Applies the request_ttl filter, the request_time range and the page
+    position of a pending request call to the snapshot.
+
+    :return: (items, position of the next page or None)
+    """
+    selected = []
+    for item in items:
+        if item.get('request_ttl', 0) <= epoch_time_now:
+            continue
+        if (time_from and item['request_time'] < time_from) or (time_to and item['request_time'] > time_to):
+            continue
+        if position and (item['request_time'], item['id']) >= (position['request_time'], position['id']):
+            continue
+        selected.append(item)
+    if limit and len(selected) > limit:
+        last = selected[limit - 1]
+        return selected[:limit], {'request_time': last['request_time'], 'id': last['id']}
+    return selected, None
+
+
+
+# ********** STATUS RECONCILIATION ************#
+
+def derive_status(item, epoch_time_now, now):
+    """
+    Returns the status a request should have at the given time, without
+    persisting anything.
+
+    :param item:            The database record.
+    :param epoch_time_now:  The current time in epoch seconds.
+    :param now:             The current time as stored in expiration_time.
+    """
+    status = item.get('request_status', '')
+    if 'request_ttl' in item and item['request_ttl'] < epoch_time_now:
+        return 'Expired'
+    if status == 'Approved' and item.get('expiration_time', '') <= now:
+        return 'Ended'
+    return status
+
+def transition_status(table, key, old_status, new_status):
+    """
+    Persists a derived status transition (Expired, Ended).
+
+    The conditional UpdateItem only sets request_status and drops the request
+    from the active grant and expiry bucket indexes, so concurrent sweeps
+    and repeated transitions are harmless.
+
+    :return: True if the transition was written.
+    """
+    update_expression = "set request_status=:v1"
+    values = {
+        ':v1': new_status,
+        ':v2': old_status
+    }
+    if get_status_shards():
+        update_expression += ", status_shard=:v3"
+        values[':v3'] = status_shard_for(key['id'], new_status)
+    try:
+        table.update_item(
+            Key=key,
+            UpdateExpression=update_expression + " REMOVE grant_key, grant_expiration, expiry_bucket",
+            ConditionExpression="request_status = :v2",
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+    if new_status == 'Ended':
+        credential_cache.invalidate(key['id'])
+    return True
+
+
+# ********** EXPIRY SWEEPER ************#
+
+# Requests carry the minute they are due to expire or end in expiry_bucket,
+# the hash key of the sparse expiry-bucket-index. The sweeper queries the
+# buckets of the minutes since its last complete run, so its cost follows
+# the number of due requests rather than the size of the table.
+EXPIRY_BUCKET_FORMAT = '%Y-%m-%dT%H:%M'
+# Last bucket whose due requests were all transitioned
+SWEEP_WATERMARK_KEY = {'pk': 'sweep', 'sk': 'watermark'}
+
+def expiry_bucket_for(value):
+    """
+    Returns the expiry bucket of a datetime (UTC) or epoch seconds value.
+    """
+    if not isinstance(value, datetime):
+        value = datetime.utcfromtimestamp(int(value))
+    return value.strftime(EXPIRY_BUCKET_FORMAT)
+
+def sweep_bucket(table, bucket, epoch_time_now, now):
+    """
+    Transitions the due requests of one expiry bucket.
+
+    :return: (the number of requests transitioned, True if no transition
+             failed).
+    """
+    transitions = []
+    query_kwargs = {
+        'IndexName': 'expiry-bucket-index',
+        'KeyConditionExpression': Key('expiry_bucket').eq(bucket)
+    }
+    done = False
+    start_key = None
+    while not done:
+        if start_key:
+            query_kwargs['ExclusiveStartKey'] = start_key
+        response = table.query(**query_kwargs)
+        for item in response['Items']:
+            status = derive_status(item, epoch_time_now, now)
+            if status != item['request_status']:
+                key = {'id': item['id'], 'request_time': item['request_time']}
+                transitions.append((key, item['request_status'], status))
+        start_key = response.get('LastEvaluatedKey', None)
+        done = start_key is None
+    if not transitions:
+        return 0, True
+    def apply(transition):
+        try:
+            return transition_status(table, *transition)
+        except Exception as error:
+            # Left in its bucket, so the next runs retry it
+            print("Error transitioning " + transition[0]['id'] + ": " + str(error))
+            return None
+    with ThreadPoolExecutor(max_workers=min(len(transitions), int(os.environ.get('sweep_workers', 8)))) as executor:
+        written = list(executor.map(apply, transitions))
+    return sum(1 for result in written if result), None not in written
+
+def read_sweep_watermark(state_table):
+    item = state_table.get_item(Key=SWEEP_WATERMARK_KEY, ConsistentRead=True).get('Item')
+    return item and item['bucket']
+
+def advance_sweep_watermark(state_table, bucket):
+    try:
+        state_table.put_item(
+            Item=dict(SWEEP_WATERMARK_KEY, bucket=bucket),
+            ConditionExpression='attribute_not_exists(#b) OR #b < :b',
+            ExpressionAttributeNames={'#b': 'bucket'},
+            ExpressionAttributeValues={':b': bucket}
+        )
+    except ClientError as error:
+        # A concurrent run got further
+        if error.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+def sweep_expired(event, context):
+    """
+    Scheduled entry point that moves due requests to Expired or Ended.
+
+    Each run sweeps every bucket after the watermark kept in the state table,
+    and at least those of the last sweep_lookback_minutes minutes, which
+    catches requests written to a recent bucket late. The watermark only
+    moves past buckets whose transitions all succeeded, so runs that were
+    missed, timed out or failed are caught up by the next ones, oldest
+    bucket first.
+    """
+    table = get_table()
+    state_table = get_state_table() if os.environ.get('state_table') else None
+    deadline = get_deadline(context)
+    utc_now = datetime.utcnow()
+    epoch_time_now = int(time.time())
+    now = format_timestamp(utc_now)
+    start = utc_now.replace(second=0, microsecond=0) - timedelta(minutes=int(os.environ.get('sweep_lookback_minutes', 15)))
+    watermark = read_sweep_watermark(state_table) if state_table else None
+    if watermark:
+        start = min(start, datetime.strptime(watermark, EXPIRY_BUCKET_FORMAT) + timedelta(minutes=1))
+    swept = 0
+    swept_to = None
+    complete = True
+    bucket_time = start
+    while bucket_time <= utc_now:
+        if deadline is not None and time.monotonic() >= deadline:
+            print("Stopped before bucket " + expiry_bucket_for(bucket_time) + ", the next run continues from there")
+            break
+        bucket = expiry_bucket_for(bucket_time)
+        bucket_swept, bucket_complete = sweep_bucket(table, bucket, epoch_time_now, now)
+        swept += bucket_swept
+        complete = complete and bucket_complete
+        # Requests of the current minute can still become due
+        if complete and bucket_time + timedelta(minutes=1) <= utc_now:
+            swept_to = bucket
+        bucket_time += timedelta(minutes=1)
+    if state_table and swept_to and (watermark is None or swept_to > watermark):
+        advance_sweep_watermark(state_table, swept_to)
+    print("Swept " + str(swept) + " due requests")
+    return {'swept': swept}
+
+
+# ********** PARALLEL SCAN ************#
+
+class ParallelScan:
+    """
+    It reads a table with a DynamoDB parallel scan, one worker thread per
+    segment, and hands pages back to the caller as they arrive.
+    """
+    def __init__(self, table, scan_kwargs=None, total_segments=None, key_names=('id', 'request_time')):
+        """
+        Initializes the scan.
+
+        :param table:           The DynamoDB table.
+        :param scan_kwargs:     Additional arguments for every Scan call.
+        :param total_segments:  The number of segments read concurrently.
+        :param key_names:       The key attributes of the table, which the
+                                projection of scan_kwargs must include.
+        """
+        self.table = table
+        self.scan_kwargs = scan_kwargs or {}
+        self.total_segments = total_segments or int(os.environ.get('scan_segments', 4))
+        self.key_names = key_names
+        # Segment number -> ExclusiveStartKey (None to start at the beginning)
+        # for every segment that has not been read to the end yet
+        self.segment_state = {segment: None for segment in range(self.total_segments)}
+
+    def resume(self, segment_state):
+        """
+        Continues a previous scan from its segment state.
+        """
+        self.segment_state = dict(segment_state)
+        return self
+
+    @property
+    def complete(self):
+        return not self.segment_state
+
+    def segment_pages(self, deadline=None):
+        """
+        Yields (segment, items, start_key) for every page in the order the
+        segments return them, without updating segment_state. No new page is
+        requested once the deadline (a time.monotonic() value) has passed or
+        the caller stops iterating.
+        """
+        pages = queue.Queue(maxsize=self.total_segments * 2)
+        stop = threading.Event()
+
+        def should_stop():
+            if stop.is_set():
+                return True
+            return deadline is not None and time.monotonic() >= deadline
+
+        def read_segment(segment, start_key):
+            try:
+                kwargs = dict(self.scan_kwargs, Segment=segment, TotalSegments=self.total_segments)
+                while not should_stop():
+                    if start_key:
+                        kwargs['ExclusiveStartKey'] = start_key
+                    response = self.table.scan(**kwargs)
+                    start_key = response.get('LastEvaluatedKey', None)
+                    put(segment, response['Items'], start_key, None)
+                    if start_key is None:
+                        break
+            except Exception as error:
+                put(segment, None, None, error)
+            finally:
+                put(segment, None, None, None, last=True)
+
+        def put(*page, last=False):
+            while True:
+                try:
+                    pages.put(page + (last,), timeout=0.1)
+                    return
+                except queue.Full:
+                    if stop.is_set() and not last:
+                        return
+
+        workers = [threading.Thread(target=read_segment, args=(segment, start_key), daemon=True)
+                   for segment, start_key in self.segment_state.items()]
+        for worker in workers:
+            worker.start()
+        running = len(workers)
+        try:
+            while running:
+                segment, items, start_key, error, last = pages.get()
+                if last:
+                    running -= 1
+                elif error is not None:
+                    raise error
+                else:
+                    yield segment, items, start_key
+        finally:
+            stop.set()
+            while running:
+                if pages.get()[-1]:
+                    running -= 1
+
+    def consumed(self, segment, start_key):
+        if start_key is None:
+            self.segment_state.pop(segment, None)
+        else:
+            self.segment_state[segment] = start_key
+
+    def pages(self, deadline=None):
+        """
+        Yields lists of items in the order the segments return them. The
+        positions of the pages that are not yielded are left in
+        segment_state so the scan can be resumed.
+        """
+        for segment, items, start_key in self.segment_pages(deadline):
+            self.consumed(segment, start_key)
+            yield items
+
+    def scan(self, deadline=None, max_items=None):
+        """
+        Returns the items read before the deadline, at most max_items of them.
+
+        With max_items, every segment reads a single page of at most
+        max_items items, so a page of the API costs about max_items items
+        per segment instead of full scan pages. When only part of a page
+        fits, the segment resumes after the last item returned, and segments
+        whose page does not fit at all are read again by the next call.
+        """
+        if max_items is not None:
+            return self.scan_page(deadline, max_items)
+        items = list()
+        for segment, page, start_key in self.segment_pages(deadline):
+            items.extend(page)
+            self.consumed(segment, start_key)
+        return items
+
+    def scan_page(self, deadline, max_items):
+        if not self.segment_state or (deadline is not None and time.monotonic() >= deadline):
+            return []
+        def read(position):
+            segment, start_key = position
+            kwargs = dict(self.scan_kwargs, Segment=segment, TotalSegments=self.total_segments)
+            kwargs['Limit'] = min(kwargs.get('Limit', max_items), max_items)
+            if start_key:
+                kwargs['ExclusiveStartKey'] = start_key
+            response = self.table.scan(**kwargs)
+            return segment, response['Items'], response.get('LastEvaluatedKey', None)
+        with ThreadPoolExecutor(max_workers=len(self.segment_state)) as executor:
+            results = list(executor.map(read, list(self.segment_state.items())))
+        items = list()
+        for segment, page, start_key in results:
+            if len(items) >= max_items:
+                break
+            taken = page[:max_items - len(items)]
+            items.extend(taken)
+            if len(taken) < len(page):
+                start_key = {name: taken[-1][name] for name in self.key_names}
+            self.consumed(segment, start_key)
+        return items
+
+def get_deadline(context, reserve_ms=None):
+    """
+    Returns the time.monotonic() value by which a handler should stop reading,
+    leaving reserve_ms of the remaining invocation time to build the response.
+    """
+    if context is None:
+        return None
+    if reserve_ms is None:
+        reserve_ms = int(os.environ.get('scan_reserve_ms', 5000))
+    return time.monotonic() + (context.get_remaining_time_in_millis() - reserve_ms) / 1000.0
+
+
+# ********** PAGINATION ************#
+
+# List endpoints return one page at a time when the caller passes 'limit' or
+# 'next_token'. The token is the JSON position of the read (a LastEvaluatedKey,
+# or the segment state of a parallel scan) signed with an HMAC, so clients
+# can pass it back but cannot forge or alter it.
+MAX_PAGE_SIZE = 1000
+
+class PageTokenError(ValueError):
+    pass
+
+def encode_page_token(endpoint, position):
+    payload = base64.urlsafe_b64encode(json.dumps({'e': endpoint, 'p': position}, separators=(',', ':'), default=str).encode())
+    signature = hmac.new(os.environ['pagination_secret'].encode(), payload, hashlib.sha256).digest()
+    return (payload + b'.' + base64.urlsafe_b64encode(signature)).decode()
+
+def decode_page_token(endpoint, token):
+    try:
+        payload, signature = token.encode().split(b'.', 1)
+        expected = hmac.new(os.environ['pagination_secret'].encode(), payload, hashlib.sha256).digest()
+        if hmac.compare_digest(base64.urlsafe_b64decode(signature), expected):
+            decoded = json.loads(base64.urlsafe_b64decode(payload))
+            if decoded['e'] == endpoint:
+                return decoded['p']
+    except (ValueError, KeyError, TypeError):
+        pass
+    raise PageTokenError("Invalid next_token")
+
+def get_page_params(event):
+    """
+    Returns (limit, next_token) from the query string, or (None, None) if the
+    caller did not ask for a paginated response.
+    """
+    limit = deep_get(event, ["queryStringParameters", "limit"])
+    next_token = deep_get(event, ["queryStringParameters", "next_token"])
+    if limit is None and next_token is None:
+        return None, None
+    try:
+        limit = min(max(int(limit or MAX_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise QueryParameterError("Invalid limit parameter " + limit)
+    return limit, next_token
+
+def decode_scan_state(position):
+    # JSON object keys are strings, segment numbers are ints
+    return {int(segment): start_key for segment, start_key in position.items()}
+
+def to_page(items, next_token):
+    return {'items': items, 'next_token': next_token}
+
+
+# ********** RESPONSES ************#
+
+# The attributes of a request returned by the API, with the value used when
+# an item does not have one. Rows are built straight from the items in this
+# order, so equal lists always encode to equal bodies.
+REQUEST_ATTRIBUTES = (
+    ('expiration_time', ''),
+    ('id', 0),
+    ('request_account', ''),
+    ('request_duration', 0),
+    ('request_justification', ''),
+    ('request_role', ''),
+    ('request_status', ''),
+    ('request_time', ''),
+    ('requester', ''),
+    ('review_time', ''),
+    ('reviewer', '')
+)
+
+def get_gzip_min_bytes():
+    return int(os.environ.get('gzip_min_bytes', 1024))
+
+def projection(*extra):
+    """
+    Returns the arguments that make a read return only the attributes of a
+    row and the given extra attributes.
+    """
+    names = [name for name, default in REQUEST_ATTRIBUTES] + list(extra)
+    # Names of their own, boto3 generates #n0, #n1... for conditions
+    placeholders = ['#r' + str(index) for index in range(len(names))]
+    return {
+        'ProjectionExpression': ', '.join(placeholders),
+        'ExpressionAttributeNames': dict(zip(placeholders, names))
+    }
+
+def request_row(item):
+    return {name: item.get(name, default) for name, default in REQUEST_ATTRIBUTES}
+
+def encode_response(event, status_code, result, etag=False):
+    """
+    Encodes the result of a DatabaseLoader method as compact JSON, gzipped
+    when the caller accepts it and the body is large enough to gain from it.
+
+    :param event:        The API Gateway proxy event.
+    :param status_code:  The HTTP status code.
+    :param result:       The result to encode.
+    :param etag:         If True, a 200 response carries an ETag and becomes
+                         a 304 when the caller already has the body.
+    """
+    body = json.dumps(result, separators=(',', ':'), default=str).encode()
+    request_headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    compress = len(body) >= get_gzip_min_bytes() and 'gzip' in request_headers.get('accept-encoding', '')
+    headers = {'Content-Type': 'application/json', 'Vary': 'Accept-Encoding'}
+    if etag and status_code == 200:
+        # The gzipped and the plain body are different representations
+        tag = '"' + hashlib.sha256(body).hexdigest()[:32] + ('-gzip"' if compress else '"')
+        headers['ETag'] = tag
+        headers['Cache-Control'] = 'no-cache'
+        if_none_match = request_headers.get('if-none-match', '')
+        if tag in [value.strip().replace('W/', '', 1) for value in if_none_match.split(',')]:
+            return {"statusCode": 304, "headers": headers, "body": ""}
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+        return {
+            "statusCode": status_code,
+            "headers": headers,
+            "body": base64.b64encode(gzip.compress(body, compresslevel=6)).decode(),
+            "isBase64Encoded": True
+        }
+    return {"statusCode": status_code, "headers": headers, "body": body.decode()}
+
+
+# ********** CHANGE FEED ************#
+
+# The stream handler writes an entry to the state table for every change of
+# the request table: pk 'changes#<hour written>', sk '<time written>#<stream
+# sequence number>', with the key and requester of the request and a ttl at
+# the end of the retention window. get_changes reads the entries written
+# since a client's cursor and returns the current version of the requests
+# they name, with reset set when the client has to load its view in full:
+# on the first call, when the cursor is older than the retention window or
+# when too many requests changed. compact_changes folds the entries of each
+# closed hour into a single item that keeps the latest change of every
+# request.
+CHANGES_BUCKET_FORMAT = '%Y-%m-%dT%H'
+CHANGE_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+COMPACTED_CHANGES_SK = 'compacted'
+# Keeps a compacted item below the 400 KB item size limit, with room for
+# the attribute overhead its JSON size does not count
+MAX_COMPACTED_BYTES = 300 * 1024
+BATCH_GET_LIMIT = 100
+BATCH_GET_ATTEMPTS = 8
+
+def get_changes_retention():
+    return timedelta(hours=int(os.environ.get('changes_retention_hours', 24)))
+
+def get_changes_overlap():
+    # Entries are written shortly after their sk time, so each read starts
+    # a little before the cursor. Clients merge by id, repeats are harmless.
+    return timedelta(seconds=int(os.environ.get('changes_overlap_seconds', 60)))
+
+def changes_bucket_key(value):
+    return 'changes#' + value.strftime(CHANGES_BUCKET_FORMAT)
+
+def change_entries(item):
+    """
+    Returns the (time, entry) pairs of a change log item, raw or compacted.
+    """
+    if item['sk'] == COMPACTED_CHANGES_SK:
+        return [(entry['t'], entry) for entry in item['entries']]
+    return [(item['sk'].split('#', 1)[0], item)]
+
+def latest_changes(items, since_value=''):
+    """
+    Returns {(id, request_time): (time, entry)} with the latest change of
+    every request changed at or after since_value.
+    """
+    latest = {}
+    for item in items:
+        for changed_at, entry in change_entries(item):
+            key = (entry['id'], entry['request_time'])
+            if changed_at >= since_value and changed_at >= latest.get(key, ('',))[0]:
+                latest[key] = (changed_at, entry)
+    return latest
+
+def read_changes(table, since, until):
+    """
+    Reads the hour buckets from since to until.
+
+    :return: {(id, request_time): entry} of the requests changed since.
+    """
+    since_value = since.strftime(CHANGE_TIME_FORMAT)
+    items = []
+    bucket = since.replace(minute=0, second=0, microsecond=0)
+    while bucket <= until:
+        query_kwargs = {
+            'KeyConditionExpression': Key('pk').eq(changes_bucket_key(bucket)) & Key('sk').gte(since_value),
+            'ConsistentRead': True
+        }
+        bucket_items, start_key = query_shard(table, query_kwargs, None, None)
+        items.extend(bucket_items)
+        bucket += timedelta(hours=1)
+    return {key: entry for key, (changed_at, entry) in latest_changes(items, since_value).items()}
+
+def batch_get_requests(keys):
+    """
+    Returns the current items of the given (id, request_time) keys. Deleted
+    requests are missing.
+    """
+    return batch_get(
+        os.environ['db_table'],
+        [{'id': id, 'request_time': request_time} for id, request_time in keys],
+        # A refresh right after a review must see the review
+        ConsistentRead=True,
+        **projection('request_ttl')
+    )
+
+def batch_get(table_name, keys, **options):
+    """
+    Returns the items of the given keys, retrying the keys BatchGetItem
+    leaves unprocessed.
+
+    :param options:  Additional arguments for the keys of every call.
+    """
+    dynamodb = get_resource('dynamodb')
+    items = []
+    for start in range(0, len(keys), BATCH_GET_LIMIT):
+        request_items = {
+            table_name: dict(options, Keys=keys[start:start + BATCH_GET_LIMIT])
+        }
+        for attempt in range(BATCH_GET_ATTEMPTS):
+            if attempt:
+                time.sleep(random.uniform(0, min(1.0, 0.05 * 2 ** attempt)))
+            response = dynamodb.batch_get_item(RequestItems=request_items)
+            items.extend(response['Responses'].get(table_name, []))
+            request_items = response.get('UnprocessedKeys')
+            if not request_items:
+                break
+        else:
+            raise Exception("BatchGetItem left keys unprocessed after " + str(BATCH_GET_ATTEMPTS) + " attempts")
+    return items
+
+def change_view_matches(view, item, epoch_time_now):
+    """
+    Returns True if the request belongs to the list endpoint of a view.
+    """
+    status = item.get('request_status', '')
+    if view == 'pending':
+        return status == 'Requested' and item.get('request_ttl', 0) > epoch_time_now
+    if view == 'processed':
+        return status not in ('Requested', 'Expired')
+    return True
+
+def compact_changes_bucket(table, bucket):
+    """
+    Replaces the raw entries of one hour bucket with its compacted item.
+
+    :return: The number of raw entries compacted.
+    """
+    pk = changes_bucket_key(bucket)
+    items, start_key = query_shard(table, {'KeyConditionExpression': Key('pk').eq(pk), 'ConsistentRead': True}, None, None)
+    raw_items = [item for item in items if item['sk'] != COMPACTED_CHANGES_SK]
+    if not raw_items:
+        return 0
+    entries = []
+    for changed_at, entry in latest_changes(items).values():
+        compacted = {name: entry[name] for name in ('id', 'request_time', 'requester', 'event') if name in entry}
+        compacted['t'] = changed_at
+        entries.append(compacted)
+    size = len(json.dumps(entries, separators=(',', ':')).encode('utf-8'))
+    if size > MAX_COMPACTED_BYTES:
+        # The raw entries stay readable until their ttl
+        print("Not compacting " + pk + ": " + str(len(entries)) + " requests changed, " + str(size) + " bytes")
+        return 0
+    expires_at = bucket + timedelta(hours=1) + get_changes_retention()
+    # Readers see the raw entries and the compacted item together until the
+    # deletes land, which only repeats changes
+    table.put_item(Item={'pk': pk, 'sk': COMPACTED_CHANGES_SK, 'entries': entries, 'ttl': calendar.timegm(expires_at.timetuple())})
+    with table.batch_writer() as batch:
+        for item in raw_items:
+            batch.delete_item(Key={'pk': pk, 'sk': item['sk']})
+    return len(raw_items)
+
+def compact_changes(event, context):
+    """
+    Scheduled entry point that compacts the change log buckets of the
+    retention window. The current and the previous hour are left alone, as
+    the stream handler may still be writing to them. A bucket that fails is
+    logged and does not stop the others.
+    """
+    table = get_state_table()
+    utc_hour = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    retention_hours = int(get_changes_retention().total_seconds() // 3600)
+    compacted = 0
+    for hours in range(retention_hours, 1, -1):
+        bucket = utc_hour - timedelta(hours=hours)
+        try:
+            compacted += compact_changes_bucket(table, bucket)
+        except Exception as error:
+            # Left raw, so the next runs retry it
+            print("Error compacting " + changes_bucket_key(bucket) + ": " + str(error))
+    print("Compacted " + str(compacted) + " change log entries")
+    return {'compacted': compacted}
+
+
+# ********** REVIEWS ************#
+
+# The update conditions reject reviews of the reviewer's own requests and of
+# requests that have expired or were already reviewed, as both remove
+# request_ttl.
+REVIEW_CONDITION_FAILED = "Users can not review (approve/reject) their own requests"
+MAX_BATCH_REVIEWS = 100
+
+def apply_review(table, id, request_time, decision, reviewer, request_duration=None):
+    """
+    Approves or rejects one request with a conditional UpdateItem.
+
+    :param decision:          'approve' or 'reject'.
+    :param request_duration:  The approved duration in minutes, for 'approve'.
+    :return: True if the review was written, False if the request cannot be
+             reviewed by this reviewer.
+    """
+    now = datetime.utcnow()
+    epochTimeNow = int(time.time())
+    if decision == 'approve':
+        update_expression = "set request_status=:v1, expiration_time=:v2, review_time=:v3, reviewer=:v4, grant_key=:v6, grant_expiration=:v2, expiry_bucket=:v7"
+        values = {
+            ':v1': 'Approved',
+            ':v2': format_timestamp(now + timedelta(minutes=int(request_duration))),
+            ':v3': format_timestamp(now),
+            ':v4': reviewer,
+            ':v5': epochTimeNow,
+            ':v6': grant_key_for_id(id, request_time),
+            ':v7': expiry_bucket_for(now + timedelta(minutes=int(request_duration)))
+        }
+        remove_expression = " REMOVE request_ttl"
+    else:
+        update_expression = "set request_status=:v1, review_time=:v3, reviewer=:v4"
+        values = {
+            ':v1': 'Rejected',
+            ':v3': format_timestamp(now),
+            ':v4': reviewer,
+            ':v5': epochTimeNow
+        }
+        remove_expression = " REMOVE request_ttl, expiry_bucket"
+    if get_status_shards():
+        update_expression += ", status_shard=:v8"
+        values[':v8'] = status_shard_for(id, values[':v1'])
+    try:
+        table.update_item(
+            Key={
+                'id': id,
+                'request_time': request_time
+            },
+            UpdateExpression=update_expression + remove_expression,
+            ConditionExpression="requester <> :v4 AND request_ttl > :v5",
+            ExpressionAttributeValues=values,
+            ReturnValues="UPDATED_NEW"
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+    if decision == 'reject':
+        credential_cache.invalidate(id)
+    return True
+
+def review_entry(table, entry, reviewer):
+    """
+    Applies one entry of a batch review.
+
+    :return: The entry's result: id, request_time, decision, success and,
+             on failure, error.
+    """
+    result = {
+        'id': entry.get('id'),
+        'request_time': entry.get('request_time'),
+        'decision': entry.get('decision'),
+        'success': False
+    }
+    try:
+        if not (entry.get('id') and entry.get('request_time')):
+            result['error'] = "Error, id and request_time are required"
+        elif entry.get('decision') not in ('approve', 'reject'):
+            result['error'] = "Error, decision must be approve or reject"
+        elif entry['decision'] == 'approve' and not str(entry.get('request_duration', '')).isdigit():
+            result['error'] = "Error, request_duration is required to approve"
+        elif apply_review(table, entry['id'], entry['request_time'], entry['decision'], reviewer, entry.get('request_duration')):
+            result['success'] = True
+        else:
+            result['error'] = REVIEW_CONDITION_FAILED
+    except Exception as error:
+        print("Error reviewing " + str(entry.get('id')) + ": " + str(error))
+        result['error'] = str(error)
+    return result
+
+
+# ********** BULK REQUESTS ************#
+
+# create_requests writes one request per (account, role) target with
+# BatchWriteItem. The requests share a group_id and carry the list of
+# targets, so the stream handler can send a single approval notification for
+# the whole group.
+MAX_BULK_TARGETS = 25
+BATCH_WRITE_LIMIT = 25
+BATCH_WRITE_ATTEMPTS = 8
+
+def new_request_item(requester, request_account, request_role, request_duration, request_justification, request_time):
+    """
+    Returns the database record of a new pending request.
+    """
+    id = requester + '#' + request_account + '#' + request_role + '#' + str(request_time)
+    request = {
+        'id': id,
+        'requester': requester,
+        'request_account': request_account,
+        'request_role': request_role,
+        'request_duration': request_duration,
+        'request_justification': request_justification,
+        'request_status': 'Requested',
+        'request_time': request_time,
+        'request_ttl': request_ttl_for(request_time),
+        'expiry_bucket': expiry_bucket_for(request_ttl_for(request_time)),
+        'expiration_time': '',
+        'review_time': '',
+        'reviewer': ''
+    }
+    request.update(status_shard_values(id, 'Requested'))
+    return request
+
+class BatchWriteError(Exception):
+    """
+    Raised when BatchWriteItem could not write every request. unprocessed
+    holds the put and delete requests that were not written.
+    """
+    def __init__(self, message, unprocessed):
+        super().__init__(message)
+        self.unprocessed = unprocessed
+
+def batch_write_requests(items):
+    batch_write([{'PutRequest': {'Item': item}} for item in items])
+
+def batch_write(requests):
+    """
+    Sends the put and delete requests for the request table with
+    BatchWriteItem, retrying unprocessed items with full-jitter backoff.
+    Raises BatchWriteError with the requests that were not written.
+    """
+    dynamodb = get_resource('dynamodb')
+    table_name = os.environ['db_table']
+    for start in range(0, len(requests), BATCH_WRITE_LIMIT):
+        request_items = {table_name: requests[start:start + BATCH_WRITE_LIMIT]}
+        remaining = requests[start + BATCH_WRITE_LIMIT:]
+        for attempt in range(BATCH_WRITE_ATTEMPTS):
+            if attempt:
+                time.sleep(random.uniform(0, min(1.0, 0.05 * 2 ** attempt)))
+            try:
+                response = dynamodb.batch_write_item(RequestItems=request_items)
+            except ClientError as error:
+                raise BatchWriteError("BatchWriteItem failed: " + str(error), request_items[table_name] + remaining)
+            unprocessed = response.get('UnprocessedItems')
+            if not unprocessed:
+                break
+            request_items = unprocessed
+        else:
+            raise BatchWriteError("BatchWriteItem left items unprocessed after " + str(BATCH_WRITE_ATTEMPTS) + " attempts", request_items[table_name] + remaining)
+
+def parse_targets(targets):
+    """
+    Returns the (request_account, request_role) pairs of a create_requests
+    body, or None if they are missing, malformed, repeated or too many.
+    """
+    if not isinstance(targets, list) or not 0 < len(targets) <= MAX_BULK_TARGETS:
+        return None
+    pairs = []
+    for target in targets:
+        if not isinstance(target, dict) or not target.get('request_account') or not target.get('request_role'):
+            return None
+        pairs.append((str(target['request_account']), str(target['request_role'])))
+    if len(set(pairs)) != len(pairs):
+        return None
+    return pairs
+
+
+# ********** EXPORTS ************#
+
+# create_export records an export job in the state table and starts the
+# run_export function asynchronously. run_export streams a parallel scan of
+# the request table through a chain of generators (items -> rows -> encoded
+# bytes) into a multipart upload, so it holds at most one scan page per
+# segment and one upload part in memory whatever the size of the table.
+# get_export returns the status of the job and, once it is complete, a
+# presigned link to the file.
+EXPORT_FORMATS = {
+    'csv': {'suffix': '.csv', 'content_type': 'text/csv'},
+    'jsonl': {'suffix': '.jsonl.gz', 'content_type': 'application/gzip'}
+}
+# S3 rejects parts other than the last one below 5 MiB
+MIN_PART_BYTES = 5 * 1024 * 1024
+READ_CHUNK_BYTES = 1024 * 1024
+# Leading characters that make spreadsheet applications evaluate a cell
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+class ExportError(Exception):
+    pass
+
+def get_export_part_bytes():
+    return max(int(os.environ.get('export_part_bytes', 8 * 1024 * 1024)), MIN_PART_BYTES)
+
+def get_export_retention():
+    return timedelta(hours=int(os.environ.get('export_retention_hours', 24)))
+
+def export_job_key(export_id):
+    return {'pk': 'export#' + export_id, 'sk': 'job'}
+
+class ObjectStore(ABC):
+    """
+    It stores export and archive files, uploaded as numbered parts that,
+    except for the last one, hold at least MIN_PART_BYTES.
+    """
+    @abstractmethod
+    def start_upload(self, key, content_type):
+        pass
+
+    @abstractmethod
+    def upload_part(self, key, upload_id, number, data):
+        pass
+
+    @abstractmethod
+    def complete_upload(self, key, upload_id, parts):
+        pass
+
+    @abstractmethod
+    def abort_upload(self, key, upload_id):
+        pass
+
+    @abstractmethod
+    def url(self, key, filename, expires_in):
+        pass
+
+    @abstractmethod
+    def read(self, key, start=0):
+        """
+        Yields the content of a file from byte offset start in chunks.
+        """
+        pass
+
+class S3ObjectStore(ObjectStore):
+    """
+    It stores files in an S3 bucket and hands out presigned links.
+    """
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.s3 = get_client('s3')
+
+    def start_upload(self, key, content_type):
+        return self.s3.create_multipart_upload(Bucket=self.bucket, Key=key, ContentType=content_type)['UploadId']
+
+    def upload_part(self, key, upload_id, number, data):
+        response = self.s3.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id, PartNumber=number, Body=data)
+        return {'PartNumber': number, 'ETag': response['ETag']}
+
+    def complete_upload(self, key, upload_id, parts):
+        self.s3.complete_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id, MultipartUpload={'Parts': parts})
+
+    def abort_upload(self, key, upload_id):
+        self.s3.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+
+    def url(self, key, filename, expires_in):
+        return self.s3.generate_presigned_url('get_object', Params={
+            'Bucket': self.bucket,
+            'Key': key,
+            'ResponseContentDisposition': 'attachment; filename="' + filename + '"'
+        }, ExpiresIn=expires_in)
+
+    def read(self, key, start=0):
+        kwargs = {'Range': 'bytes=' + str(start) + '-'} if start else {}
+        return self.s3.get_object(Bucket=self.bucket, Key=key, **kwargs)['Body'].iter_chunks(READ_CHUNK_BYTES)
+
+class LocalObjectStore(ObjectStore):
+    """
+    It stores files in a local directory, for running the export and archive
+    jobs outside of AWS. Parts are kept as files until the upload completes.
+    """
+    def __init__(self, root):
+        self.root = root
+
+    def part_path(self, upload_id, number):
+        return os.path.join(self.root, '.uploads', upload_id, str(number))
+
+    def start_upload(self, key, content_type):
+        upload_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.root, '.uploads', upload_id))
+        return upload_id
+
+    def upload_part(self, key, upload_id, number, data):
+        with open(self.part_path(upload_id, number), 'wb') as part:
+            part.write(data)
+        return {'PartNumber': number, 'ETag': hashlib.md5(data).hexdigest()}
+
+    def complete_upload(self, key, upload_id, parts):
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as target:
+            for part in parts:
+                with open(self.part_path(upload_id, part['PartNumber']), 'rb') as source:
+                    shutil.copyfileobj(source, target)
+        self.abort_upload(key, upload_id)
+
+    def abort_upload(self, key, upload_id):
+        shutil.rmtree(os.path.join(self.root, '.uploads', upload_id), ignore_errors=True)
+
+    def url(self, key, filename, expires_in):
+        return 'file://' + os.path.abspath(os.path.join(self.root, key))
+
+    def read(self, key, start=0):
+        with open(os.path.join(self.root, key), 'rb') as source:
+            source.seek(start)
+            for chunk in iter(lambda: source.read(READ_CHUNK_BYTES), b''):
+                yield chunk
+
+def get_object_store(kind='export'):
+    """
+    Returns the store of a kind of file: the bucket in the <kind>_bucket
+    environment variable, or else the directory in <kind>_path.
+    """
+    if os.environ.get(kind + '_bucket'):
+        return S3ObjectStore(os.environ[kind + '_bucket'])
+    return LocalObjectStore(os.environ.get(kind + '_path', '/tmp/' + kind + 's'))
+
+class MultipartWriter:
+    """
+    It writes a file to an object store as a multipart upload, holding back
+    no more than one part.
+    """
+    def __init__(self, store, key, content_type, part_bytes=None):
+        """
+        Initializes the writer and starts the upload.
+
+        :param store:         The ObjectStore.
+        :param key:           The key of the file.
+        :param content_type:  The media type of the file.
+        :param part_bytes:    The size of every part but the last.
+        """
+        self.store = store
+        self.key = key
+        self.part_bytes = part_bytes or get_export_part_bytes()
+        self.buffer = bytearray()
+        self.parts = []
+        self.size = 0
+        self.upload_id = store.start_upload(key, content_type)
+
+    def flush_part(self):
+        data = bytes(self.buffer[:self.part_bytes])
+        del self.buffer[:self.part_bytes]
+        self.parts.append(self.store.upload_part(self.key, self.upload_id, len(self.parts) + 1, data))
+
+    def write(self, data):
+        self.buffer.extend(data)
+        self.size += len(data)
+        while len(self.buffer) >= self.part_bytes:
+            self.flush_part()
+
+    def close(self):
+        # An upload needs at least one part, even an empty one
+        if self.buffer or not self.parts:
+            self.flush_part()
+        self.store.complete_upload(self.key, self.upload_id, self.parts)
+
+    def abort(self):
+        self.store.abort_upload(self.key, self.upload_id)
+
+def export_rows(scanner, deadline):
+    """
+    Yields the row of every request the scan reads.
+    """
+    for page in scanner.pages(deadline=deadline):
+        for item in page:
+            yield request_row(item)
+    if not scanner.complete:
+        raise ExportError("The export did not finish before the function timed out")
+
+def csv_cell(value):
+    value = str(value)
+    if value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def encode_csv(rows):
+    """
+    Yields the header and then every row as a line of UTF-8 CSV.
+    """
+    names = [name for name, default in REQUEST_ATTRIBUTES]
+    line = io.StringIO()
+    writer = csv.writer(line)
+    writer.writerow(names)
+    yield line.getvalue().encode()
+    for row in rows:
+        line.seek(0)
+        line.truncate()
+        writer.writerow([csv_cell(row[name]) for name in names])
+        yield line.getvalue().encode()
+
+def encode_jsonl_gzip(rows, block_rows=None):
+    """
+    Yields a gzip stream of the rows as JSON Lines.
+
+    :param block_rows:  If given, a new gzip member is started after every
+                        block_rows rows, so a reader can start at any member.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for number, row in enumerate(rows, 1):
+        data = compressor.compress((json.dumps(row, separators=(',', ':'), default=str) + '\n').encode())
+        if block_rows and number % block_rows == 0:
+            data += compressor.flush()
+            compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        if data:
+            yield data
+    yield compressor.flush()
+
+EXPORT_ENCODERS = {
+    'csv': encode_csv,
+    'jsonl': encode_jsonl_gzip
+}
+
+def write_file(store, key, content_type, chunks):
+    """
+    Uploads the chunks of bytes to the object store as one file.
+
+    :return: The size of the file in bytes.
+    """
+    writer = MultipartWriter(store, key, content_type)
+    try:
+        for data in chunks:
+            writer.write(data)
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.size
+
+def write_export(store, key, export_format, rows):
+    """
+    Uploads the encoded rows to the object store.
+
+    :return: The number of rows and the size of the file in bytes.
+    """
+    counter = {'rows': 0}
+    def counted(rows):
+        for row in rows:
+            counter['rows'] += 1
+            yield row
+    size = write_file(store, key, EXPORT_FORMATS[export_format]['content_type'], EXPORT_ENCODERS[export_format](counted(rows)))
+    return counter['rows'], size
+
+def run_export(event, context):
+    """
+    Runs the export job started by create_export.
+
+    :param event:  {"export_id": ...}
+    """
+    export_id = event['export_id']
+    state_table = get_state_table()
+    job = state_table.get_item(Key=export_job_key(export_id)).get('Item')
+    if job is None or job['export_status'] != 'Running':
+        print("No running export " + export_id)
+        return
+    scanner = ParallelScan(get_table(), projection())
+    try:
+        rows, size = write_export(get_object_store(), job['object_key'], job['export_format'], export_rows(scanner, get_deadline(context)))
+        print("Exported " + str(rows) + " requests (" + str(size) + " bytes) to " + job['object_key'])
+        state_table.update_item(
+            Key=export_job_key(export_id),
+            UpdateExpression='SET export_status = :s, export_rows = :r, export_bytes = :b, completed_time = :t',
+            ExpressionAttributeValues={':s': 'Complete', ':r': rows, ':b': size, ':t': timestamp_now()}
+        )
+    except Exception as error:
+        print("Error running export " + export_id, error)
+        traceback.print_exc()
+        state_table.update_item(
+            Key=export_job_key(export_id),
+            UpdateExpression='SET export_status = :s, export_error = :e, completed_time = :t',
+            ExpressionAttributeValues={':s': 'Failed', ':e': str(error), ':t': timestamp_now()}
+        )
+
+def export_view(job):
+    """
+    Returns the job as returned by the API, with a link once it is complete.
+    """
+    view = {
+        'export_id': job['pk'].split('#', 1)[1],
+        'export_format': job['export_format'],
+        'export_status': job['export_status'],
+        'request_time': job['request_time']
+    }
+    if job['export_status'] == 'Complete':
+        filename = 'requests-' + job['request_time'][:10] + EXPORT_FORMATS[job['export_format']]['suffix']
+        view['export_rows'] = int(job['export_rows'])
+        view['url'] = get_object_store().url(job['object_key'], filename, int(os.environ.get('export_url_seconds', 900)))
+    elif job['export_status'] == 'Failed':
+        view['error'] = job.get('export_error', '')
+    return view
+
+
+# ********** ARCHIVE ************#
+
+# archive_requests moves completed requests older than archive_after_days out
+# of the request table into gzipped JSON Lines files, partitioned by the day
+# of their request_time under archive/requests/date=<day>/. Every file has an
+# index item in the state table (pk 'archive', sk '<day>#<file id>'), so the
+# audit API finds the files of a request_time range with one query and reads
+# no other partition. A file stays pending until its requests are deleted
+# from the request table, and readers skip the rows of a pending file that
+# are still there. Files are written as one gzip member per ARCHIVE_BLOCK_ROWS
+# rows, and a page token holds the byte offset of the member to continue
+# from, so a page only decompresses the rows it returns and the rest of one
+# block.
+ARCHIVE_STATUSES = ('Ended', 'Rejected', 'Expired')
+ARCHIVE_BLOCK_ROWS = 1000
+ARCHIVE_INDEX_PK = 'archive'
+# The newest request_time archived so far, which tells get_changes that a
+# deleted request was moved to the archive
+ARCHIVE_HORIZON_KEY = {'pk': 'archive', 'sk': 'horizon'}
+
+def get_archive_after():
+    return timedelta(days=int(os.environ.get('archive_after_days', 90)))
+
+def get_archive_batch_size():
+    return int(os.environ.get('archive_batch_size', 10000))
+
+def get_unpaged_archive_rows():
+    return int(os.environ.get('unpaged_archive_rows', 10000))
+
+def sortable_time(value):
+    if is_legacy_timestamp(value):
+        return format_timestamp(parse_timestamp(value))
+    return value
+
+def in_time_range(item, time_from, time_to):
+    request_time = sortable_time(item['request_time'])
+    return not ((time_from and request_time < time_from) or (time_to and request_time > time_to))
+
+def request_time_filter(time_from, time_to):
+    """
+    Returns the request_time filter of a scan for the optional range, or None.
+    """
+    if time_from and time_to:
+        return Attr('request_time').between(time_from, time_to)
+    if time_from:
+        return Attr('request_time').gte(time_from)
+    if time_to:
+        return Attr('request_time').lte(time_to)
+    return None
+
+def query_items(table, query_kwargs):
+    """
+    Yields the items of a query, one page at a time.
+    """
+    query_kwargs = dict(query_kwargs)
+    while True:
+        response = table.query(**query_kwargs)
+        for item in response['Items']:
+            yield item
+        if 'LastEvaluatedKey' not in response:
+            return
+        query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def completed_items(table, before):
+    """
+    Yields the completed requests made before the given time, oldest first,
+    merged from the status index of every completed status.
+    """
+    queries = []
+    for status in ARCHIVE_STATUSES:
+        if get_status_shards():
+            for shard in range(get_status_shards()):
+                queries.append({
+                    'IndexName': 'request-status-shard-index',
+                    'KeyConditionExpression': Key('status_shard').eq(status + '#' + str(shard)) & Key('request_time').lt(before)
+                })
+        else:
+            queries.append({
+                'IndexName': 'request-status-index',
+                'KeyConditionExpression': Key('request_status').eq(status) & Key('request_time').lt(before)
+            })
+    merged = heapq.merge(*[query_items(table, query_kwargs) for query_kwargs in queries], key=lambda item: item['request_time'])
+    for item in merged:
+        # Legacy timestamps sort before every ISO-8601 one
+        if sortable_time(item['request_time']) < before:
+            yield item
+
+def read_archive_rows(store, object_key, start=0):
+    """
+    Yields (block, number, item) for the items of an archive file from the
+    gzip member at byte offset start, where block is the offset of the member
+    that holds the item and number the line of the item in the member.
+    """
+    block = start
+    member_bytes = 0
+    number = 0
+    decompressor = zlib.decompressobj(31)
+    rest = b''
+    for chunk in store.read(object_key, start):
+        while chunk:
+            lines = (rest + decompressor.decompress(chunk)).split(b'\n')
+            rest = lines.pop()
+            for line in lines:
+                yield block, number, json.loads(line)
+                number += 1
+            if not decompressor.eof:
+                member_bytes += len(chunk)
+                break
+            # The next member starts in the unused part of the chunk
+            unused = decompressor.unused_data
+            block += member_bytes + len(chunk) - len(unused)
+            chunk = unused
+            member_bytes = 0
+            number = 0
+            decompressor = zlib.decompressobj(31)
+    rest += decompressor.flush()
+    if rest:
+        yield block, number, json.loads(rest)
+
+def read_archive(store, object_key):
+    """
+    Yields the items of an archive file.
+    """
+    for block, number, item in read_archive_rows(store, object_key):
+        yield item
+
+def batch_delete_requests(keys):
+    batch_write([{'DeleteRequest': {'Key': key}} for key in keys])
+
+def finish_archive_file(state_table, index_item, keys):
+    """
+    Deletes the archived requests of a file from the request table and marks
+    the file complete.
+    """
+    batch_delete_requests(keys)
+    state_table.update_item(
+        Key={'pk': index_item['pk'], 'sk': index_item['sk']},
+        UpdateExpression='SET archive_status = :s',
+        ExpressionAttributeValues={':s': 'complete'}
+    )
+
+def archive_day(state_table, store, day, items):
+    """
+    Archives requests of one day: writes them to a new file, indexes the
+    file, then deletes them from the request table.
+
+    :param items:  The requests, oldest first.
+    :return: The index item of the file.
+    """
+    file_id = uuid.uuid4().hex
+    keys = []
+    def tracked(items):
+        for item in items:
+            keys.append({'id': item['id'], 'request_time': item['request_time']})
+            yield item
+    object_key = 'archive/requests/date=' + day + '/' + file_id + '.jsonl.gz'
+    size = write_file(store, object_key, 'application/gzip', encode_jsonl_gzip(tracked(items), ARCHIVE_BLOCK_ROWS))
+    index_item = {
+        'pk': ARCHIVE_INDEX_PK,
+        'sk': day + '#' + file_id,
+        'object_key': object_key,
+        'rows': len(keys),
+        'first_time': sortable_time(keys[0]['request_time']),
+        'last_time': sortable_time(keys[-1]['request_time']),
+        'archive_status': 'pending'
+    }
+    state_table.put_item(Item=index_item)
+    finish_archive_file(state_table, index_item, keys)
+    print("Archived " + str(len(keys)) + " requests of " + day + " (" + str(size) + " bytes) to " + object_key)
+    return index_item
+
+def finish_pending_archives(state_table, store):
+    """
+    Completes the files of a previous run that stopped before deleting their
+    requests from the request table.
+    """
+    for index_item in query_items(state_table, {
+        'KeyConditionExpression': Key('pk').eq(ARCHIVE_INDEX_PK),
+        'FilterExpression': Attr('archive_status').eq('pending')
+    }):
+        keys = [{'id': item['id'], 'request_time': item['request_time']} for item in read_archive(store, index_item['object_key'])]
+        finish_archive_file(state_table, index_item, keys)
+        print("Completed the pending archive file " + index_item['object_key'])
+
+def advance_archive_horizon(state_table, request_time):
+    try:
+        state_table.put_item(
+            Item=dict(ARCHIVE_HORIZON_KEY, request_time=request_time),
+            ConditionExpression='attribute_not_exists(request_time) OR request_time < :t',
+            ExpressionAttributeValues={':t': request_time}
+        )
+    except ClientError as error:
+        if error.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+def read_archive_horizon():
+    item = get_state_table().get_item(Key=ARCHIVE_HORIZON_KEY).get('Item')
+    return item and item['request_time']
+
+def archive_requests(event, context):
+    """
+    Scheduled entry point that moves completed requests older than
+    archive_after_days to the archive, at most archive_batch_size (rounded
+    up to whole days) per run.
+    """
+    table = get_table()
+    state_table = get_state_table()
+    store = get_object_store('archive')
+    finish_pending_archives(state_table, store)
+    before = format_timestamp(datetime.utcnow() - get_archive_after())
+    deadline = get_deadline(context)
+    archived = 0
+    for day, items in itertools.groupby(completed_items(table, before), key=lambda item: parse_timestamp(item['request_time']).strftime('%Y-%m-%d')):
+        if archived >= get_archive_batch_size() or (deadline is not None and time.monotonic() >= deadline):
+            break
+        index_item = archive_day(state_table, store, day, items)
+        archived += index_item['rows']
+        advance_archive_horizon(state_table, index_item['last_time'])
+    print("Archived " + str(archived) + " requests made before " + before)
+    return {'archived': archived}
+
+def archive_files(time_from=None, time_to=None):
+    """
+    Returns the index items of the archive files that can hold requests of
+    the request_time range, newest day first.
+    """
+    if not os.environ.get('state_table'):
+        return []
+    key_condition = Key('pk').eq(ARCHIVE_INDEX_PK) & Key('sk').between(
+        time_from[:10] if time_from else '0000-00-00',
+        (time_to[:10] if time_to else '9999-99-99') + '#~'
+    )
+    files = []
+    for index_item in query_items(get_state_table(), {'KeyConditionExpression': key_condition, 'ScanIndexForward': False}):
+        if (time_from and index_item['last_time'] < time_from) or (time_to and index_item['first_time'] > time_to):
+            continue
+        files.append(index_item)
+    return files
+
+def read_archive_page(files, position, time_from, time_to, limit):
+    """
+    Reads the archived requests of the request_time range from a position in
+    the archive files.
+
+    :param files:     The index items returned by archive_files.
+    :param position:  The sk of a file, the byte offset of a block in it and
+                      the number of the block's rows already read, or None
+                      to start from the first file.
+    :param limit:     The page size.
+    :return: (items, position of the next page or None)
+    """
+    store = get_object_store('archive')
+    start, block, offset = 0, 0, 0
+    if position:
+        start = next((index for index, index_item in enumerate(files) if index_item['sk'] == position['f']), None)
+        if start is None:
+            raise PageTokenError("Invalid next_token")
+        # Tokens of single block files written before blocks have no offset
+        block, offset = position.get('b', 0), position['o']
+    items = []
+    unconfirmed = []
+    next_position = None
+    for index in range(start, len(files)):
+        pending = files[index]['archive_status'] == 'pending'
+        for item_block, number, item in read_archive_rows(store, files[index]['object_key'], block if index == start else 0):
+            if index == start and item_block == block and number < offset:
+                continue
+            if len(items) >= limit:
+                next_position = {'f': files[index]['sk'], 'b': item_block, 'o': number}
+                break
+            if in_time_range(item, time_from, time_to):
+                items.append(item)
+                if pending:
+                    unconfirmed.append(item)
+        if next_position:
+            break
+    if unconfirmed:
+        # Rows of a pending file may still be in the request table, which
+        # returns them already
+        hot = set((item['id'], item['request_time']) for item in batch_get_requests([(item['id'], item['request_time']) for item in unconfirmed]))
+        items = [item for item in items if (item['id'], item['request_time']) not in hot]
+    return items, next_position
+
+def audit_items(table, context, time_from, time_to, limit, position):
+    """
+    Reads the requests of the request_time range from the request table and
+    then from the archive.
+
+    :param limit:     The page size, or None for every request.
+    :param position:  The position returned with the previous page, or None
+                      to start with the request table.
+    :return: (items, position or None). Without a limit, the position is
+             not None if the scan of the request table ran out of time or
+             the range holds more than unpaged_archive_rows archived
+             requests.
+    """
+    position = position or {'h': None}
+    items = []
+    if 'h' in position:
+        scan_kwargs = projection()
+        time_filter = request_time_filter(time_from, time_to)
+        if time_filter is not None:
+            scan_kwargs['FilterExpression'] = time_filter
+        scanner = ParallelScan(table, scan_kwargs)
+        if position['h'] is not None:
+            scanner.resume(decode_scan_state(position['h']))
+        items = scanner.scan(deadline=get_deadline(context), max_items=limit)
+        if not scanner.complete:
+            return items, {'h': scanner.segment_state}
+        files = archive_files(time_from, time_to)
+        if not files:
+            return items, None
+        if limit:
+            return items, {'a': None}
+        # The response holds every row, so only so many are read
+        archived, next_position = read_archive_page(files, None, time_from, time_to, get_unpaged_archive_rows())
+        return items + archived, next_position and {'a': next_position}
+    if 'a' in position:
+        archived, next_position = read_archive_page(archive_files(time_from, time_to), position['a'], time_from, time_to, limit)
+        return archived, next_position and {'a': next_position}
+    raise PageTokenError("Invalid next_token")
+
+
+# ********** STATISTICS ************#
+
+# The stream handler keeps per-day counters in the aggregates table, one item
+# per dimension and day (pk 'status', 'account', 'role' or 'reviewer', sk
+# '<YYYY-MM-DD>'). A counter attribute is named after the status, or
+# '<value>#<status>' for the other dimensions, and counts the requests that
+# were created (Requested) or moved to that status during the day.
+STATISTICS_DIMENSIONS = ('status', 'account', 'role', 'reviewer')
+STATISTICS_DAY_FORMAT = '%Y-%m-%d'
+MAX_STATISTICS_DAYS = 366
+
+def statistics_days(event):
+    """
+    Returns the days of the optional 'from' and 'to' query string parameters
+    (YYYY-MM-DD), the last 30 days by default, or None if they are invalid.
+    """
+    try:
+        day_to = deep_get(event, ["queryStringParameters", "to"])
+        day_to = datetime.strptime(day_to, STATISTICS_DAY_FORMAT) if day_to else datetime.utcnow()
+        day_from = deep_get(event, ["queryStringParameters", "from"])
+        day_from = datetime.strptime(day_from, STATISTICS_DAY_FORMAT) if day_from else day_to - timedelta(days=29)
+    except ValueError:
+        return None
+    count = (day_to.date() - day_from.date()).days + 1
+    if count < 1 or count > MAX_STATISTICS_DAYS:
+        return None
+    return [(day_from + timedelta(days=offset)).strftime(STATISTICS_DAY_FORMAT) for offset in range(count)]
+
+def read_statistics(days):
+    """
+    Reads the counters of the days with BatchGetItem and sums them.
+
+    :return: The status counters of every day, and the totals of every
+             dimension over the days.
+    """
+    keys = [{'pk': dimension, 'sk': day} for day in days for dimension in STATISTICS_DIMENSIONS]
+    daily = {day: {} for day in days}
+    totals = {dimension: {} for dimension in STATISTICS_DIMENSIONS}
+    for item in batch_get(os.environ['aggregates_table'], keys):
+        dimension = item.pop('pk')
+        day = item.pop('sk')
+        for attribute, count in item.items():
+            if dimension == 'status':
+                daily[day][attribute] = int(count)
+                totals['status'][attribute] = totals['status'].get(attribute, 0) + int(count)
+            else:
+                value, status = attribute.rsplit('#', 1)
+                counts = totals[dimension].setdefault(value, {})
+                counts[status] = counts.get(status, 0) + int(count)
+    return {
+        'from': days[0],
+        'to': days[-1],
+        'days': [{'day': day, 'status': daily[day]} for day in days],
+        'totals': totals
+    }
+
+
 # ********** Query METHODS ************#
 
 def get_requests(event, context):
-    loader = DatabaseLoader()
     return loader.get_requests(event, context)
 
 def get_pending_requests(event, context):
-    loader = DatabaseLoader()
     return loader.get_pending_requests(event, context)
 
 def get_processed_requests(event, context):
-    loader = DatabaseLoader()
     return loader.get_processed_requests(event, context)
 
 def get_all_requests(event, context):
-    loader = DatabaseLoader()
     return loader.get_all_requests(event, context)
 
 def create_request(event, context):
-    loader = DatabaseLoader()
     return loader.create_request(event, context)
 
+def create_requests(event, context):
+    return loader.create_requests(event, context)
+
 def delete_request(event, context):
-    loader = DatabaseLoader()
     return loader.delete_request(event, context)
 
 def approve_request(event, context):
-    loader = DatabaseLoader()
     return loader.approve_request(event, context)
 
 def reject_request(event, context):
-    loader = DatabaseLoader()
     return loader.reject_request(event, context)
 
+def review_requests(event, context):
+    return loader.review_requests(event, context)
+
 def federate_console(event, context):
-    loader = DatabaseLoader()
     return loader.federate_console(event, context)
 
 def federate_cli(event, context):
-    loader = DatabaseLoader()
     return loader.federate_cli(event, context)
 
+def get_changes(event, context):
+    return loader.get_changes(event, context)
+
+def create_export(event, context):
+    return loader.create_export(event, context)
+
+def get_export(event, context):
+    return loader.get_export(event, context)
+
+def get_statistics(event, context):
+    return loader.get_statistics(event, context)
+
 class DatabaseLoader:
 
-    def get_requests(self, event, context):
+    @authenticated
+    def get_requests(self, event, context, principal):
         result = ''
         status_code = 500
         requests = list()
         try:
-            AuthHeader = event['headers']['Authorization']
-            accessToken = AuthHeader[len('Bearer '):]
-            accessTokenSplit = accessToken.split(' ', 1)[0]
-            decodedToken = jwt.decode(accessTokenSplit, algorithms=["RS256"], options={"verify_signature": False})
-            requester = decodedToken['sub']
+            requester = principal.subject
             epochTimeNow = int(time.time()) 
 
             if requester:
-                dynamodb = boto3.resource('dynamodb')
-                dbname = os.environ['db_table']
-                table = dynamodb.Table(dbname)
-                now = datetime.now().strftime('%x %X')
-                response = table.query(
-                    IndexName='requester-index',
-                    KeyConditionExpression=Key('requester').eq(requester),
-                    ScanIndexForward=False
-                )
-                for item in response['Items']:
-                    try:
-                        if item['request_ttl'] < epochTimeNow:
-                            item['request_status'] = "Expired"
-                            table.put_item(Item=item)
-                    except KeyError:
-                        pass
-                    if item['request_status'] == "Approved" and item['expiration_time'] <= now:
-                        item['request_status'] = "Ended"
-                        table.put_item(Item=item)     
-                    request = Request(item)
-                    requests.append(request)
-                while 'LastEvaluatedKey' in response:
-                    response = table.query(
-                        IndexName='requester-index',
-                        KeyConditionExpression=Key('requester').eq(requester),
-                        ScanIndexForward=False,
-                        ExclusiveStartKey=response['LastEvaluatedKey']
-                    )
-                    for item in response['Items']:   
-                        try:
-                            if item['request_ttl'] < epochTimeNow:
-                                item['request_status'] = "Expired"
-                                table.put_item(Item=item)
-                        except KeyError:
-                            pass
-                        if item['request_status'] == "Approved" and item['expiration_time'] <= now:
-                            item['request_status'] = "Ended"
-                            table.put_item(Item=item)     
-                        request = Request(item)
-                        requests.append(request)
-                result = [request.to_dict() for request in requests]
+                table = get_table()
+                now = timestamp_now()
+                key_condition = Key('requester').eq(requester)
+                time_condition = request_time_condition(event)
+                if time_condition:
+                    key_condition = key_condition & time_condition
+                query_kwargs = {
+                    'IndexName': 'requester-index',
+                    'KeyConditionExpression': key_condition,
+                    'ScanIndexForward': False,
+                    **projection('request_ttl')
+                }
+                limit, next_token = get_page_params(event)
+                if next_token:
+                    query_kwargs['ExclusiveStartKey'] = decode_page_token('get_requests', next_token)
+                if limit:
+                    query_kwargs['Limit'] = limit
+                done = False
+                start_key = None
+                while not done:
+                    if start_key:
+                        query_kwargs['ExclusiveStartKey'] = start_key
+                    response = table.query(**query_kwargs)
+                    for item in response['Items']:
+                        # The sweeper persists the transition once the
+                        # request's expiry bucket is due
+                        item['request_status'] = derive_status(item, epochTimeNow, now)
+                        requests.append(request_row(item))
+                    start_key = response.get('LastEvaluatedKey', None)
+                    done = start_key is None or limit is not None
+                result = requests
+                if limit:
+                    result = to_page(result, start_key and encode_page_token('get_requests', start_key))
                 status_code = 200
             else:
                 result = "Error, incorrect post body"
                 status_code = 400
+        except (PageTokenError, QueryParameterError) as error:
+            result = str(error)
+            status_code = 400
         except Exception as error:
             print("Error running get requests", error)
             traceback.print_exc()
             result = str(error)
-        response = {
-            "statusCode": status_code,
-            "body": json.dumps(result, indent=2, sort_keys=True, default=str)
-        }
-        return response
+        return encode_response(event, status_code, result)
 
-    def get_pending_requests(self, event, context):
+    @authenticated
+    def get_pending_requests(self, event, context, principal):
         result = ''
         status_code = 500
-        requests = list()
         try:
-            dynamodb = boto3.resource('dynamodb')
-            dbname = os.environ['db_table']
-            table = dynamodb.Table(dbname)
-            AuthHeader = event['headers']['Authorization']
-            idToken = AuthHeader[len('Bearer '):]
-            idTokenSplit = idToken.split(' ', 1)[-1]
-            decodedToken = jwt.decode(idTokenSplit, algorithms=["RS256"], options={"verify_signature": False})
-            groups = decodedToken['groups']
-            requester = decodedToken['email']
+            table = get_table()
+            requester = principal.email
             reviewerGroup = os.environ['reviewer_group'] 
             epochTimeNow = int(time.time()) 
-            if reviewerGroup in groups:
-                response = table.query(
-                    IndexName='request-status-index',
-                    KeyConditionExpression=Key('request_status').eq('Requested'),
-                    FilterExpression=Attr('request_ttl').gt(epochTimeNow),
-                    ScanIndexForward=False
-                    )
-                for item in response['Items']:
-                    request = Request(item)
-                    requests.append(request)
-                result = [request.to_dict() for request in requests]
+            if principal.in_group(reviewerGroup) and os.environ.get('state_table'):
+                limit, next_token = get_page_params(event)
+                position = None
+                if next_token:
+                    position = decode_page_token('get_pending_requests#snapshot', next_token)
+                time_from, time_to = request_time_range(event)
+                items, position = snapshot_page(pending_snapshot.get(table), epochTimeNow, time_from, time_to, limit, position)
+                result = [request_row(item) for item in items]
+                if limit:
+                    result = to_page(result, position and encode_page_token('get_pending_requests#snapshot', position))
+                return encode_response(event, 200, result, etag=True)
+            elif principal.in_group(reviewerGroup) and get_status_shards():
+                limit, next_token = get_page_params(event)
+                positions = None
+                if next_token:
+                    positions = decode_page_token('get_pending_requests#sharded', next_token)
+                items, positions = query_status_shards(table, 'Requested', request_time_condition(event), Attr('request_ttl').gt(epochTimeNow), limit, positions, attributes=[])
+                result = [request_row(item) for item in items]
+                if limit:
+                    result = to_page(result, positions and encode_page_token('get_pending_requests#sharded', positions))
+                status_code = 200
+            elif principal.in_group(reviewerGroup):
+                key_condition = Key('request_status').eq('Requested')
+                time_condition = request_time_condition(event)
+                if time_condition:
+                    key_condition = key_condition & time_condition
+                query_kwargs = {
+                    'IndexName': 'request-status-index',
+                    'KeyConditionExpression': key_condition,
+                    'FilterExpression': Attr('request_ttl').gt(epochTimeNow),
+                    'ScanIndexForward': False,
+                    **projection()
+                }
+                limit, next_token = get_page_params(event)
+                if next_token:
+                    query_kwargs['ExclusiveStartKey'] = decode_page_token('get_pending_requests', next_token)
+                if limit:
+                    query_kwargs['Limit'] = limit
+                response = table.query(**query_kwargs)
+                result = [request_row(item) for item in response['Items']]
+                if limit:
+                    start_key = response.get('LastEvaluatedKey', None)
+                    result = to_page(result, start_key and encode_page_token('get_pending_requests', start_key))
                 status_code = 200
             else:
-                result = "The idToken for " + reviewer + " does not contain the " + reviewerGroup + " group"
+                result = "The idToken for " + requester + " does not contain the " + reviewerGroup + " group"
                 print(result)
                 status_code = 400
+        except (PageTokenError, QueryParameterError) as error:
+            result = str(error)
+            status_code = 400
         except Exception as error:
             print("Error running get pending requests", error)
             traceback.print_exc()
             result = str(error)
-        response = {
-            "statusCode": status_code,
-            "body": json.dumps(result, indent=2, sort_keys=True, default=str)
-        }
-        return response
+        return encode_response(event, status_code, result)
 
-    def get_processed_requests(self, event, context):
+    @authenticated
+    def get_processed_requests(self, event, context, principal):
         result = ''
         status_code = 500
-        requests = list()
         try:
-            AuthHeader = event['headers']['Authorization']
-            idToken = AuthHeader[len('Bearer '):]
-            idTokenSplit = idToken.split(' ', 1)[-1]
-            decodedToken = jwt.decode(idTokenSplit, algorithms=["RS256"], options={"verify_signature": False})
-            groups = decodedToken['groups']
-            reviewer = decodedToken['email']
+            reviewer = principal.email
             reviewerGroup = os.environ['reviewer_group'] 
-            if reviewerGroup in groups:
-                dynamodb = boto3.resource('dynamodb')
-                dbname = os.environ['db_table']
-                table = dynamodb.Table(dbname)
+            if principal.in_group(reviewerGroup):
+                table = get_table()
                 scan_kwargs = {
-                    'FilterExpression': Attr('request_status').ne('Requested') & Attr('request_status').ne('Expired')
+                    'FilterExpression': Attr('request_status').ne('Requested') & Attr('request_status').ne('Expired'),
+                    **projection()
                 }
-                done = False
-                start_key = None
-                while not done:
-                    if start_key:
-                        scan_kwargs['ExclusiveStartKey'] = start_key
-                    response = table.scan(**scan_kwargs)
-                    start_key = response.get('LastEvaluatedKey', None)
-                    done = start_key is None
-                for item in response['Items']:
-                    request = Request(item)
-                    requests.append(request)
-                result = [request.to_dict() for request in requests]
-                status_code = 200
+                scanner = ParallelScan(table, scan_kwargs)
+                limit, next_token = get_page_params(event)
+                if next_token:
+                    scanner.resume(decode_scan_state(decode_page_token('get_processed_requests', next_token)))
+                result = [request_row(item) for item in scanner.scan(deadline=get_deadline(context), max_items=limit)]
+                if limit:
+                    result = to_page(result, None if scanner.complete else encode_page_token('get_processed_requests', scanner.segment_state))
+                    status_code = 200
+                else:
+                    status_code = 200 if scanner.complete else 206
             else:
                 result = "The idToken for " + reviewer + " does not contain the " + reviewerGroup + " group"
                 print(result)
                 status_code = 400
+        except (PageTokenError, QueryParameterError) as error:
+            result = str(error)
+            status_code = 400
         except Exception as error:
             print("Error running get processed requests", error)
             traceback.print_exc()
             result = str(error)
-        response = {
-            "statusCode": status_code,
-            "body": json.dumps(result, indent=2, sort_keys=True, default=str)
-        }
-        return response
+        return encode_response(event, status_code, result)
 
-    def get_all_requests(self, event, context):
+    @authenticated
+    def get_all_requests(self, event, context, principal):
         result = ''
         status_code = 500
-        requests = list()
         try:
-            dynamodb = boto3.resource('dynamodb')
-            dbname = os.environ['db_table']
-            table = dynamodb.Table(dbname)
-            AuthHeader = event['headers']['Authorization']
-            idToken = AuthHeader[len('Bearer '):]
-            idTokenSplit = idToken.split(' ', 1)[-1]
-            decodedToken = jwt.decode(idTokenSplit, algorithms=["RS256"], options={"verify_signature": False})
-            reviewer = decodedToken['email']
-            groups = decodedToken['groups']
+            table = get_table()
+            reviewer = principal.email
             auditorGroup = os.environ['auditor_group'] 
-            if auditorGroup in groups:
-                epochTimeNow = int(time.time())
-                scan_kwargs = {}
-                done = False
-                start_key = None
-                while not done:
-                    if start_key:
-                        scan_kwargs['ExclusiveStartKey'] = start_key
-                    response = table.scan(**scan_kwargs)
-                    start_key = response.get('LastEvaluatedKey', None)
-                    done = start_key is None
-                for item in response['Items']:
-                    request = Request(item)
-                    requests.append(request)
-                result = [request.to_dict() for request in requests]
-                status_code = 200
+            if principal.in_group(auditorGroup):
+                time_from, time_to = request_time_range(event)
+                limit, next_token = get_page_params(event)
+                position = None
+                if next_token:
+                    position = decode_page_token('get_all_requests', next_token)
+                items, position = audit_items(table, context, time_from, time_to, limit, position)
+                result = [request_row(item) for item in items]
+                if limit:
+                    result = to_page(result, position and encode_page_token('get_all_requests', position))
+                    status_code = 200
+                else:
+                    status_code = 200 if position is None else 206
             else:
                 result = "The idToken for " + reviewer + " does not contain the " + auditorGroup + " group"
                 print(result)
                 status_code = 400
+        except (PageTokenError, QueryParameterError) as error:
+            result = str(error)
+            status_code = 400
         except Exception as error:
             print("Error running get all requests", error)
             traceback.print_exc()
             result = str(error)
-        response = {
-            "statusCode": status_code,
-            "body": json.dumps(result, indent=2, sort_keys=True, default=str)
-        }
-        return response
+        return encode_response(event, status_code, result)
+
+    @authenticated
+    def get_changes(self, event, context, principal):
+        result = ''
+        status_code = 500
+        try:
+            view = deep_get(event, ["queryStringParameters", "view"]) or 'requests'
+            cursor = deep_get(event, ["queryStringParameters", "cursor"])
+            reviewerGroup = os.environ['reviewer_group']
+            auditorGroup = os.environ['auditor_group']
+            groups = {
+                'requests': None,
+                'pending': reviewerGroup,
+                'processed': reviewerGroup,
+                'all': auditorGroup
+            }
+            if view not in groups:
+                result = "Error, unknown view " + view
+                status_code = 400
+            elif groups[view] and not principal.in_group(groups[view]):
+                result = "The idToken for " + principal.email + " does not contain the " + groups[view] + " group"
+                print(result)
+                status_code = 400
+            else:
+                endpoint = 'get_changes#' + view
+                utc_now = datetime.utcnow()
+                since = None
+                if cursor:
+                    try:
+                        position = decode_page_token(endpoint, cursor)
+                    except PageTokenError:
+                        raise PageTokenError("Invalid cursor")
+                    since = datetime.strptime(position['t'], CHANGE_TIME_FORMAT) - get_changes_overlap()
+                result = {
+                    'items': [],
+                    'removed': [],
+                    'cursor': encode_page_token(endpoint, {'t': utc_now.strftime(CHANGE_TIME_FORMAT)}),
+                    'reset': True
+                }
+                changes = None
+                if since is not None and since >= utc_now - get_changes_retention():
+                    changes = read_changes(get_state_table(), since, utc_now)
+                    if view == 'requests':
+                        changes = {key: entry for key, entry in changes.items() if entry.get('requester') == principal.subject}
+                if changes is not None and len(changes) <= MAX_PAGE_SIZE:
+                    epochTimeNow = int(time.time())
+                    now = timestamp_now()
+                    items = batch_get_requests([key for key, entry in changes.items() if entry['event'] != 'REMOVE'])
+                    requests = []
+                    for item in items:
+                        if view == 'requests':
+                            item['request_status'] = derive_status(item, epochTimeNow, now)
+                        if change_view_matches(view, item, epochTimeNow):
+                            requests.append(request_row(item))
+                    requests.sort(key=lambda request: request['request_time'], reverse=True)
+                    matched = set(request['id'] for request in requests)
+                    removed = set(id for id, request_time in changes) - matched
+                    if view == 'all':
+                        # Requests moved to the archive stay in the audit list
+                        horizon = read_archive_horizon()
+                        if horizon:
+                            removed -= set(id for (id, request_time), entry in changes.items() if entry['event'] == 'REMOVE' and sortable_time(request_time) <= horizon)
+                    result['items'] = requests
+                    result['removed'] = sorted(removed)
+                    result['reset'] = False
+                status_code = 200
+        except (PageTokenError, QueryParameterError) as error:
+            result = str(error)
+            status_code = 400
+        except Exception as error:
+            print("Error running get changes", error)
+            traceback.print_exc()
+            result = str(error)
+        return encode_response(event, status_code, result)
+
+    @authenticated
+    def get_statistics(self, event, context, principal):
+        result = ''
+        status_code = 500
+        try:
+            reviewerGroup = os.environ['reviewer_group']
+            auditorGroup = os.environ['auditor_group']
+            days = statistics_days(event)
+            if not (principal.in_group(reviewerGroup) or principal.in_group(auditorGroup)):
+                result = "The idToken for " + principal.email + " does not contain the " + reviewerGroup + " or " + auditorGroup + " group"
+                print(result)
+                status_code = 400
+            elif days is None:
+                result = "Error, incorrect query parameters"
+                status_code = 400
+            else:
+                result = read_statistics(days)
+                status_code = 200
+        except Exception as error:
+            print("Error running get statistics", error)
+            traceback.print_exc()
+            result = str(error)
+        return encode_response(event, status_code, result, etag=True)
+
+    @authenticated
+    def create_export(self, event, context, principal):
+        result = ''
+        status_code = 500
+        try:
+            auditorGroup = os.environ['auditor_group']
+            input_body = event.get("body")
+            json_param = json.loads(input_body) if input_body else {}
+            export_format = json_param.get("export_format", 'csv')
+            if not principal.in_group(auditorGroup):
+                result = "The idToken for " + principal.email + " does not contain the " + auditorGroup + " group"
+                print(result)
+                status_code = 400
+            elif export_format not in EXPORT_FORMATS:
+                result = "Error, export_format must be " + " or ".join(sorted(EXPORT_FORMATS))
+                status_code = 400
+            else:
+                export_id = str(uuid.uuid4())
+                request_time = timestamp_now()
+                job = {
+                    **export_job_key(export_id),
+                    'requester': principal.subject,
+                    'export_format': export_format,
+                    'export_status': 'Running',
+                    'request_time': request_time,
+                    'object_key': 'exports/' + export_id + EXPORT_FORMATS[export_format]['suffix'],
+                    'ttl': int(time.time() + get_export_retention().total_seconds())
+                }
+                get_state_table().put_item(Item=job)
+                get_client('lambda').invoke(
+                    FunctionName=os.environ['export_function'],
+                    InvocationType='Event',
+                    Payload=json.dumps({'export_id': export_id})
+                )
+                print("Started export " + export_id + " for " + principal.email)
+                result = export_view(job)
+                status_code = 200
+        except Exception as error:
+            print("Error running create export " + str(error))
+            traceback.print_exc()
+            result = str(error)
+        return encode_response(event, status_code, result)
+
+    @authenticated
+    def get_export(self, event, context, principal):
+        result = ''
+        status_code = 500
+        try:
+            auditorGroup = os.environ['auditor_group']
+            export_id = deep_get(event, ["queryStringParameters", "export_id"])
+            if not principal.in_group(auditorGroup):
+                result = "The idToken for " + principal.email + " does not contain the " + auditorGroup + " group"
+                print(result)
+                status_code = 400
+            elif not export_id:
+                result = "Error, incorrect query parameters"
+                status_code = 400
+            else:
+                job = get_state_table().get_item(Key=export_job_key(export_id), ConsistentRead=True).get('Item')
+                # Auditors only see the exports they started
+                if job is None or job['requester'] != principal.subject:
+                    result = "Error, no export " + export_id
+                    status_code = 404
+                else:
+                    result = export_view(job)
+                    status_code = 200
+        except Exception as error:
+            print("Error running get export " + str(error))
+            traceback.print_exc()
+            result = str(error)
+        return encode_response(event, status_code, result)
 
-    def create_request(self, event, context):
+    @authenticated
+    def create_request(self, event, context, principal):
         result = ''
         status_code = 500
         try:
             input_body = event.get("body")
             if input_body:
                 json_param = json.loads(input_body)
-                AuthHeader = event['headers']['Authorization']
-                accessToken = AuthHeader[len('Bearer '):]
-                accessTokenSplit = accessToken.split(' ', 1)[0]
-                decodedToken = jwt.decode(accessTokenSplit, algorithms=["RS256"], options={"verify_signature": False})
-                requester = decodedToken['sub']
+                requester = principal.subject
                 request_account = json_param["request_account"]
                 request_role = json_param["request_role"]
                 request_duration = json_param["request_duration"]
                 request_justification = json_param["request_justification"]
-                request_time = datetime.now().strftime('%x %X')
-                id = requester + '#' + request_account + '#' + request_role + '#' + str(request_time)
-                request = {
-                    'id': id,
-                    'requester': requester,
-                    'request_account': request_account,
-                    'request_role': request_role,
-                    'request_duration': request_duration,
-                    'request_justification': request_justification,
-                    'request_status': 'Requested',
-                    'request_time': request_time,
-                    'expiration_time': '',
-                    'review_time': '',
-                    'reviewer': ''
-                }
-                dynamodb = boto3.resource('dynamodb')
-                dbname = os.environ['db_table']
-                table = dynamodb.Table(dbname)
+                request_time = timestamp_now()
+                request = new_request_item(requester, request_account, request_role, request_duration, request_justification, request_time)
+                table = get_table()
                 table.put_item(Item=request)
                 status_code = 200
             else:
@@ -321,13 +2878,55 @@ class DatabaseLoader:
             print("Error running create request " + str(error))
             traceback.print_exc()
             result = str(error)
-        response = {
-            "statusCode": status_code,
-            "body": json.dumps(result, indent=2, sort_keys=True, default=str)
-        }
-        return response
+        return encode_response(event, status_code, result)
+
+    @authenticated
+    def create_requests(self, event, context, principal):
+        result = ''
+        status_code = 500
+        try:
+            input_body = event.get("body")
+            json_param = json.loads(input_body) if input_body else {}
+            targets = parse_targets(json_param.get("targets"))
+            if targets and json_param.get("request_duration") and json_param.get("request_justification"):
+                requester = principal.subject
+                request_time = timestamp_now()
+                group_id = str(uuid.uuid4())
+                group_targets = [{'request_account': account, 'request_role': role} for account, role in targets]
+                requests = []
+                for request_account, request_role in targets:
+                    request = new_request_item(requester, request_account, request_role, json_param["request_duration"], json_param["request_justification"], request_time)
+                    request['group_id'] = group_id
+                    request['group_targets'] = group_targets
+                    requests.append(request)
+                print("Creating " + str(len(requests)) + " requests for " + requester + " in group " + group_id)
+                failed_ids = []
+                try:
+                    batch_write_requests(requests)
+                except BatchWriteError as error:
+                    print("Error creating the requests of group " + group_id + ": " + str(error))
+                    failed_ids = [request['PutRequest']['Item']['id'] for request in error.unprocessed]
+                # The ids that were written, so the caller can retry only the others
+                result = {
+                    'group_id': group_id,
+                    'ids': [request['id'] for request in requests if request['id'] not in failed_ids]
+                }
+                if failed_ids:
+                    result['failed_ids'] = failed_ids
+                    status_code = 500
+                else:
+                    status_code = 200
+            else:
+                result = "Error, incorrect post body"
+                status_code = 400
+        except Exception as error:
+            print("Error running create requests " + str(error))
+            traceback.print_exc()
+            result = str(error)
+        return encode_response(event, status_code, result)
 
-    def approve_request(self, event, context):
+    @authenticated
+    def approve_request(self, event, context, principal):
         result = ''
         status_code = 500
         try:
@@ -337,44 +2936,18 @@ class DatabaseLoader:
                 id = json_param["id"]
                 request_time = json_param["request_time"]
                 request_duration = json_param["request_duration"]
-                AuthHeader = event['headers']['Authorization']
-                idToken = AuthHeader[len('Bearer '):]
-                idTokenSplit = idToken.split(' ', 1)[-1]
-                decodedToken = jwt.decode(idTokenSplit, algorithms=["RS256"], options={"verify_signature": False})
-                reviewer = decodedToken['email']
-                groups = decodedToken['groups']
+                reviewer = principal.email
                 reviewerGroup = os.environ['reviewer_group'] 
-                now = datetime.now().strftime('%x %X')
-                epochTimeNow = int(time.time()) 
-                dynamodb = boto3.resource('dynamodb')
-                dbname = os.environ['db_table']
-                table = dynamodb.Table(dbname)
+                table = get_table()
                 print("Approve request initiated by " + reviewer + " for the following id: " + id)
-                if reviewerGroup in groups:
+                if principal.in_group(reviewerGroup):
                     print("Verified that the idToken for " + reviewer + " contains the " + reviewerGroup + " group")
-                    try:
-                        table.update_item(
-                            Key={
-                                'id': id,
-                                'request_time': request_time
-                            },
-                            UpdateExpression="set request_status=:v1, expiration_time=:v2, review_time=:v3, reviewer=:v4 REMOVE request_ttl",
-                            ConditionExpression="requester <> :v4 AND request_ttl > :v5",
-                            ExpressionAttributeValues={
-                                ':v1': 'Approved',
-                                ':v2': (datetime.strptime(now, '%x %X') + timedelta(minutes=int(request_duration))).strftime('%x %X'),
-                                ':v3': datetime.now().strftime('%x %X'),
-                                ':v4': reviewer,
-                                ':v5': epochTimeNow
-                            },
-                            ReturnValues="UPDATED_NEW"
-                        )
+                    if apply_review(table, id, request_time, 'approve', reviewer, request_duration):
                         status_code = 200
-                    except ClientError as e:
-                        if e.response['Error']['Code']=='ConditionalCheckFailedException':  
-                            result = "Users can not review (approve/reject) their own requests"
-                            print(result)
-                            status_code = 400
+                    else:
+                        result = REVIEW_CONDITION_FAILED
+                        print(result)
+                        status_code = 400
                 else:
                     result = "The idToken for " + reviewer + " does not contain the " + reviewerGroup + " group"
                     print(result)
@@ -386,13 +2959,10 @@ class DatabaseLoader:
             print("Error running approve request " + str(error))
             traceback.print_exc()
             result = str(error)
-        response = {
-            "statusCode": status_code,
-            "body": json.dumps(result, indent=2, sort_keys=True, default=str)
-        }
-        return response
+        return encode_response(event, status_code, result)
 
-    def reject_request(self, event, context):
+    @authenticated
+    def reject_request(self, event, context, principal):
         result = ''
         status_code = 500
         try:
@@ -401,42 +2971,18 @@ class DatabaseLoader:
                 json_param = json.loads(input_body)
                 id = json_param["id"]
                 request_time = json_param["request_time"]
-                AuthHeader = event['headers']['Authorization']
-                idToken = AuthHeader[len('Bearer '):]
-                idTokenSplit = idToken.split(' ', 1)[-1]
-                decodedToken = jwt.decode(idTokenSplit, algorithms=["RS256"], options={"verify_signature": False})
-                reviewer = decodedToken['email']
-                groups = decodedToken['groups']
+                reviewer = principal.email
                 reviewerGroup = os.environ['reviewer_group'] 
-                epochTimeNow = int(time.time())
-                dynamodb = boto3.resource('dynamodb')
-                dbname = os.environ['db_table']
-                table = dynamodb.Table(dbname)
+                table = get_table()
                 print("Reject request initiated by " + reviewer + " for the following id: " + id)
-                if reviewerGroup in groups:
+                if principal.in_group(reviewerGroup):
                     print("Verified that the idToken for " + reviewer + " contains the " + reviewerGroup + " group")
-                    try:
-                        table.update_item(
-                            Key={
-                                'id': id,
-                                'request_time': request_time
-                            },
-                            UpdateExpression="set request_status=:v1, review_time=:v2, reviewer=:v3 REMOVE request_ttl",
-                            ConditionExpression="requester <> :v3 AND request_ttl > :v4",
-                            ExpressionAttributeValues={
-                                ':v1': 'Rejected',
-                                ':v2': datetime.now().strftime('%x %X'),
-                                ':v3': reviewer,
-                                ':v4': epochTimeNow
-                            },
-                            ReturnValues="UPDATED_NEW"
-                        )
+                    if apply_review(table, id, request_time, 'reject', reviewer):
                         status_code = 200
-                    except ClientError as e:
-                        if e.response['Error']['Code']=='ConditionalCheckFailedException':  
-                            result = "Users can not review (approve/reject) their own requests"
-                            print(result)
-                            status_code = 400                
+                    else:
+                        result = REVIEW_CONDITION_FAILED
+                        print(result)
+                        status_code = 400
                 else:
                     result = "The idToken for " + reviewer + " does not contain the " + reviewerGroup + " group"
                     print(result)
@@ -448,30 +2994,58 @@ class DatabaseLoader:
             print("Error running reject request " + str(error))
             traceback.print_exc()
             result = str(error)
-        response = {
-            "statusCode": status_code,
-            "body": json.dumps(result, indent=2, sort_keys=True, default=str)
-        }
-        return response
+        return encode_response(event, status_code, result)
+
+    @authenticated
+    def review_requests(self, event, context, principal):
+        result = ''
+        status_code = 500
+        try:
+            input_body = event.get("body")
+            reviews = input_body and json.loads(input_body).get("reviews")
+            if isinstance(reviews, list) and 0 < len(reviews) <= MAX_BATCH_REVIEWS and all(isinstance(entry, dict) for entry in reviews):
+                reviewer = principal.email
+                reviewerGroup = os.environ['reviewer_group']
+                print("Batch review of " + str(len(reviews)) + " requests initiated by " + reviewer)
+                if principal.in_group(reviewerGroup):
+                    print("Verified that the idToken for " + reviewer + " contains the " + reviewerGroup + " group")
+                    table = get_table()
+                    workers = min(len(reviews), int(os.environ.get('review_workers', 8)))
+                    with ThreadPoolExecutor(max_workers=workers) as executor:
+                        results = list(executor.map(lambda entry: review_entry(table, entry, reviewer), reviews))
+                    succeeded = len([entry for entry in results if entry['success']])
+                    result = {
+                        'results': results,
+                        'succeeded': succeeded,
+                        'failed': len(results) - succeeded
+                    }
+                    status_code = 200
+                else:
+                    result = "The idToken for " + reviewer + " does not contain the " + reviewerGroup + " group"
+                    print(result)
+                    status_code = 400
+            else:
+                result = "Error, the body must contain 1 to " + str(MAX_BATCH_REVIEWS) + " reviews"
+                status_code = 400
+        except Exception as error:
+            print("Error running review requests " + str(error))
+            traceback.print_exc()
+            result = str(error)
+        return encode_response(event, status_code, result)
 
-    def delete_request(self, event, context):
+    @authenticated
+    def delete_request(self, event, context, principal):
         result = ''
         status_code = 500
         try:
             input_body = event.get("body")
-            AuthHeader = event['headers']['Authorization']
-            accessToken = AuthHeader[len('Bearer '):]
-            accessTokenSplit = accessToken.split(' ', 1)[0]
-            decodedToken = jwt.decode(accessTokenSplit, algorithms=["RS256"], options={"verify_signature": False})
-            requester = decodedToken['sub']
+            requester = principal.subject
             if input_body:
                 try:
                     json_param = json.loads(input_body)
                     id = json_param["id"]
                     request_time = json_param["request_time"]
-                    dynamodb = boto3.resource('dynamodb')
-                    dbname = os.environ['db_table']
-                    table = dynamodb.Table(dbname)
+                    table = get_table()
                     print("Delete request initiated by " + requester + " for the following id: " + id)
                     response = table.delete_item(
                         Key={
@@ -495,25 +3069,18 @@ class DatabaseLoader:
             print("Error running delete request " + str(error))
             traceback.print_exc()
             result = str(error)
-        response = {
-            "statusCode": status_code,
-            "body": json.dumps(result, indent=2, sort_keys=True, default=str)
-        }
-        return response
+        return encode_response(event, status_code, result)
 
-    def federate_console(self, event, context):
+    @authenticated
+    def federate_console(self, event, context, principal):
         result = ''
         status_code = 500
         try:
             account = deep_get(event, ["queryStringParameters", "account"])
             role = deep_get(event, ["queryStringParameters", "role"])
-            AuthHeader = event['headers']['Authorization']
-            idToken = AuthHeader[len('Bearer '):]
-            idTokenSplit = idToken.split(' ', 1)[-1]
-            decodedToken = jwt.decode(idTokenSplit, algorithms=["RS256"], options={"verify_signature": False})
-            requester = decodedToken['email']
+            requester = principal.email
             print("Elevation request initiated by " +  requester + " for Account:" + account + " Role:" + role)
-            groups = decodedToken['groups']
+            groups = principal.groups
             print("idToken for " + requester + " contains the following groups " + str(groups))
             SearchPrefix = os.environ['search_prefix']
             groups = [x for x in groups if x.startswith(SearchPrefix)]
@@ -524,47 +3091,20 @@ class DatabaseLoader:
                 status_code = 400
             elif account and role and veryifymembership:
                 print("Verified that the idToken for " + requester + " contained the requested elevation group - Proceeding to DynamoDB verification...")
-                dynamodb = boto3.resource('dynamodb')
-                dbname = os.environ['db_table']
-                table = dynamodb.Table(dbname)
-                now = datetime.now().strftime('%x %X')
+                table = get_table()
+                now = timestamp_now()
                 response = table.query(
-                    IndexName='request-status-index',
-                    KeyConditionExpression=Key('request_status').eq('Approved'),
-                    FilterExpression=Attr('request_account').eq(account) & Attr('request_role').eq(role) & Attr('requester').eq(requester) & Attr('expiration_time').gte(now),
-                    ScanIndexForward=False
+                    IndexName='active-grant-index',
+                    KeyConditionExpression=Key('grant_key').eq(make_grant_key(requester, account, role)) & Key('grant_expiration').gte(now),
+                    Limit=1
                 )
                 items = response['Items']
-                if items:
-                    print("Confirmed there is an approved active elevation request for " + requester + " - Initializing STS request for console access...")
-                    sts_connection = boto3.client('sts')
-                    assumed_role_object = sts_connection.assume_role(
-                        RoleArn="arn:aws:iam::" + account + ":role/" + role,
-                        RoleSessionName= requester + "-" + role,
-                        )
-                    url_credentials = {}
-                    url_credentials['sessionId'] = assumed_role_object.get('Credentials').get('AccessKeyId')
-                    url_credentials['sessionKey'] = assumed_role_object.get('Credentials').get('SecretAccessKey')
-                    url_credentials['sessionToken'] = assumed_role_object.get('Credentials').get('SessionToken')
-                    json_string_with_temp_credentials = json.dumps(url_credentials)
-                    request_parameters = "?Action=getSigninToken"
-                    if sys.version_info[0] < 3:
-                        def quote_plus_function(s):
-                            return urllib.quote_plus(s)
-                    else:
-                        def quote_plus_function(s):
-                            return urllib.parse.quote_plus(s)
-                    request_parameters += "&Session="
-                    request_parameters += quote_plus_function(json_string_with_temp_credentials)
-                    request_url = "https://signin.aws.amazon.com/federation"
-                    request_url += request_parameters
-                    r = requests.get(request_url)
-                    sign_in_token = json.loads(r.text)["SigninToken"]
-                    request_parameters = "?Action=login" 
-                    request_parameters += "&Issuer=" 
-                    request_parameters += "&Destination=" + quote_plus_function("https://console.aws.amazon.com/")
-                    request_parameters += "&SigninToken=" + sign_in_token
-                    request_url = "https://signin.aws.amazon.com/federation" + request_parameters
+                role_credentials = get_role_credentials(table, requester, account, role, items[0]) if items else None
+                print("Credential cache " + json.dumps(credential_cache.stats()))
+                if role_credentials:
+                    print("Confirmed there is an approved active elevation request for " + requester + " - Issued credentials for console access")
+                    sign_in_token = federation_client.get_signin_token(role_credentials, get_deadline(context, 1000))
+                    request_url = federation_client.login_url(sign_in_token)
                     result = request_url
                     status_code = 200
                 else:
@@ -579,25 +3119,18 @@ class DatabaseLoader:
             print(str(error))
             traceback.print_exc()
             result = str(error)
-        response = {
-            "statusCode": status_code,
-            "body": json.dumps(result, indent=2, sort_keys=True, default=str)
-        }
-        return response
+        return encode_response(event, status_code, result)
 
-    def federate_cli(self, event, context):
+    @authenticated
+    def federate_cli(self, event, context, principal):
         result = ''
         status_code = 500
         try:
             account = deep_get(event, ["queryStringParameters", "account"])
             role = deep_get(event, ["queryStringParameters", "role"])
-            AuthHeader = event['headers']['Authorization']
-            idToken = AuthHeader[len('Bearer '):]
-            idTokenSplit = idToken.split(' ', 1)[-1]
-            decodedToken = jwt.decode(idTokenSplit, algorithms=["RS256"], options={"verify_signature": False})
-            requester = decodedToken['email']
+            requester = principal.email
             print("Elevation request initiated by " +  requester + " for Account:" + account + " Role:" + role)
-            groups = decodedToken['groups']
+            groups = principal.groups
             print("idToken for " + requester + " contains the following groups " + str(groups))
             SearchPrefix = os.environ['search_prefix']
             groups = [x for x in groups if x.startswith(SearchPrefix)]
@@ -608,28 +3141,22 @@ class DatabaseLoader:
                 status_code = 400
             elif account and role and veryifymembership:
                 print("Verified that the idToken for " + requester + " contained the requested elevation group - Proceeding to DynamoDB verification...")
-                dynamodb = boto3.resource('dynamodb')
-                dbname = os.environ['db_table']
-                table = dynamodb.Table(dbname)
-                now = datetime.now().strftime('%x %X')
+                table = get_table()
+                now = timestamp_now()
                 response = table.query(
-                    IndexName='request-status-index',
-                    KeyConditionExpression=Key('request_status').eq('Approved'),
-                    FilterExpression=Attr('request_account').eq(account) & Attr('request_role').eq(role) & Attr('requester').eq(requester) & Attr('expiration_time').gte(now),
-                    ScanIndexForward=False
+                    IndexName='active-grant-index',
+                    KeyConditionExpression=Key('grant_key').eq(make_grant_key(requester, account, role)) & Key('grant_expiration').gte(now),
+                    Limit=1
                 )
                 items = response['Items']
-                if items:
-                    print("Confirmed there is an approved active elevation request for " + requester + " - Initializing STS request for CLI credentials...")
-                    sts_connection = boto3.client('sts')
-                    assumed_role_object = sts_connection.assume_role(
-                        RoleArn="arn:aws:iam::" + account + ":role/" + role,
-                        RoleSessionName= requester + "-" + role,
-                        )
+                role_credentials = get_role_credentials(table, requester, account, role, items[0]) if items else None
+                print("Credential cache " + json.dumps(credential_cache.stats()))
+                if role_credentials:
+                    print("Confirmed there is an approved active elevation request for " + requester + " - Issued credentials for CLI credentials")
                     cli_credentials = {}
-                    cli_credentials['sessionId'] = assumed_role_object.get('Credentials').get('AccessKeyId')
-                    cli_credentials['sessionKey'] = assumed_role_object.get('Credentials').get('SecretAccessKey')
-                    cli_credentials['sessionToken'] = assumed_role_object.get('Credentials').get('SessionToken')
+                    cli_credentials['sessionId'] = role_credentials['AccessKeyId']
+                    cli_credentials['sessionKey'] = role_credentials['SecretAccessKey']
+                    cli_credentials['sessionToken'] = role_credentials['SessionToken']
                     credentials = Credentials(cli_credentials['sessionId'], cli_credentials['sessionKey'], cli_credentials['sessionToken'])
                     result = credentials.cli()
                     status_code = 200
@@ -645,56 +3172,46 @@ class DatabaseLoader:
             print(str(error))
             traceback.print_exc()
             result = str(error)
-        response = {
-            "statusCode": status_code,
-            "body": json.dumps(result, indent=2, sort_keys=True, default=str)
-        }
-        return response
+        return encode_response(event, status_code, result)
 
-class Request:
-    """
-    It represents a request.
-    """
-    def __init__(self,
-                 record):
-        """
-        Initializes the Request from the database record.
+loader = DatabaseLoader()
 
-        :param record:   The database record.
-        """
-        self.id = record.get('id', 0)
-        self.requester = record.get('requester', '')
-        self.request_account = record.get('request_account', '')
-        self.request_role = record.get('request_role', '')
-        self.request_duration = record.get('request_duration', 0)
-        self.request_justification = record.get('request_justification', '')
-        self.request_status = record.get('request_status', '')
-        self.request_time = record.get('request_time', '')
-        self.expiration_time = record.get('expiration_time', '')
-        self.review_time = record.get('review_time', '')
-        self.reviewer = record.get('reviewer', '')
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'requester': self.requester,
-            'request_account': self.request_account,
-            'request_role': self.request_role,
-            'request_duration': self.request_duration,
-            'request_justification': self.request_justification,
-            'request_status': self.request_status,
-            'request_time': self.request_time,
-            'expiration_time': self.expiration_time,
-            'review_time': self.review_time,
-            'reviewer': self.reviewer
-        }
+# ********** ROUTER ************#
 
-    def format_date2(self, value):
-        if value == '':
-            return ''
-        else:
-            date_value = datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f')
-            return date_value.strftime('%x %X')
+# (HTTP method, API Gateway resource path) to DatabaseLoader method name
+ROUTES = {
+    ('GET', '/get_requests'): 'get_requests',
+    ('GET', '/get_pending_requests'): 'get_pending_requests',
+    ('GET', '/get_processed_requests'): 'get_processed_requests',
+    ('GET', '/get_all_requests'): 'get_all_requests',
+    ('POST', '/create_request'): 'create_request',
+    ('POST', '/create_requests'): 'create_requests',
+    ('POST', '/delete_request'): 'delete_request',
+    ('POST', '/approve_request'): 'approve_request',
+    ('POST', '/reject_request'): 'reject_request',
+    ('POST', '/review_requests'): 'review_requests',
+    ('GET', '/federate_console'): 'federate_console',
+    ('GET', '/federate_cli'): 'federate_cli',
+    ('GET', '/get_changes'): 'get_changes',
+    ('POST', '/create_export'): 'create_export',
+    ('GET', '/get_export'): 'get_export',
+    ('GET', '/get_statistics'): 'get_statistics'
+}
+route_table = {key: getattr(loader, name) for key, name in ROUTES.items()}
+
+def route(event, context):
+    """
+    Single entry point for the whole API, used when the stack is deployed
+    with ConsolidatedRouter=true. It dispatches on the HTTP method and the
+    resource path of the API Gateway proxy event.
+    """
+    path = event.get('resource') or event.get('path') or ''
+    handler = route_table.get((event.get('httpMethod'), path.rstrip('/')))
+    if handler is None:
+        print("No route for " + str(event.get('httpMethod')) + " " + path)
+        return encode_response(event, 404, "Not found")
+    return handler(event, context)
 
 class Credentials:
 
@@ -720,6 +3237,7 @@ def dispatch_command():
     """
     Dispatches the command based on command line parameters.
     """
+    import argparse
     parser = argparse.ArgumentParser()
     parser.add_argument("--cmd", help="Enter one of the commands: Y2D (yaml to database), Y2S (yaml to service), D2S (database to service)")
     args = parser.parse_args()
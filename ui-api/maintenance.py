@@ -0,0 +1,342 @@
+"""
+Maintenance jobs for the request table.
+
+The jobs are run from an operator workstation (or a CI job) with credentials
+for the account the broker is deployed in, e.g.
+
+    python maintenance.py --table request --segments 8 migrate-timestamps
+
+Every job records its progress in a checkpoint file, so an interrupted run
+can be resumed by running the same command again.
+"""
+import os
+import json
+import argparse
+import threading
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+os.environ.setdefault('AWS_XRAY_CONTEXT_MISSING', 'IGNORE_ERROR')
+
+import api
+
+
+class Checkpoint:
+    """
+    It records the scan position of each segment of a parallel scan.
+    """
+    def __init__(self, path, total_segments):
+        """
+        Loads the checkpoint file, or starts a new one.
+
+        :param path:            The checkpoint file.
+        :param total_segments:  The number of scan segments.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {'total_segments': total_segments, 'segments': {}}
+        if os.path.exists(path):
+            with open(path) as checkpoint_file:
+                self.state = json.load(checkpoint_file)
+            if self.state['total_segments'] != total_segments:
+                raise ValueError("Checkpoint " + path + " was written with " + str(self.state['total_segments']) + " segments")
+
+    def segment(self, segment):
+        return self.state['segments'].get(str(segment), {'done': False, 'start_key': None, 'processed': 0})
+
+    def save(self, segment, start_key, processed):
+        with self.lock:
+            self.state['segments'][str(segment)] = {
+                'done': start_key is None,
+                'start_key': start_key,
+                'processed': processed
+            }
+            temp_path = self.path + '.tmp'
+            with open(temp_path, 'w') as checkpoint_file:
+                json.dump(self.state, checkpoint_file, default=str)
+            os.replace(temp_path, self.path)
+
+
+class RateLimiter:
+    """
+    It spaces out writes across all segment workers, so a job stays within a
+    share of the table's provisioned write capacity.
+    """
+    def __init__(self, rate):
+        """
+        :param rate:  Writes per second, or None for no limit.
+        """
+        self.interval = 1.0 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_time = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_time)
+            self.next_time = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def run_segments(table, scan_kwargs, total_segments, checkpoint, process_item):
+    """
+    Scans the table with one worker per segment, resuming every segment from
+    its checkpoint, and calls process_item for each item found.
+    """
+    def run_segment(segment):
+        position = checkpoint.segment(segment)
+        if position['done']:
+            return position['processed']
+        processed = position['processed']
+        start_key = position['start_key']
+        kwargs = dict(scan_kwargs, Segment=segment, TotalSegments=total_segments)
+        while True:
+            if start_key:
+                kwargs['ExclusiveStartKey'] = start_key
+            response = table.scan(**kwargs)
+            for item in response['Items']:
+                process_item(item)
+                processed += 1
+            start_key = response.get('LastEvaluatedKey', None)
+            checkpoint.save(segment, start_key, processed)
+            if start_key is None:
+                return processed
+
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        return sum(executor.map(run_segment, range(total_segments)))
+
+
+# ********** TIMESTAMP MIGRATION ************#
+
+def migrated_timestamp(value):
+    if api.is_legacy_timestamp(value):
+        return api.format_timestamp(api.parse_timestamp(value))
+    return value
+
+def migrate_timestamps_item(table, item):
+    """
+    Rewrites the legacy '%x %X' timestamps of a request as ISO-8601 UTC.
+
+    request_time is part of the primary key (and of the id), so those items
+    are copied to a new key and the original is deleted in one transaction.
+    The copy carries a migrated_from attribute so the stream handler does not
+    treat it as a new request.
+    """
+    new_item = dict(item)
+    for attribute in ('request_time', 'expiration_time', 'review_time'):
+        new_item[attribute] = migrated_timestamp(item.get(attribute, ''))
+    if new_item == item:
+        return
+    if new_item['request_time'] == item['request_time']:
+        table.update_item(
+            Key={'id': item['id'], 'request_time': item['request_time']},
+            UpdateExpression="set expiration_time=:v1, review_time=:v2",
+            ExpressionAttributeValues={
+                ':v1': new_item['expiration_time'],
+                ':v2': new_item['review_time']
+            }
+        )
+        return
+    suffix = '#' + item['request_time']
+    if item['id'].endswith(suffix):
+        new_item['id'] = item['id'][:-len(suffix)] + '#' + new_item['request_time']
+    new_item['migrated_from'] = item['id']
+    try:
+        table.meta.client.transact_write_items(
+            TransactItems=[
+                {
+                    'Put': {
+                        'TableName': table.name,
+                        'Item': new_item,
+                        'ConditionExpression': 'attribute_not_exists(id)'
+                    }
+                },
+                {
+                    'Delete': {
+                        'TableName': table.name,
+                        'Key': {'id': item['id'], 'request_time': item['request_time']},
+                        'ConditionExpression': 'request_status = :v1',
+                        'ExpressionAttributeValues': {':v1': item['request_status']}
+                    }
+                }
+            ]
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'TransactionCanceledException':
+            print("Skipping " + item['id'] + ", it was changed or already migrated")
+        else:
+            raise
+
+def migrate_timestamps(args):
+    table = api.get_table(args.table)
+    checkpoint = Checkpoint(args.checkpoint or 'migrate-timestamps-' + args.table + '.json', args.segments)
+    scan_kwargs = {
+        'FilterExpression': Attr('request_time').contains('/') | Attr('expiration_time').contains('/') | Attr('review_time').contains('/')
+    }
+    processed = run_segments(table, scan_kwargs, args.segments, checkpoint, lambda item: migrate_timestamps_item(table, item))
+    print("Migrated " + str(processed) + " requests")
+
+
+# ********** ACTIVE GRANT BACKFILL ************#
+
+def backfill_grants_item(table, item):
+    table.update_item(
+        Key={'id': item['id'], 'request_time': item['request_time']},
+        UpdateExpression="set grant_key=:v1, grant_expiration=expiration_time",
+        ConditionExpression="request_status = :v2",
+        ExpressionAttributeValues={
+            ':v1': api.grant_key_for_id(item['id'], item['request_time']),
+            ':v2': 'Approved'
+        }
+    )
+
+def backfill_grants(args):
+    table = api.get_table(args.table)
+    checkpoint = Checkpoint(args.checkpoint or 'backfill-grants-' + args.table + '.json', args.segments)
+    scan_kwargs = {
+        'FilterExpression': Attr('request_status').eq('Approved') & Attr('grant_key').not_exists() & Attr('expiration_time').gte(api.timestamp_now())
+    }
+    processed = run_segments(table, scan_kwargs, args.segments, checkpoint, lambda item: backfill_grants_item(table, item))
+    print("Added grant keys to " + str(processed) + " approved requests")
+
+
+# ********** PENDING REQUEST TTL BACKFILL ************#
+
+def backfill_ttl_item(table, item, rate_limiter):
+    rate_limiter.wait()
+    try:
+        table.update_item(
+            Key={'id': item['id'], 'request_time': item['request_time']},
+            UpdateExpression="set request_ttl=:v1",
+            ConditionExpression="attribute_not_exists(request_ttl) AND request_status = :v2",
+            ExpressionAttributeValues={
+                ':v1': api.request_ttl_for(item['request_time']),
+                ':v2': 'Requested'
+            }
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+def backfill_ttl(args):
+    table = api.get_table(args.table)
+    checkpoint = Checkpoint(args.checkpoint or 'backfill-ttl-' + args.table + '.json', args.segments)
+    rate_limiter = RateLimiter(args.rate)
+    scan_kwargs = {
+        'FilterExpression': Attr('request_status').eq('Requested') & Attr('request_ttl').not_exists(),
+        'ProjectionExpression': 'id, request_time'
+    }
+    processed = run_segments(table, scan_kwargs, args.segments, checkpoint, lambda item: backfill_ttl_item(table, item, rate_limiter))
+    print("Added request_ttl to " + str(processed) + " pending requests")
+
+
+# ********** EXPIRY BUCKET BACKFILL ************#
+
+def backfill_expiry_buckets_item(table, item, rate_limiter):
+    if item['request_status'] == 'Requested':
+        due = datetime.utcfromtimestamp(int(item['request_ttl']))
+    else:
+        due = api.parse_timestamp(item['expiration_time'])
+    # Requests that are already due go in the current bucket, the sweeper
+    # only looks back a few minutes
+    bucket = api.expiry_bucket_for(max(due, datetime.utcnow()))
+    rate_limiter.wait()
+    try:
+        table.update_item(
+            Key={'id': item['id'], 'request_time': item['request_time']},
+            UpdateExpression="set expiry_bucket=:v1",
+            ConditionExpression="request_status = :v2",
+            ExpressionAttributeValues={
+                ':v1': bucket,
+                ':v2': item['request_status']
+            }
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+def backfill_expiry_buckets(args):
+    table = api.get_table(args.table)
+    checkpoint = Checkpoint(args.checkpoint or 'backfill-expiry-buckets-' + args.table + '.json', args.segments)
+    rate_limiter = RateLimiter(args.rate)
+    scan_kwargs = {
+        'FilterExpression': Attr('expiry_bucket').not_exists() & (
+            (Attr('request_status').eq('Requested') & Attr('request_ttl').exists()) |
+            (Attr('request_status').eq('Approved') & Attr('expiration_time').gt(''))
+        ),
+        'ProjectionExpression': 'id, request_time, request_status, request_ttl, expiration_time'
+    }
+    processed = run_segments(table, scan_kwargs, args.segments, checkpoint, lambda item: backfill_expiry_buckets_item(table, item, rate_limiter))
+    print("Added expiry buckets to " + str(processed) + " pending and approved requests")
+
+
+# ********** STATUS SHARDS ************#
+
+def shard_statuses_item(table, item, shards, rate_limiter):
+    if shards:
+        status_shard = api.status_shard_for(item['id'], item['request_status'], shards)
+        if item.get('status_shard') == status_shard:
+            return
+        update_expression = "set status_shard=:v1"
+        values = {':v1': status_shard, ':v2': item['request_status']}
+    else:
+        update_expression = "REMOVE status_shard"
+        values = {':v2': item['request_status']}
+    rate_limiter.wait()
+    try:
+        table.update_item(
+            Key={'id': item['id'], 'request_time': item['request_time']},
+            UpdateExpression=update_expression,
+            ConditionExpression="request_status = :v2",
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+def shard_statuses(args):
+    table = api.get_table(args.table)
+    checkpoint = Checkpoint(args.checkpoint or 'shard-statuses-' + str(args.shards) + '-' + args.table + '.json', args.segments)
+    rate_limiter = RateLimiter(args.rate)
+    scan_kwargs = {
+        'ProjectionExpression': 'id, request_time, request_status, status_shard'
+    }
+    if not args.shards:
+        scan_kwargs['FilterExpression'] = Attr('status_shard').exists()
+    processed = run_segments(table, scan_kwargs, args.segments, checkpoint, lambda item: shard_statuses_item(table, item, args.shards, rate_limiter))
+    print("Checked the status shard of " + str(processed) + " requests")
+
+
+def dispatch_command():
+    """
+    Dispatches the maintenance job based on command line parameters.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--table", default=os.environ.get('db_table', 'request'), help="Name of the request table")
+    parser.add_argument("--segments", type=int, default=8, help="Number of parallel scan segments")
+    parser.add_argument("--checkpoint", help="Checkpoint file used to resume an interrupted run")
+    subparsers = parser.add_subparsers(dest="job", required=True)
+    subparsers.add_parser("migrate-timestamps", help="Rewrite legacy '%%x %%X' timestamps as ISO-8601 UTC").set_defaults(func=migrate_timestamps)
+    subparsers.add_parser("backfill-grants", help="Add grant keys to active approved requests").set_defaults(func=backfill_grants)
+    backfill_ttl_parser = subparsers.add_parser("backfill-ttl", help="Add request_ttl to pending requests that have none")
+    backfill_ttl_parser.add_argument("--rate", type=float, default=4, help="Maximum updates per second across all segments")
+    backfill_ttl_parser.set_defaults(func=backfill_ttl)
+    backfill_expiry_parser = subparsers.add_parser("backfill-expiry-buckets", help="Add expiry buckets to pending and approved requests")
+    backfill_expiry_parser.add_argument("--rate", type=float, default=4, help="Maximum updates per second across all segments")
+    backfill_expiry_parser.set_defaults(func=backfill_expiry_buckets)
+    shard_statuses_parser = subparsers.add_parser("shard-statuses", help="Rewrite status_shard for a new StatusShards value")
+    shard_statuses_parser.add_argument("--shards", type=int, required=True, help="The StatusShards value the stack is deployed with, 0 to remove the shards")
+    shard_statuses_parser.add_argument("--rate", type=float, default=4, help="Maximum updates per second across all segments")
+    shard_statuses_parser.set_defaults(func=shard_statuses)
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    dispatch_command()
@@ -62,6 +62,15 @@ export default class ApiHandler {
       return Promise.reject<T>();
     }
   }
+
+  public async get_authorized_page<T>(resource_name: string, token: string, limit: number, next_token?: string, url_params?:KeyValue<string,string>[]) : Promise<Page<T>> {
+    let page_params: KeyValue<string,string>[] = url_params ? [...url_params] : [];
+    page_params.push({key: "limit", value: limit.toString()});
+    if (next_token) {
+      page_params.push({key: "next_token", value: encodeURIComponent(next_token)});
+    }
+    return this.get_authorized_resource<Page<T>>(resource_name, token, ApiMethod.GET, null, page_params);
+  }
 }
 
 export enum ApiMethod  {
@@ -76,3 +85,8 @@ export type KeyValue<T, U> = {
   value: U,
 };
 
+export type Page<T> = {
+  items: T[],
+  next_token?: string,
+};
+
@@ -1,11 +1,13 @@
 import React, { FunctionComponent } from 'react';
 import Stack from 'aws-northstar/layouts/Stack';
 import AuditTable from "./AuditTable";
+import StatisticsTable from "./StatisticsTable";
 
 const AuditDashboard: FunctionComponent = () => {
   return <Stack>
+    <StatisticsTable/>
     <AuditTable/>
   </Stack>
 }
 
-export default AuditDashboard;
\ No newline at end of file
+export default AuditDashboard;
@@ -1,10 +1,16 @@
 import React, {FunctionComponent, useEffect, useState} from 'react';
+import Button from 'aws-northstar/components/Button';
+import Inline from 'aws-northstar/layouts/Inline';
 import StatusIndicator from 'aws-northstar/components/StatusIndicator';
 import Table, {Column} from 'aws-northstar/components/Table';
-import {getAllRequests} from "../../data";
-import {IRequest, ReduxRoot} from "../../interfaces";
+import {createExport, getAllRequestsPage, getExport, getRequestChanges} from "../../data";
+import {IExport, IRequest, ReduxRoot} from "../../interfaces";
 import Flashbar, {FlashbarMessage} from "aws-northstar/components/Flashbar";
-import {useSelector} from "react-redux";
+import {useDispatch, useSelector} from "react-redux";
+import {mergeRequestChangesAction, storeRequestsAction} from "../../redux/actions";
+
+const VIEW = 'all';
+const EXPORT_POLL_MS = 3000;
 
 const AuditTable: FunctionComponent = () => {
 
@@ -89,42 +95,102 @@ const AuditTable: FunctionComponent = () => {
     }
   ];
 
-  const [requests, setRequests] = useState<IRequest[]>([]);
+  const view = useSelector( (state:ReduxRoot) => {
+    return state.breakGlassReducerState.requestViews[VIEW]
+  });
+  const requests = view ? view.items : [];
+  const dispatch = useDispatch();
   const [selectedItems, setSelectedItems] = useState<object[]>([]);
   const [loading, setLoading] = useState(false);
   const [errors, setErrors] = React.useState<FlashbarMessage[]>([]);
 
-  useEffect( () => {
-    const getAuditRequests = async () => {
-      try {
-        setLoading(true);
+  const loadPage = async (previous: IRequest[], next_token?: string, cursor?: string) => {
+    try {
+      setLoading(true);
 
-        let requests = await getAllRequests(userInfo.token).then(
-            (result: IRequest[]) => {
-              return result;
-            });
+      let page = await getAllRequestsPage(userInfo.token, next_token);
 
-        setRequests(requests);
+      dispatch(storeRequestsAction(VIEW, previous.concat(page.items), cursor, page.next_token));
 
-        await Promise.resolve();
+      setLoading(false);
+    }
+    catch (err) {
+      console.log(err.toString());
+      const items:FlashbarMessage[] = [
+        {
+          header: 'Could not get the audit requests: ' + err.toString(),
+          type: 'error',
+          dismissible: true,
+        }
+      ];
+      setErrors(items);
+    }
+  }
 
-        setLoading(false);
+  const refresh = async () => {
+    try {
+      let changes = await getRequestChanges(userInfo.token, VIEW, view && view.cursor);
+      if (changes.reset) {
+        // The cursor is taken before the full load, so the next refresh
+        // returns the changes made while it runs
+        await loadPage([], undefined, changes.cursor);
       }
-      catch (err) {
-        console.log(err.toString());
-        const items:FlashbarMessage[] = [
-          {
-            header: 'Could not get the audit requests: ' + err.toString(),
-            type: 'error',
-            dismissible: true,
-          }
-        ];
-        setErrors(items);
+      else {
+        dispatch(mergeRequestChangesAction(VIEW, changes));
       }
     }
-    getAuditRequests().then(() => console.log("getAllRequests() completed."));
+    catch (err) {
+      console.log(err.toString());
+      const items:FlashbarMessage[] = [
+        {
+          header: 'Could not refresh the audit requests: ' + err.toString(),
+          type: 'error',
+          dismissible: true,
+        }
+      ];
+      setErrors(items);
+    }
+  }
+
+  useEffect( () => {
+    refresh().then(() => console.log("getAllRequests() completed."));
   }, [userInfo]);
 
+  const [exporting, setExporting] = useState(false);
+
+  const exportRequests = async (export_format: string) => {
+    try {
+      setExporting(true);
+      let job: IExport = await createExport(userInfo.token, export_format);
+      while (job.export_status === 'Running') {
+        await new Promise(resolve => setTimeout(resolve, EXPORT_POLL_MS));
+        job = await getExport(userInfo.token, job.export_id);
+      }
+      if (job.export_status === 'Complete' && job.url) {
+        window.location.assign(job.url);
+      }
+      else {
+        throw new Error(job.error || job.export_status);
+      }
+    }
+    catch (err) {
+      console.log(err.toString());
+      const items:FlashbarMessage[] = [
+        {
+          header: 'Could not export the audit requests: ' + err.toString(),
+          type: 'error',
+          dismissible: true,
+        }
+      ];
+      setErrors(items);
+    }
+    setExporting(false);
+  }
+
+  const onLoadMoreClick = async () => {
+    await loadPage(requests, view && view.next_token, view && view.cursor);
+  }
+
   const handleSelectionChange = (items: object[]) => {
     if (!(selectedItems.length === 0 && items.length === 0)) {
       setSelectedItems(items);
@@ -137,6 +203,12 @@ const AuditTable: FunctionComponent = () => {
       columnDefinitions={columnDefinitions}
       loading={loading}
       items={requests}
+      actionGroup={<Inline>
+        <Button onClick={refresh}>Refresh</Button>
+        <Button disabled={!(view && view.next_token)} onClick={onLoadMoreClick}>Load more</Button>
+        <Button disabled={exporting} onClick={() => exportRequests('csv')}>Export CSV</Button>
+        <Button disabled={exporting} onClick={() => exportRequests('jsonl')}>Export JSON Lines</Button>
+      </Inline>}
       multiSelect={false}
   />
     <Flashbar items={errors} />
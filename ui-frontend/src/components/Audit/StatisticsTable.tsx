@@ -0,0 +1,79 @@
+import React, {FunctionComponent, useEffect, useState} from 'react';
+import Button from 'aws-northstar/components/Button';
+import Table, {Column} from 'aws-northstar/components/Table';
+import {getStatistics} from "../../data";
+import {IStatisticsDay, ReduxRoot} from "../../interfaces";
+import Flashbar, {FlashbarMessage} from "aws-northstar/components/Flashbar";
+import {useSelector} from "react-redux";
+
+const STATISTICS_DAYS = 30;
+const STATUSES = ['Requested', 'Approved', 'Rejected', 'Expired', 'Ended'];
+
+const statisticsDay = (offset: number) => {
+  return new Date(Date.now() - offset * 24 * 3600 * 1000).toISOString().slice(0, 10);
+}
+
+const StatisticsTable: FunctionComponent = () => {
+
+  const userInfo = useSelector( (state:ReduxRoot) => {
+    return state.breakGlassReducerState.userInfo
+  });
+
+  const columnDefinitions: Column<IStatisticsDay>[] = [
+    {
+      id: 'day',
+      width: 150,
+      Header: 'Day',
+      accessor: 'day'
+    },
+    ...STATUSES.map(status => ({
+      id: status,
+      width: 100,
+      Header: status,
+      accessor: (day: IStatisticsDay) => day.status[status] || 0
+    }))
+  ];
+
+  const [days, setDays] = useState<IStatisticsDay[]>([]);
+  const [loading, setLoading] = useState(false);
+  const [errors, setErrors] = React.useState<FlashbarMessage[]>([]);
+
+  const refresh = async () => {
+    try {
+      setLoading(true);
+      let statistics = await getStatistics(userInfo.token, statisticsDay(STATISTICS_DAYS - 1), statisticsDay(0));
+      setDays(statistics.days.slice().reverse());
+    }
+    catch (err) {
+      console.log(err.toString());
+      const items:FlashbarMessage[] = [
+        {
+          header: 'Could not get the request statistics: ' + err.toString(),
+          type: 'error',
+          dismissible: true,
+        }
+      ];
+      setErrors(items);
+    }
+    finally {
+      setLoading(false);
+    }
+  }
+
+  useEffect( () => {
+    refresh().then(() => console.log("getStatistics() completed."));
+  }, [userInfo]);
+
+  return <div><Table
+      tableTitle={'Requests per day'}
+      columnDefinitions={columnDefinitions}
+      loading={loading}
+      items={days}
+      actionGroup={<Button onClick={refresh}>Refresh</Button>}
+      disableRowSelect={true}
+  />
+    <Flashbar items={errors} />
+  </div>
+}
+
+export default StatisticsTable;
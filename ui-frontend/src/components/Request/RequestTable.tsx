@@ -4,7 +4,7 @@ import Button from 'aws-northstar/components/Button';
 import Inline from 'aws-northstar/layouts/Inline';
 import StatusIndicator from 'aws-northstar/components/StatusIndicator';
 import Table, { Column } from 'aws-northstar/components/Table';
-import {deleteRequest, getRequests, invokeFederateConsole, invokeFederateCli} from "../../data";
+import {deleteRequest, getRequestsPage, getRequestChanges, invokeFederateConsole, invokeFederateCli} from "../../data";
 import {ICredential, IRequest, ReduxRoot} from "../../interfaces";
 import '../home/styles.css';
 
@@ -14,7 +14,10 @@ import {
   Stack,
 } from "aws-northstar";
 import Flashbar, {FlashbarMessage} from "aws-northstar/components/Flashbar";
-import {useSelector} from "react-redux";
+import {useDispatch, useSelector} from "react-redux";
+import {mergeRequestChangesAction, storeRequestsAction} from "../../redux/actions";
+
+const VIEW = 'requests';
 
 const RequestTable: FunctionComponent = () => {
 
@@ -109,7 +112,11 @@ const RequestTable: FunctionComponent = () => {
     }
   ];
 
-  const [requests, setRequests] = useState<IRequest[]>([]);
+  const view = useSelector( (state:ReduxRoot) => {
+    return state.breakGlassReducerState.requestViews[VIEW]
+  });
+  const requests = view ? view.items : [];
+  const dispatch = useDispatch();
   const [selectedItems, setSelectedItems] = useState<IRequest[]>([]);
   const history = useHistory();
   const [loading, setLoading] = useState(false);
@@ -278,38 +285,63 @@ const RequestTable: FunctionComponent = () => {
     }
   }
 
-  useEffect( () => {
-    const getAllRequests = async () => {
+  const loadPage = async (previous: IRequest[], next_token?: string, cursor?: string) => {
 
-      try {
+    try {
 
-        setLoading(true);
+      setLoading(true);
 
-        let requests = await getRequests(userInfo.token).then(
-            (result: IRequest[]) => {
-              return result;
-            });
+      let page = await getRequestsPage(userInfo.token, next_token);
 
-        setRequests(requests);
+      dispatch(storeRequestsAction(VIEW, previous.concat(page.items), cursor, page.next_token));
 
-        await Promise.resolve();
+      setLoading(false);
+    }
+    catch (err) {
+      const items:FlashbarMessage[] = [
+        {
+          header: 'Could not get the requests: ' + err.toString(),
+          type: 'error',
+          dismissible: true,
+        }
+      ];
+      setErrors(items);
+    }
+  }
 
-        setLoading(false);
+  const refresh = async () => {
+    try {
+      let changes = await getRequestChanges(userInfo.token, VIEW, view && view.cursor);
+      if (changes.reset) {
+        // The cursor is taken before the full load, so the next refresh
+        // returns the changes made while it runs
+        await loadPage([], undefined, changes.cursor);
       }
-      catch (err) {
-        const items:FlashbarMessage[] = [
-          {
-            header: 'Could not get the requests: ' + err.toString(),
-            type: 'error',
-            dismissible: true,
-          }
-        ];
-        setErrors(items);
+      else {
+        dispatch(mergeRequestChangesAction(VIEW, changes));
       }
     }
-    getAllRequests().then(() => console.log("getAllRequests() completed."));
+    catch (err) {
+      console.log(err.toString());
+      const items:FlashbarMessage[] = [
+        {
+          header: 'Could not refresh the requests: ' + err.toString(),
+          type: 'error',
+          dismissible: true,
+        }
+      ];
+      setErrors(items);
+    }
+  }
+
+  useEffect( () => {
+    refresh().then(() => console.log("getAllRequests() completed."));
   }, [userInfo]);
 
+  const onLoadMoreClick = async () => {
+    await loadPage(requests, view && view.next_token, view && view.cursor);
+  }
+
   const onCreateClick = () => {
     history.push('/Create-request');
   }
@@ -323,7 +355,7 @@ const RequestTable: FunctionComponent = () => {
           });
 
       let selected_requests = remove_request(requests, selectedItem)
-      setRequests(selected_requests)
+      dispatch(storeRequestsAction(VIEW, selected_requests, view && view.cursor, view && view.next_token))
       history.push('/Request-dashboard');
     }
     catch (err) {
@@ -352,6 +384,12 @@ const RequestTable: FunctionComponent = () => {
         <Button disabled={!(selectedItems.length === 1 && (selectedItems[0].request_status === 'Requested' || selectedItems[0].request_status === 'Expired'))} onClick={onDeleteClick}>
           Delete request
         </Button>
+        <Button onClick={refresh}>
+          Refresh
+        </Button>
+        <Button disabled={!(view && view.next_token)} onClick={onLoadMoreClick}>
+          Load more
+        </Button>
       </Inline>
   );
 
@@ -4,9 +4,12 @@ import Inline from 'aws-northstar/layouts/Inline';
 import StatusIndicator from 'aws-northstar/components/StatusIndicator';
 import Table, {Column} from 'aws-northstar/components/Table';
 import {IRequest, ReduxRoot} from "../../interfaces";
-import {approveRequest, getPendingRequests, rejectRequest} from "../../data";
+import {getPendingRequestsPage, getRequestChanges, reviewRequests} from "../../data";
 import Flashbar, {FlashbarMessage} from "aws-northstar/components/Flashbar";
-import {useSelector} from "react-redux";
+import {useDispatch, useSelector} from "react-redux";
+import {mergeRequestChangesAction, storeRequestsAction} from "../../redux/actions";
+
+const VIEW = 'pending';
 
 const columnDefinitions: Column<IRequest>[]  = [
   {
@@ -86,72 +89,58 @@ const PendingTable: FunctionComponent = () => {
     return state.breakGlassReducerState.userInfo
   });
 
-  const [requests, setRequests] = useState<IRequest[]>([]);
+  const view = useSelector( (state:ReduxRoot) => {
+    return state.breakGlassReducerState.requestViews[VIEW]
+  });
+  const requests = view ? view.items : [];
+  const dispatch = useDispatch();
   const [selectedItems, setSelectedItems] = useState<object[]>([]);
   const [loading, setLoading] = useState(false);
   const [errors, setErrors] = React.useState<FlashbarMessage[]>([]);
 
-  useEffect( () => {
-    const getAllRequests = async () => {
-      try {
-
-        setLoading(true);
-
-        let requests = await getPendingRequests(userInfo.token).then(
-            (result: IRequest[]) => {
-              return result;
-            });
+  const loadPage = async (previous: IRequest[], next_token?: string, cursor?: string) => {
+    try {
 
-        let pending_requests = update_requests(requests);
-        setRequests(pending_requests)
+      setLoading(true);
 
-        await Promise.resolve();
+      let page = await getPendingRequestsPage(userInfo.token, next_token);
 
-        setLoading(false);
-      }
-      catch (err) {
-        console.log(err.toString());
-        const items:FlashbarMessage[] = [
-          {
-            header: 'Could not get the pending requests: ' + err.toString(),
-            type: 'error',
-            dismissible: true,
-          }
-        ];
-        setErrors(items);
-      }
+      let pending_requests = update_requests(page.items);
+      dispatch(storeRequestsAction(VIEW, previous.concat(pending_requests), cursor, page.next_token));
     }
-    getAllRequests().then(() => console.log("getPendingRequests() completed."));
-  }, [userInfo]);
-
-  const handleSelectionChange = (items: object[]) => {
-    if (!(selectedItems.length === 0 && items.length === 0)) {
-      setSelectedItems(items);
+    catch (err) {
+      console.log(err.toString());
+      const items:FlashbarMessage[] = [
+        {
+          header: 'Could not get the pending requests: ' + err.toString(),
+          type: 'error',
+          dismissible: true,
+        }
+      ];
+      setErrors(items);
     }
-  };
+    finally {
+      setLoading(false);
+    }
+  }
 
-  const onApproveClick = async () => {
-    let selectedItem:IRequest = selectedItems[0];
+  const refresh = async () => {
     try {
-      await approveRequest(userInfo.token, selectedItem.id, selectedItem.request_time, selectedItem.request_duration, userInfo.user).then(
-          (result: any) => {
-            return result;
-          });
-
-      let requests = await getPendingRequests(userInfo.token).then(
-          (result: IRequest[]) => {
-            return result;
-          });
-
-      let pending_requests = update_requests(requests);
-      setRequests(pending_requests)
-
+      let changes = await getRequestChanges(userInfo.token, VIEW, view && view.cursor);
+      if (changes.reset) {
+        // The cursor is taken before the full load, so the next refresh
+        // returns the changes made while it runs
+        await loadPage([], undefined, changes.cursor);
+      }
+      else {
+        dispatch(mergeRequestChangesAction(VIEW, changes));
+      }
     }
     catch (err) {
       console.log(err.toString());
       const items:FlashbarMessage[] = [
         {
-          header: 'Could not approve the request: ' + err.toString(),
+          header: 'Could not refresh the pending requests: ' + err.toString(),
           type: 'error',
           dismissible: true,
         }
@@ -160,28 +149,44 @@ const PendingTable: FunctionComponent = () => {
     }
   }
 
-  const onRejectClick = async () => {
-    let selectedItem:IRequest = selectedItems[0];
-    try {
-      await rejectRequest(userInfo.token, selectedItem.id, selectedItem.request_time, userInfo.user).then(
-          (result: any) => {
-            return result;
-          });
+  useEffect( () => {
+    refresh().then(() => console.log("getPendingRequests() completed."));
+  }, [userInfo]);
+
+  const onLoadMoreClick = async () => {
+    await loadPage(requests, view && view.next_token, view && view.cursor);
+  }
+
+  const handleSelectionChange = (items: object[]) => {
+    if (!(selectedItems.length === 0 && items.length === 0)) {
+      setSelectedItems(items);
+    }
+  };
 
-      let requests = await getPendingRequests(userInfo.token).then(
-          (result: IRequest[]) => {
-            return result;
-          });
+  const review = async (decision: string) => {
+    let selected = selectedItems as IRequest[];
+    try {
+      let report = await reviewRequests(userInfo.token, selected.map(item => (
+          {id: item.id, request_time: item.request_time, decision: decision, request_duration: item.request_duration})));
 
-      let pending_requests = update_requests(requests);
-      setRequests(pending_requests)
+      let reviewed = new Set(report.results.filter(result => result.success).map(result => result.id));
+      dispatch(storeRequestsAction(VIEW, requests.filter(request => !reviewed.has(request.id)), view && view.cursor, view && view.next_token));
+      const items:FlashbarMessage[] = report.results.filter(result => !result.success).map(result => (
+        {
+          header: 'Could not ' + decision + ' the request ' + result.id + ': ' + result.error,
+          type: 'error',
+          dismissible: true,
+        }
+      ));
+      setErrors(items);
+      await refresh();
 
     }
     catch (err) {
       console.log(err.toString());
       const items:FlashbarMessage[] = [
         {
-          header: 'Could not reject the request: ' + err.toString(),
+          header: 'Could not ' + decision + ' the requests: ' + err.toString(),
           type: 'error',
           dismissible: true,
         }
@@ -190,14 +195,28 @@ const PendingTable: FunctionComponent = () => {
     }
   }
 
+  const onApproveClick = async () => {
+    await review('approve');
+  }
+
+  const onRejectClick = async () => {
+    await review('reject');
+  }
+
   const tableActions = (
       <Inline>
-        <Button disabled={selectedItems.length !== 1} variant="primary" onClick={onApproveClick}>
+        <Button disabled={selectedItems.length === 0} variant="primary" onClick={onApproveClick}>
           Approve
         </Button>
-        <Button disabled={selectedItems.length !== 1} variant="primary" onClick={onRejectClick}>
+        <Button disabled={selectedItems.length === 0} variant="primary" onClick={onRejectClick}>
           Reject
         </Button>
+        <Button onClick={refresh}>
+          Refresh
+        </Button>
+        <Button disabled={!(view && view.next_token)} onClick={onLoadMoreClick}>
+          Load more
+        </Button>
       </Inline>
   );
 
@@ -218,7 +237,7 @@ const PendingTable: FunctionComponent = () => {
       items={requests}
       loading={loading}
       actionGroup={tableActions}
-      multiSelect={false}
+      multiSelect={true}
   />
   <Flashbar items={errors} />
   </div>
@@ -1,12 +1,17 @@
 import React, {FunctionComponent, useEffect, useState} from 'react';
+import Button from 'aws-northstar/components/Button';
+import Inline from 'aws-northstar/layouts/Inline';
 import StatusIndicator from 'aws-northstar/components/StatusIndicator';
 import Table, {Column} from 'aws-northstar/components/Table';
 import {IRequest, ReduxRoot} from "../../interfaces";
 import {
-  getProcessedRequests,
+  getProcessedRequestsPage, getRequestChanges,
 } from "../../data";
 import Flashbar, {FlashbarMessage} from "aws-northstar/components/Flashbar";
-import {useSelector} from "react-redux";
+import {useDispatch, useSelector} from "react-redux";
+import {mergeRequestChangesAction, storeRequestsAction} from "../../redux/actions";
+
+const VIEW = 'processed';
 
 const columnDefinitions: Column<IRequest>[] = [
   {
@@ -91,43 +96,71 @@ const ReviewedTable: FunctionComponent = () => {
     return state.breakGlassReducerState.userInfo
   });
 
-  const [requests, setRequests] = useState<IRequest[]>([]);
+  const view = useSelector( (state:ReduxRoot) => {
+    return state.breakGlassReducerState.requestViews[VIEW]
+  });
+  const requests = view ? view.items : [];
+  const dispatch = useDispatch();
   const [selectedItems, setSelectedItems] = useState<object[]>([]);
   const [loading, setLoading] = useState(false);
   const [errors, setErrors] = React.useState<FlashbarMessage[]>([]);
 
-  useEffect( () => {
-    const getAllRequests = async () => {
-      try {
+  const loadPage = async (previous: IRequest[], next_token?: string, cursor?: string) => {
+    try {
+      setLoading(true);
 
-        setLoading(true);
+      let page = await getProcessedRequestsPage(userInfo.token, next_token);
 
-        let requests = await getProcessedRequests(userInfo.token).then(
-            (result: IRequest[]) => {
-              return result;
-            });
+      dispatch(storeRequestsAction(VIEW, previous.concat(page.items), cursor, page.next_token));
 
-        setRequests(requests)
+      setLoading(false);
+    }
+    catch (err) {
+      console.log(err.toString());
+      const items:FlashbarMessage[] = [
+        {
+          header: 'Could not get the reviewed requests: ' + err.toString(),
+          type: 'error',
+          dismissible: true,
+        }
+      ];
+      setErrors(items);
+    }
+  }
 
-        await Promise.resolve();
-        // }
-        setLoading(false);
+  const refresh = async () => {
+    try {
+      let changes = await getRequestChanges(userInfo.token, VIEW, view && view.cursor);
+      if (changes.reset) {
+        // The cursor is taken before the full load, so the next refresh
+        // returns the changes made while it runs
+        await loadPage([], undefined, changes.cursor);
       }
-      catch (err) {
-        console.log(err.toString());
-        const items:FlashbarMessage[] = [
-          {
-            header: 'Could not get the reviewed requests: ' + err.toString(),
-            type: 'error',
-            dismissible: true,
-          }
-        ];
-        setErrors(items);
+      else {
+        dispatch(mergeRequestChangesAction(VIEW, changes));
       }
     }
-    getAllRequests().then(() => console.log("getProcessedRequests() completed."));
+    catch (err) {
+      console.log(err.toString());
+      const items:FlashbarMessage[] = [
+        {
+          header: 'Could not refresh the reviewed requests: ' + err.toString(),
+          type: 'error',
+          dismissible: true,
+        }
+      ];
+      setErrors(items);
+    }
+  }
+
+  useEffect( () => {
+    refresh().then(() => console.log("getProcessedRequests() completed."));
   }, [userInfo]);
 
+  const onLoadMoreClick = async () => {
+    await loadPage(requests, view && view.next_token, view && view.cursor);
+  }
+
   const handleSelectionChange = (items: object[]) => {
     if (!(selectedItems.length === 0 && items.length === 0)) {
       setSelectedItems(items);
@@ -140,7 +173,10 @@ const ReviewedTable: FunctionComponent = () => {
       columnDefinitions={columnDefinitions}
       items={requests}
       loading={loading}
-      // actionGroup={tableActions}
+      actionGroup={<Inline>
+        <Button onClick={refresh}>Refresh</Button>
+        <Button disabled={!(view && view.next_token)} onClick={onLoadMoreClick}>Load more</Button>
+      </Inline>}
       multiSelect={false}
   />
     <Flashbar items={errors} />
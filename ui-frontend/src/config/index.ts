@@ -2,5 +2,5 @@
 export const BG_ENDPOINTS = {
     ApiKey: '<ApiKey>', // NOTE: Replace with your API Gateway key value
     Endpoint: 'https://<CloudFrontURL>/<APIStage>', // NOTE: Replace with the URL of your CloudFront distribution and API stage
-    Resources : ['get_requests', 'get_pending_requests', 'get_processed_requests', 'get_all_requests', 'create_request', 'delete_request', 'approve_request', 'reject_request', 'federate_console', 'federate_cli']
+    Resources : ['get_requests', 'get_pending_requests', 'get_processed_requests', 'get_all_requests', 'create_request', 'create_requests', 'delete_request', 'approve_request', 'reject_request', 'review_requests', 'federate_console', 'federate_cli', 'get_changes', 'create_export', 'get_export', 'get_statistics']
 };
\ No newline at end of file
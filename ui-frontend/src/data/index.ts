@@ -1,5 +1,5 @@
 import ApiHandler, {ApiMethod} from '../common/api'
-import {IRequest, ICredential} from '../interfaces/index'
+import {IExport, IRequest, ICredential, IRequestChanges, IRequestGroup, IReview, IReviewReport, IStatistics, ITarget} from '../interfaces/index'
 import {BG_ENDPOINTS} from '../config/index'
 
 export const api = new ApiHandler(
@@ -8,6 +8,8 @@ export const api = new ApiHandler(
     BG_ENDPOINTS.Resources
 );
 
+export const PAGE_SIZE = 100;
+
 export const getRequests = (token: string, user_params?:any) => api.get_authorized_resource<IRequest[]>(
     "get_requests", token, ApiMethod.GET,null,[])
 
@@ -20,9 +22,36 @@ export const getProcessedRequests = (token: string, user_params?:any) => api.get
 export const getAllRequests = (token: string, user_params?:any) => api.get_authorized_resource<IRequest[]>(
     "get_all_requests", token, ApiMethod.GET,null,[])
 
+export const getRequestsPage = (token: string, next_token?: string) => api.get_authorized_page<IRequest>(
+    "get_requests", token, PAGE_SIZE, next_token)
+
+export const getPendingRequestsPage = (token: string, next_token?: string) => api.get_authorized_page<IRequest>(
+    "get_pending_requests", token, PAGE_SIZE, next_token)
+
+export const getProcessedRequestsPage = (token: string, next_token?: string) => api.get_authorized_page<IRequest>(
+    "get_processed_requests", token, PAGE_SIZE, next_token)
+
+export const getAllRequestsPage = (token: string, next_token?: string) => api.get_authorized_page<IRequest>(
+    "get_all_requests", token, PAGE_SIZE, next_token)
+
+export const getRequestChanges = (token: string, view: string, cursor?: string) => api.get_authorized_resource<IRequestChanges>(
+    "get_changes", token, ApiMethod.GET, null, cursor ? [{key: "view", value: view}, {key: "cursor", value: encodeURIComponent(cursor)}] : [{key: "view", value: view}])
+
+export const createExport = (token: string, export_format: string) => api.get_authorized_resource<IExport>(
+    "create_export", token, ApiMethod.POST, {export_format: export_format}, [])
+
+export const getExport = (token: string, export_id: string) => api.get_authorized_resource<IExport>(
+    "get_export", token, ApiMethod.GET, null, [{key: "export_id", value: export_id}])
+
+export const getStatistics = (token: string, from: string, to: string) => api.get_authorized_resource<IStatistics>(
+    "get_statistics", token, ApiMethod.GET, null, [{key: "from", value: from}, {key: "to", value: to}])
+
 export const createRequest = (token: string, request_account:any, request_role:any, request_duration:any, request_justification:any, user_params?:any) => api.get_authorized_resource<any>(
     "create_request", token, ApiMethod.POST, {request_account: request_account, request_role: request_role, request_duration: request_duration, request_justification: request_justification}, [])
 
+export const createRequests = (token: string, targets:ITarget[], request_duration:any, request_justification:any, user_params?:any) => api.get_authorized_resource<IRequestGroup>(
+    "create_requests", token, ApiMethod.POST, {targets: targets, request_duration: request_duration, request_justification: request_justification}, [])
+
 export const deleteRequest = (token: string, id:any, request_time:any, user_params?:any) => api.get_authorized_resource<any>(
     "delete_request", token, ApiMethod.POST, {id: id, request_time: request_time}, [])
 
@@ -32,6 +61,9 @@ export const approveRequest = (token: string, id:any, request_time:any, request_
 export const rejectRequest = (token: string, id:any, request_time:any, reviewer:any, user_params?:any) => api.get_authorized_resource<any>(
     "reject_request", token, ApiMethod.POST, {id: id, request_time: request_time, reviewer: reviewer}, [])
 
+export const reviewRequests = (token: string, reviews: IReview[], user_params?:any) => api.get_authorized_resource<IReviewReport>(
+    "review_requests", token, ApiMethod.POST, {reviews: reviews}, [])
+
 export const updateRequestURL = (token: string, id:any, request_time:any, request_url:any, user_params?:any) => api.get_authorized_resource<any>(
     "update_request_url", token, ApiMethod.POST, {id: id, request_time: request_time, request_url: request_url}, [])
 
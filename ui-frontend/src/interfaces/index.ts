@@ -26,6 +26,77 @@ export interface IError {
   Message?: string;
 }
 
+export interface IRequestChanges {
+  items: IRequest[];
+  removed: string[];
+  cursor: string;
+  reset: boolean;
+}
+
+export interface ITarget {
+  request_account: string;
+  request_role: string;
+}
+
+export interface IRequestGroup {
+  group_id: string;
+  ids: string[];
+}
+
+export interface IReview {
+  id?: string;
+  request_time?: string;
+  decision: string;
+  request_duration?: string;
+}
+
+export interface IReviewResult {
+  id: string;
+  request_time: string;
+  decision: string;
+  success: boolean;
+  error?: string;
+}
+
+export interface IReviewReport {
+  results: IReviewResult[];
+  succeeded: number;
+  failed: number;
+}
+
+export interface IExport {
+  export_id: string;
+  export_format: string;
+  export_status: string;
+  request_time: string;
+  export_rows?: number;
+  url?: string;
+  error?: string;
+}
+
+export interface IStatisticsDay {
+  day: string;
+  status: {[status: string]: number};
+}
+
+export interface IStatistics {
+  from: string;
+  to: string;
+  days: IStatisticsDay[];
+  totals: {
+    status: {[status: string]: number};
+    account: {[account: string]: {[status: string]: number}};
+    role: {[role: string]: {[status: string]: number}};
+    reviewer: {[reviewer: string]: {[status: string]: number}};
+  };
+}
+
+export interface IRequestView {
+  items: IRequest[];
+  cursor?: string;
+  next_token?: string;
+}
+
 export interface IUserInfo {
   token: string;
   user: string;
@@ -39,6 +110,7 @@ export interface IUserInfo {
 
 export interface ReduxState {
   userInfo: IUserInfo;
+  requestViews: Record<string, IRequestView>;
 }
 
 export interface ReduxRoot {
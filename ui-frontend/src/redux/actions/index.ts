@@ -1,11 +1,21 @@
 import {
+    IRequest,
+    IRequestChanges,
     IUserInfo
 } from '../../interfaces';
 
 export enum ActionTypes {
 
-    STORE_USER_INFO = "STORE_USER_INFO"
+    STORE_USER_INFO = "STORE_USER_INFO",
+    STORE_REQUESTS = "STORE_REQUESTS",
+    MERGE_REQUEST_CHANGES = "MERGE_REQUEST_CHANGES"
 }
 
 export const storeUserInfoAction = (userInfo:IUserInfo) => (
     { type: ActionTypes.STORE_USER_INFO, userInfo })
+
+export const storeRequestsAction = (view:string, items:IRequest[], cursor?:string, next_token?:string) => (
+    { type: ActionTypes.STORE_REQUESTS, view, items, cursor, next_token })
+
+export const mergeRequestChangesAction = (view:string, changes:IRequestChanges) => (
+    { type: ActionTypes.MERGE_REQUEST_CHANGES, view, changes })
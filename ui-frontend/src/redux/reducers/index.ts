@@ -1,7 +1,7 @@
 import {combineReducers, Reducer} from 'redux';
 import {History} from 'history';
 import {connectRouter} from 'connected-react-router';
-import {ReduxState} from '../../interfaces';
+import {IRequest, IRequestChanges, ReduxState} from '../../interfaces';
 import {ActionTypes} from "../actions";
 
 let initialState: ReduxState = {
@@ -14,7 +14,19 @@ let initialState: ReduxState = {
     auditor: false,
 
     accountMap: new Map([])
-  }
+  },
+  requestViews: {}
+};
+
+// Applies a get_changes delta to the requests of a view: removed and
+// changed requests are dropped, then the changed ones are added back.
+export const mergeRequests = (items: IRequest[], changes: IRequestChanges) => {
+  const removed = new Set(changes.removed);
+  const changed = new Set(changes.items.map(item => item.id));
+  return items
+      .filter(item => !removed.has(item.id || "") && !changed.has(item.id))
+      .concat(changes.items)
+      .sort((a, b) => (b.request_time || "").localeCompare(a.request_time || ""));
 };
 
 export const BreakGlassReducer: Reducer<ReduxState> = (state = initialState, action) => {
@@ -23,7 +35,28 @@ export const BreakGlassReducer: Reducer<ReduxState> = (state = initialState, act
     case ActionTypes.STORE_USER_INFO: {
       return {
         ...state,
-        userInfo: action.userInfo
+        userInfo: action.userInfo,
+        // Loaded requests belong to the user who loaded them
+        requestViews: action.userInfo.user === state.userInfo.user ? state.requestViews : {}
+      };
+    }
+    case ActionTypes.STORE_REQUESTS: {
+      return {
+        ...state,
+        requestViews: {
+          ...state.requestViews,
+          [action.view]: {items: action.items, cursor: action.cursor, next_token: action.next_token}
+        }
+      };
+    }
+    case ActionTypes.MERGE_REQUEST_CHANGES: {
+      const view = state.requestViews[action.view] || {items: []};
+      return {
+        ...state,
+        requestViews: {
+          ...state.requestViews,
+          [action.view]: {...view, items: mergeRequests(view.items, action.changes), cursor: action.changes.cursor}
+        }
       };
     }
 